@@ -0,0 +1,54 @@
+import random
+
+TEMPLATES = [
+    "result = {name}({arg}, timeout={num})",
+    "if {name} is None:",
+    "    raise ValueError(\"missing {name}\")",
+    "for {name} in {arg}:",
+    "    total += {name}.size * {num}",
+    "return {name}",
+    "self.{name} = {arg}",
+    "logger.info(\"{name}: %s\", {arg})",
+    "with open({arg}) as {name}:",
+    "    data = json.load({name})",
+    "{name} = {{\"key\": {arg}, \"count\": {num}}}",
+    "except KeyError as {name}:",
+]
+NAMES = ["user", "session", "config", "item", "row", "payload", "cache", "handle", "token", "request"]
+
+CONTEXT_LINES = 3
+
+
+def _line(rng: random.Random) -> str:
+    return rng.choice(TEMPLATES).format(name=rng.choice(NAMES), arg=rng.choice(NAMES), num=rng.randint(1, 999))
+
+
+def _hunk(rng: random.Random, start: int, changed: int) -> tuple[list[str], int]:
+    removed = rng.randint(0, changed)
+    added = changed - removed or 1
+    old_count = 2 * CONTEXT_LINES + removed
+    new_count = 2 * CONTEXT_LINES + added
+    lines = [f"@@ -{start},{old_count} +{start},{new_count} @@ def handler_{start}():"]
+    lines += [f" {_line(rng)}" for _ in range(CONTEXT_LINES)]
+    lines += [f"-{_line(rng)}" for _ in range(removed)]
+    lines += [f"+{_line(rng)}" for _ in range(added)]
+    lines += [f" {_line(rng)}" for _ in range(CONTEXT_LINES)]
+    return lines, new_count
+
+
+def generate_diff(lines: int, seed: int = 0, lines_per_file: int = 400, changed_per_hunk: int = 12) -> str:
+    """A synthetic multi-file unified diff of about ``lines`` lines, reproducible for a given ``seed``."""
+    rng = random.Random(seed)
+    out: list[str] = []
+    file_index = 0
+    while len(out) < lines:
+        path = f"src/module_{file_index}.py"
+        out += [f"diff --git a/{path} b/{path}", f"--- a/{path}", f"+++ b/{path}"]
+        file_end = min(lines, len(out) + lines_per_file)
+        start = 1
+        while len(out) < file_end:
+            hunk, new_count = _hunk(rng, start, rng.randint(1, changed_per_hunk))
+            out += hunk
+            start += new_count + rng.randint(5, 40)
+        file_index += 1
+    return "\n".join(out)
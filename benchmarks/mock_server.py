@@ -0,0 +1,139 @@
+"""A stand-in OpenAI-compatible chat completions server for benchmarks.
+
+Replies with one review comment per file in the prompt's diff, after a fixed
+latency and at a fixed output rate, so client-side overhead can be measured
+without a real model::
+
+    python -m benchmarks.mock_server --port 8765 --latency 0.2 --tokens-per-second 200
+    CODE_REVIEWER_BASE_URL=http://127.0.0.1:8765/v1 code-reviewer < change.diff
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from code_reviewer.diff import estimate_tokens
+
+FILE_HEADER = re.compile(r"^\+\+\+ b/(\S+)$", re.MULTILINE)
+HUNK_HEADER = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)", re.MULTILINE)
+CHUNK_CHARS = 16
+
+
+def reply_for(prompt: str) -> str:
+    comments = []
+    for match in FILE_HEADER.finditer(prompt):
+        hunk = HUNK_HEADER.search(prompt, match.end())
+        comments.append(
+            {
+                "file": match.group(1),
+                "line": int(hunk.group(1)) if hunk else None,
+                "severity": "warning",
+                "comment": "Benchmark comment: this value may be None when the handler runs.",
+            }
+        )
+    return json.dumps(comments)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def _json(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self) -> None:
+        if not self.path.endswith("/chat/completions"):
+            self._json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        prompt = "\n".join(str(m.get("content", "")) for m in request["messages"])
+        text = reply_for(prompt)
+        usage = {
+            "prompt_tokens": estimate_tokens(prompt),
+            "completion_tokens": estimate_tokens(text),
+            "total_tokens": estimate_tokens(prompt) + estimate_tokens(text),
+        }
+        time.sleep(self.server.latency)
+        if request.get("stream"):
+            self._stream(request["model"], text)
+            return
+        time.sleep(estimate_tokens(text) / self.server.tokens_per_second)
+        self._json(
+            200,
+            {
+                "id": "chatcmpl-bench",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request["model"],
+                "choices": [
+                    {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+                ],
+                "usage": usage,
+            },
+        )
+
+    def _stream(self, model: str, text: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        delay = CHUNK_CHARS / 4 / self.server.tokens_per_second
+        for i in range(0, len(text), CHUNK_CHARS):
+            chunk = {
+                "id": "chatcmpl-bench",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": text[i:i + CHUNK_CHARS]}, "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            time.sleep(delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], latency: float, tokens_per_second: float):
+        super().__init__(address, MockHandler)
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="0 picks a free port.")
+    parser.add_argument("--latency", type=float, default=0.1, help="Seconds before the first token.")
+    parser.add_argument("--tokens-per-second", type=float, default=500.0, help="Output generation rate.")
+    args = parser.parse_args(argv)
+
+    server = MockServer((args.host, args.port), args.latency, args.tokens_per_second)
+    # The first line tells a parent process where to connect.
+    print(server.base_url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
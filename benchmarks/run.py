@@ -0,0 +1,155 @@
+"""End-to-end benchmarks of the ``code-reviewer`` CLI against the mock server.
+
+Each scenario pipes a synthetic diff through ``cli.main`` with the ``local``
+provider pointed at ``benchmarks.mock_server``, and reports latency, throughput
+and peak Python memory::
+
+    python -m benchmarks.run
+    python -m benchmarks.run --sizes 10 1000 --runs 5 --json after.json --compare before.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+
+from benchmarks.diffgen import generate_diff
+from code_reviewer.cli import main as cli_main
+
+SIZES = [10, 100, 1_000, 10_000, 100_000]
+SCENARIOS = {
+    "review": [],
+    "json": ["--json"],
+    "stream": ["--ndjson"],
+}
+
+
+@dataclass
+class Result:
+    scenario: str
+    lines: int
+    runs: int
+    p50: float
+    p95: float
+    lines_per_second: float
+    peak_mb: float
+
+
+def percentile(values: list[float], q: float) -> float:
+    ranked = sorted(values)
+    return ranked[max(0, math.ceil(q / 100 * len(ranked)) - 1)]
+
+
+@contextlib.contextmanager
+def mock_server(latency: float, tokens_per_second: float):
+    """Run the mock server in its own process so it doesn't compete for our GIL."""
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "benchmarks.mock_server",
+            "--latency", str(latency),
+            "--tokens-per-second", str(tokens_per_second),
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        yield process.stdout.readline().strip()
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def run_cli(argv: list[str], diff: str) -> float:
+    """Seconds taken by one ``cli.main`` run on ``diff``."""
+    stdin = sys.stdin
+    sys.stdin = io.StringIO(diff)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            cli_main(argv)
+            return time.perf_counter() - start
+    finally:
+        sys.stdin = stdin
+
+
+def peak_memory(argv: list[str], diff: str) -> float:
+    """Peak Python heap use in MB during one run, measured separately since tracing slows it down."""
+    tracemalloc.start()
+    try:
+        run_cli(argv, diff)
+        return tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def run_scenario(name: str, lines: int, runs: int) -> Result:
+    diff = generate_diff(lines)
+    argv = SCENARIOS[name]
+    run_cli(argv, diff)  # warm up imports and pooled clients
+    timings = [run_cli(argv, diff) for _ in range(runs)]
+    return Result(
+        scenario=name,
+        lines=lines,
+        runs=runs,
+        p50=percentile(timings, 50),
+        p95=percentile(timings, 95),
+        lines_per_second=lines * runs / sum(timings),
+        peak_mb=peak_memory(argv, diff),
+    )
+
+
+def format_table(results: list[Result], baseline: dict[tuple[str, int], dict] | None = None) -> str:
+    header = f"{'scenario':<8} {'lines':>7} {'runs':>4} {'p50 s':>8} {'p95 s':>8} {'lines/s':>10} {'peak MB':>8}"
+    if baseline:
+        header += f" {'p50 vs base':>12}"
+    rows = [header]
+    for r in results:
+        row = (
+            f"{r.scenario:<8} {r.lines:>7} {r.runs:>4} {r.p50:>8.3f} {r.p95:>8.3f} "
+            f"{r.lines_per_second:>10.0f} {r.peak_mb:>8.1f}"
+        )
+        if baseline:
+            before = baseline.get((r.scenario, r.lines))
+            row += f" {(r.p50 / before['p50'] - 1) * 100:>+11.1f}%" if before else f" {'-':>12}"
+        rows.append(row)
+    return "\n".join(rows)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="End-to-end CLI benchmarks against a mock model server.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="Diff sizes in lines.")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--runs", type=int, default=5, help="Timed runs per scenario and size.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock server seconds before the first token.")
+    parser.add_argument("--tokens-per-second", type=float, default=2000.0, help="Mock server output rate.")
+    parser.add_argument("--json", metavar="PATH", help="Also write the results as JSON to PATH.")
+    parser.add_argument("--compare", metavar="PATH", help="Show p50 change against results saved with --json.")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {(r["scenario"], r["lines"]): r for r in json.load(f)}
+
+    with mock_server(args.latency, args.tokens_per_second) as base_url:
+        os.environ.update({"CODE_REVIEWER_PROVIDER": "local", "CODE_REVIEWER_BASE_URL": base_url})
+        os.environ.pop("CODE_REVIEWER_CACHE_DIR", None)
+        results = [
+            run_scenario(name, lines, args.runs) for name in args.scenarios for lines in args.sizes
+        ]
+
+    print(format_table(results, baseline))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([asdict(r) for r in results], f, indent=2)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,156 @@
+import json
+import os
+import time
+from collections.abc import Iterator
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import TextIO
+
+from code_reviewer.diff import parse_diff
+from code_reviewer.guidelines import load_index
+from code_reviewer.ignore import filter_diff, load_patterns
+from code_reviewer.llm import (
+    _anthropic_system,
+    _get_client,
+    _get_max_output_tokens,
+    _get_model,
+    _parse_comments,
+    _poll_delays,
+    _retrying,
+)
+from code_reviewer.prompt import build_system_prompt, build_user_prompt
+
+# Message Batches API limits per batch.
+MAX_BATCH_REQUESTS = 100_000
+MAX_BATCH_BYTES = 256 * 1024 * 1024
+
+DEFAULT_MAX_WAIT = 24 * 60 * 60
+
+DIFF_SUFFIXES = (".diff", ".patch")
+
+
+@dataclass
+class BatchItem:
+    id: str
+    diff: str
+    context: str | None = None
+
+
+def load_items(path: str | Path) -> list[BatchItem]:
+    path = Path(path)
+    if path.is_dir():
+        return [
+            BatchItem(id=p.stem, diff=p.read_text().strip())
+            for p in sorted(path.iterdir())
+            if p.suffix in DIFF_SUFFIXES
+        ]
+
+    items: list[BatchItem] = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            items.append(BatchItem(id=str(record["id"]), diff=record["diff"], context=record.get("context")))
+    return items
+
+
+def chunk_requests(
+    requests: list[dict],
+    max_requests: int = MAX_BATCH_REQUESTS,
+    max_bytes: int = MAX_BATCH_BYTES,
+) -> Iterator[list[dict]]:
+    chunk: list[dict] = []
+    size = 0
+    for request in requests:
+        request_size = len(json.dumps(request).encode())
+        if chunk and (len(chunk) >= max_requests or size + request_size > max_bytes):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(request)
+        size += request_size
+    if chunk:
+        yield chunk
+
+
+def _write(output: TextIO, record: dict) -> None:
+    output.write(json.dumps(record) + "\n")
+    output.flush()
+
+
+def run_batch(
+    items: list[BatchItem],
+    output: TextIO,
+    context: str | None = None,
+    guidelines: str | None = None,
+    max_wait: float = DEFAULT_MAX_WAIT,
+) -> None:
+    """Review many diffs through the Message Batches API.
+
+    Requests are split into as many batches as the API limits require. Each
+    batch's results are written to ``output`` as JSONL as soon as it ends.
+    """
+    client = _get_client("anthropic")
+    model = _get_model("anthropic")
+    index = load_index(guidelines, os.environ.get("CODE_REVIEWER_CACHE_DIR")) if guidelines else None
+
+    patterns = load_patterns()
+
+    # custom_id only allows [a-zA-Z0-9_-], so map positional ids back to ours.
+    ids: dict[str, str] = {}
+    requests: list[dict] = []
+    for i, item in enumerate(items):
+        diff, _ = filter_diff(item.diff, patterns)
+        if not diff.strip():
+            _write(output, {"id": item.id, "comments": []})
+            continue
+        ids[f"diff-{i}"] = item.id
+        system = build_system_prompt()
+        if index is not None:
+            # Diffs touching the same languages get the same system prompt, so it stays cacheable.
+            system = build_system_prompt(index.select([f.path for f in parse_diff(diff.splitlines()) if f.path]))
+        requests.append(
+            {
+                "custom_id": f"diff-{i}",
+                "params": {
+                    "model": model,
+                    "max_tokens": _get_max_output_tokens(),
+                    "system": _anthropic_system(system),
+                    "messages": [{"role": "user", "content": build_user_prompt(diff, item.context or context)}],
+                },
+            }
+        )
+
+    # The shared client leaves retries to us, and a poll that fails for good would lose every submitted batch.
+    pending: dict[str, list[str]] = {}
+    for chunk in chunk_requests(requests):
+        batch = _retrying("anthropic", lambda: client.messages.batches.create(requests=chunk))
+        pending[batch.id] = [r["custom_id"] for r in chunk]
+
+    delays = _poll_delays(max_wait)
+    while pending:
+        for batch_id in list(pending):
+            batch = _retrying("anthropic", client.messages.batches.retrieve, batch_id)
+            if batch.processing_status != "ended":
+                continue
+            # Read whole inside the retry, so a dropped connection mid-stream neither aborts nor duplicates records.
+            results = _retrying("anthropic", lambda: list(client.messages.batches.results(batch_id)))
+            for result in results:
+                record: dict = {"id": ids[result.custom_id]}
+                if result.result.type == "succeeded":
+                    comments = _parse_comments(result.result.message.content[0].text)
+                    record["comments"] = [asdict(c) for c in comments]
+                else:
+                    record["error"] = result.result.type
+                _write(output, record)
+            del pending[batch_id]
+
+        if not pending:
+            break
+        delay = next(delays, None)
+        if delay is None:
+            for batch_id, custom_ids in pending.items():
+                for custom_id in custom_ids:
+                    _write(output, {"id": ids[custom_id], "error": f"batch {batch_id} did not complete within {max_wait}s"})
+            break
+        time.sleep(delay)
@@ -0,0 +1,66 @@
+import threading
+import time
+from dataclasses import dataclass, field
+
+
+class BudgetExceeded(Exception):
+    """The run's time ran out while a request was still waiting for its reply."""
+
+
+@dataclass
+class Budget:
+    """Wall-clock and token limits for one review run; 0 means no limit.
+
+    The clock starts when the review does. Shards are checked before each
+    request, and once one doesn't fit, no more are started: the rest of the
+    diff is skipped and its files are listed in ``skipped``.
+    """
+
+    max_seconds: float = 0
+    max_tokens: int = 0
+    tokens: int = 0  # spent so far, as reported by the provider or else estimated
+    reason: str = ""  # why the run stopped early, if it did
+    skipped: list[str] = field(default_factory=list)
+    deadline: float | None = field(default=None, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def start(self) -> None:
+        if self.max_seconds and self.deadline is None:
+            self.deadline = time.monotonic() + self.max_seconds
+
+    def remaining(self) -> float | None:
+        """Seconds left, or None without a time limit."""
+        return None if self.deadline is None else max(0.0, self.deadline - time.monotonic())
+
+    def reserve(self, tokens: int) -> bool:
+        """Whether a request of about ``tokens`` can start, counting them as spent if so.
+
+        Reserving up front keeps concurrent requests from all fitting in the
+        same leftover tokens. The first refusal stops the run for good.
+        """
+        with self._lock:
+            if not self.reason and self.deadline is not None and time.monotonic() >= self.deadline:
+                self.reason = f"time budget of {self.max_seconds:g}s"
+            if not self.reason and self.max_tokens and self.tokens + tokens > self.max_tokens:
+                self.reason = f"token budget of {self.max_tokens}"
+            if not self.reason:
+                self.tokens += tokens
+            return not self.reason
+
+    def charge(self, tokens: int) -> None:
+        """Correct the tokens spent by ``tokens``, which may be negative."""
+        with self._lock:
+            self.tokens += tokens
+
+    def skip(self, paths: list[str]) -> None:
+        with self._lock:
+            # Without a refused reservation, the time ran out mid-request.
+            self.reason = self.reason or f"time budget of {self.max_seconds:g}s"
+            self.skipped += [path for path in paths if path not in self.skipped]
+
+    def summary(self) -> str:
+        if not self.reason:
+            return ""
+        lines = [f"Stopped at the {self.reason}; skipped {len(self.skipped)} files:"]
+        lines += [f"  {path}" for path in self.skipped]
+        return "\n".join(lines)
@@ -0,0 +1,126 @@
+import itertools
+import json
+import logging
+import math
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import TextIO
+
+from code_reviewer.batch import BatchItem
+from code_reviewer.llm import DEFAULT_WORKERS, review
+from code_reviewer.stats import Stats, Usage
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BulkReport:
+    reviewed: int = 0
+    failed: int = 0
+    skipped: int = 0
+    seconds: float = 0.0  # wall-clock time for the whole run
+    latencies: list[float] = field(default_factory=list)
+    usage: Usage = field(default_factory=Usage)
+
+    def percentile(self, q: float) -> float:
+        """Nearest-rank percentile of per-diff latency, in seconds."""
+        if not self.latencies:
+            return 0.0
+        ranked = sorted(self.latencies)
+        return ranked[max(0, math.ceil(q / 100 * len(ranked)) - 1)]
+
+    def summary(self) -> str:
+        seconds = self.seconds or 1e-9
+        return (
+            f"Reviewed {self.reviewed} diffs ({self.failed} failed, {self.skipped} already done) "
+            f"in {self.seconds:.1f}s: {self.reviewed / seconds:.2f} diffs/s, "
+            f"latency p50 {self.percentile(50):.2f}s p95 {self.percentile(95):.2f}s, "
+            f"{self.usage.input_tokens / seconds:.0f} input and {self.usage.output_tokens / seconds:.0f} output tokens/s"
+        )
+
+
+def resume(path: str | Path) -> set[str]:
+    """Ids already reviewed successfully in a previous run's output at ``path``.
+
+    Failed records and a final line cut short by a crash don't count, so those
+    diffs are reviewed again. A cut-short line is terminated so that appended
+    records start on a line of their own.
+    """
+    done: set[str] = set()
+    try:
+        with open(path, "rb+") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict) and "comments" in record:
+                    done.add(str(record["id"]))
+            if f.tell():
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def _review_item(item: BatchItem, context: str | None, guidelines: str | None) -> tuple[dict, float, Usage]:
+    stats = Stats()
+    start = time.monotonic()
+    comments = review(item.diff, context=item.context or context, guidelines=guidelines, stats=stats)
+    seconds = time.monotonic() - start
+    record = {"id": item.id, "comments": [asdict(c) for c in comments], "seconds": round(seconds, 3)}
+    return record, seconds, stats.usage
+
+
+def run_bulk(
+    items: list[BatchItem],
+    output: TextIO,
+    context: str | None = None,
+    guidelines: str | None = None,
+    workers: int = DEFAULT_WORKERS,
+    done: set[str] | None = None,
+) -> BulkReport:
+    """Review ``items`` concurrently, writing one JSONL record per diff as each finishes.
+
+    Items whose id is in ``done`` are skipped. A diff that fails is recorded
+    with an ``error`` instead of stopping the run.
+    """
+    done = done or set()
+    pending = [item for item in items if item.id not in done]
+    report = BulkReport(skipped=len(items) - len(pending))
+    logger.info("Reviewing %d diffs with %d workers (%d already done)", len(pending), workers, report.skipped)
+
+    start = time.monotonic()
+    workers = max(1, workers)
+    queued = iter(pending)
+    running: dict[Future, BatchItem] = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            # Only one diff per worker is submitted at a time, so an interrupted run
+            # doesn't go on to review (and pay for) the rest of the backlog on exit.
+            for item in itertools.islice(queued, workers - len(running)):
+                running[pool.submit(_review_item, item, context, guidelines)] = item
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                item = running.pop(future)
+                try:
+                    record, seconds, usage = future.result()
+                except Exception as e:
+                    logger.warning("Review of %s failed: %s", item.id, e)
+                    record = {"id": item.id, "error": str(e)}
+                    report.failed += 1
+                else:
+                    report.reviewed += 1
+                    report.latencies.append(seconds)
+                    report.usage += usage
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+    report.seconds = time.monotonic() - start
+    return report
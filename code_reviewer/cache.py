@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from dataclasses import asdict
+from pathlib import Path
+
+from code_reviewer.output import ReviewComment
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL = 7 * 24 * 60 * 60
+
+
+def cache_key(provider: str, model: str, system: str, user: str) -> str:
+    payload = json.dumps([provider, model, system, user])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ReviewCache:
+    """Parsed review comments stored on disk, one JSON file per key.
+
+    Entries written more than ``ttl`` seconds ago are dropped on read and
+    during eviction; a file's mtime stays the time it was written. Each hit
+    sets the entry's atime instead, so trimming the directory back under
+    ``max_bytes`` removes the least recently used entries first.
+    """
+
+    def __init__(self, directory: str | Path, max_bytes: int = DEFAULT_MAX_BYTES, ttl: float = DEFAULT_TTL):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key: str) -> list[ReviewComment] | None:
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text())
+        except (OSError, ValueError):
+            self._count(hit=False)
+            return None
+
+        if time.time() - entry.get("created", 0) > self.ttl:
+            path.unlink(missing_ok=True)
+            self._count(hit=False)
+            return None
+
+        try:
+            # Another process may have evicted the entry since it was read, which still counts as a hit.
+            os.utime(path, (time.time(), path.stat().st_mtime))
+        except OSError:
+            pass
+        self._count(hit=True)
+        return [ReviewComment(**item) for item in entry["comments"]]
+
+    def put(self, key: str, comments: list[ReviewComment]) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entry = {"created": time.time(), "comments": [asdict(c) for c in comments]}
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp, self._path(key))
+        self.evict()
+
+    def evict(self) -> None:
+        now = time.time()
+        entries: list[tuple[float, float, int, Path]] = []
+        for path in self.directory.glob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_atime, stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, _, size, _ in entries)
+        for _, mtime, size, path in sorted(entries):
+            if total <= self.max_bytes and now - mtime <= self.ttl:
+                continue
+            path.unlink(missing_ok=True)
+            total -= size
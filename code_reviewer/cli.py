@@ -1,14 +1,34 @@
 import argparse
+import itertools
+import logging
 import sys
+import time
+from collections.abc import Iterator
 
-from code_reviewer.llm import review
-from code_reviewer.output import format_json, format_plain
+from code_reviewer.batch import DEFAULT_MAX_WAIT, load_items, run_batch
+from code_reviewer.budget import Budget
+from code_reviewer.bulk import resume, run_bulk
+from code_reviewer.diff import DiffIndex
+from code_reviewer.incremental import review_incremental
+from code_reviewer.llm import DEFAULT_WORKERS, review, review_stream
+from code_reviewer.output import NdjsonWriter, SarifWriter, format_json, format_plain
+from code_reviewer.stats import Stats, export_metrics, write_stats
+
+# Mirrors code_reviewer.serve, which is imported only when the daemon starts.
+DEFAULT_ADDRESS = "127.0.0.1:8750"
+DEFAULT_CONCURRENCY = 4
+DEFAULT_QUEUE_SIZE = 32
 
 
 def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         prog="code-reviewer",
         description="AI-powered code review from a git diff.",
+        epilog=(
+            "Run 'code-reviewer batch --help' to review many diffs in one Anthropic batch, "
+            "'code-reviewer bulk --help' to review many diffs concurrently with any provider, or "
+            "'code-reviewer serve --help' to keep a warm review daemon running."
+        ),
     )
     parser.add_argument(
         "-c", "--context",
@@ -18,36 +38,396 @@ def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
         "-g", "--guidelines",
         help="Path to a file containing review guidelines/rules.",
     )
-    parser.add_argument(
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument(
         "--json",
         action="store_true",
         dest="json_output",
         help="Output review comments as JSON.",
     )
+    output.add_argument(
+        "--ndjson",
+        action="store_true",
+        dest="ndjson_output",
+        help="Stream review comments as newline-delimited JSON, one per line as soon as each is ready.",
+    )
+    output.add_argument(
+        "--sarif",
+        action="store_true",
+        dest="sarif_output",
+        help="Stream review comments as a SARIF 2.1.0 log for code scanning upload.",
+    )
+    parser.add_argument(
+        "--base",
+        metavar="REV",
+        help="Run git to review --head against its merge-base with REV, instead of reading a diff from stdin.",
+    )
+    parser.add_argument(
+        "--head",
+        metavar="REV",
+        help="The revision to review with --base (default: HEAD).",
+    )
+    parser.add_argument(
+        "--since-last",
+        metavar="STATE",
+        help="With --base, remember the reviewed head in STATE and only review commits added since the last run.",
+    )
+    parser.add_argument(
+        "--incremental",
+        metavar="STATE",
+        help="Remember comments per hunk in STATE and only review hunks that changed since the last run.",
+    )
+    parser.add_argument(
+        "--positions",
+        action="store_true",
+        help="Check each comment's line against the diff, moving lines outside the changed hunks to the "
+        "nearest hunk, and add GitHub diff position, side and status to JSON output.",
+    )
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        metavar="N",
+        help="Review the riskiest files first and stop after about N seconds, keeping the comments found so far.",
+    )
+    parser.add_argument(
+        "--max-tokens",
+        type=int,
+        metavar="N",
+        help="Review the riskiest files first and stop before spending more than about N tokens.",
+    )
+    parser.add_argument(
+        "--stats",
+        nargs="?",
+        const="-",
+        metavar="PATH",
+        help="Report per-stage timings and token usage on stderr, or as JSON written to PATH.",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="PATH",
+        help="Export run metrics to PATH: a .prom file for the Prometheus textfile collector, "
+        "otherwise one JSON line appended per run.",
+    )
+    parser.add_argument(
+        "--server",
+        metavar="ADDRESS",
+        help="Send the diff to a 'code-reviewer serve' daemon at HOST:PORT or unix:PATH instead of calling the model.",
+    )
+    parser.add_argument(
+        "-v", "--verbose",
+        action="store_true",
+        help="Log progress details to stderr.",
+    )
     return parser.parse_args(argv)
 
 
+def parse_batch_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="code-reviewer batch",
+        description="Review many diffs in Anthropic message batches.",
+    )
+    parser.add_argument(
+        "input",
+        help="Directory of .diff/.patch files, or a JSONL file of {id, diff, context} records.",
+    )
+    parser.add_argument(
+        "-o", "--output",
+        help="Write JSONL results to this file instead of stdout.",
+    )
+    parser.add_argument(
+        "-c", "--context",
+        help="Context applied to every diff that doesn't carry its own.",
+    )
+    parser.add_argument(
+        "-g", "--guidelines",
+        help="Path to a file containing review guidelines/rules.",
+    )
+    parser.add_argument(
+        "--max-wait",
+        type=float,
+        default=DEFAULT_MAX_WAIT,
+        help="Seconds to wait for batches to finish before giving up.",
+    )
+    parser.add_argument(
+        "-v", "--verbose",
+        action="store_true",
+        help="Log progress details to stderr.",
+    )
+    return parser.parse_args(argv)
+
+
+def parse_bulk_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="code-reviewer bulk",
+        description="Review many diffs concurrently, streaming JSONL results as each finishes.",
+    )
+    parser.add_argument(
+        "input",
+        help="Directory of .diff/.patch files, or a JSONL file of {id, diff, context} records.",
+    )
+    parser.add_argument(
+        "-o", "--output",
+        help="Append JSONL results to this file, skipping ids it already has results for. Defaults to stdout.",
+    )
+    parser.add_argument(
+        "-c", "--context",
+        help="Context applied to every diff that doesn't carry its own.",
+    )
+    parser.add_argument(
+        "-g", "--guidelines",
+        help="Path to a file containing review guidelines/rules.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"Diffs to review at once (default: {DEFAULT_WORKERS}).",
+    )
+    parser.add_argument(
+        "-v", "--verbose",
+        action="store_true",
+        help="Log progress details to stderr.",
+    )
+    return parser.parse_args(argv)
+
+
+def parse_serve_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="code-reviewer serve",
+        description="Serve reviews over HTTP, keeping provider clients, guidelines and the cache warm.",
+    )
+    parser.add_argument(
+        "--listen",
+        default=DEFAULT_ADDRESS,
+        metavar="ADDRESS",
+        help=f"HOST:PORT or unix:PATH to listen on (default: {DEFAULT_ADDRESS}).",
+    )
+    parser.add_argument(
+        "-g", "--guidelines",
+        help="Path to a file containing review guidelines/rules, used when a request has none.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="Reviews to run at once.",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=DEFAULT_QUEUE_SIZE,
+        help="Reviews allowed to wait for a free slot before new requests are rejected with 503.",
+    )
+    parser.add_argument(
+        "-v", "--verbose",
+        action="store_true",
+        help="Log requests and progress details to stderr.",
+    )
+    return parser.parse_args(argv)
+
+
+def _setup_logging(verbose: bool) -> None:
+    if verbose:
+        logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stderr)
+
+
+def _read_guidelines(path: str | None) -> str | None:
+    if not path:
+        return None
+    with open(path) as f:
+        return f.read()
+
+
+def batch_main(argv: list[str]) -> None:
+    args = parse_batch_args(argv)
+    _setup_logging(args.verbose)
+
+    items = load_items(args.input)
+    if not items:
+        print(f"Error: No diffs found in {args.input}.", file=sys.stderr)
+        sys.exit(1)
+
+    guidelines = _read_guidelines(args.guidelines)
+    if args.output:
+        with open(args.output, "w") as output:
+            run_batch(items, output, context=args.context, guidelines=guidelines, max_wait=args.max_wait)
+    else:
+        run_batch(items, sys.stdout, context=args.context, guidelines=guidelines, max_wait=args.max_wait)
+
+
+def bulk_main(argv: list[str]) -> None:
+    args = parse_bulk_args(argv)
+    _setup_logging(args.verbose)
+
+    items = load_items(args.input)
+    if not items:
+        print(f"Error: No diffs found in {args.input}.", file=sys.stderr)
+        sys.exit(1)
+
+    guidelines = _read_guidelines(args.guidelines)
+    if args.output:
+        done = resume(args.output)
+        with open(args.output, "a") as output:
+            report = run_bulk(items, output, args.context, guidelines, workers=args.workers, done=done)
+    else:
+        report = run_bulk(items, sys.stdout, args.context, guidelines, workers=args.workers)
+    print(report.summary(), file=sys.stderr)
+    if report.failed:
+        sys.exit(1)
+
+
+def _report_stats(args: argparse.Namespace, stats: Stats) -> None:
+    if args.stats == "-":
+        print(stats.format(), file=sys.stderr)
+    elif args.stats:
+        write_stats(stats, args.stats)
+    if args.metrics:
+        export_metrics(stats, args.metrics)
+
+
+def _stdin_lines() -> Iterator[str] | None:
+    """Stdin from its first non-blank line, read lazily so huge diffs never sit in memory whole.
+
+    None if stdin is blank.
+    """
+    for line in sys.stdin:
+        if line.strip():
+            return itertools.chain([line], sys.stdin)
+    return None
+
+
+def serve_main(argv: list[str]) -> None:
+    args = parse_serve_args(argv)
+    _setup_logging(args.verbose)
+    # The HTTP server stack is only needed by the daemon, so keep it out of CLI startup.
+    from code_reviewer.serve import serve
+
+    serve(
+        args.listen,
+        guidelines=_read_guidelines(args.guidelines),
+        concurrency=args.concurrency,
+        queue_size=args.queue_size,
+    )
+
+
 def main(argv: list[str] | None = None) -> None:
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == "batch":
+        batch_main(argv[1:])
+        return
+    if argv and argv[0] == "bulk":
+        bulk_main(argv[1:])
+        return
+    if argv and argv[0] == "serve":
+        serve_main(argv[1:])
+        return
+
     args = parse_args(argv)
+    _setup_logging(args.verbose)
+    if args.server and args.incremental:
+        print("Error: --incremental cannot be combined with --server.", file=sys.stderr)
+        sys.exit(1)
+    if args.server and (args.max_seconds or args.max_tokens):
+        print("Error: --max-seconds and --max-tokens cannot be combined with --server.", file=sys.stderr)
+        sys.exit(1)
 
-    if sys.stdin.isatty():
-        print("Error: No diff provided. Pipe a git diff into this command.", file=sys.stderr)
+    if (args.head or args.since_last) and not args.base:
+        print("Error: --head and --since-last require --base.", file=sys.stderr)
+        sys.exit(1)
+
+    if not args.base and sys.stdin.isatty():
+        print("Error: No diff provided. Pipe a git diff into this command, or pass --base.", file=sys.stderr)
         print("  Example: git diff | code-reviewer", file=sys.stderr)
         sys.exit(1)
 
-    diff = sys.stdin.read().strip()
-    if not diff:
+    start = time.monotonic()
+    stats = Stats()
+    budget = Budget(args.max_seconds or 0, args.max_tokens or 0) if args.max_seconds or args.max_tokens else None
+    if budget is not None:
+        budget.start()  # counting time spent reading the diff too
+    reviewed = state = None
+    positions_diff = None  # what comment positions are counted in, if not the reviewed diff
+    with stats.timer("read"):
+        if args.base:
+            # Only git ranges need subprocess, so keep it out of CLI startup.
+            from code_reviewer.git import GitError, RangeState, branch_name, diff_between, review_range
+
+            head = args.head or "HEAD"
+            branch = branch_name(head)
+            state = RangeState.load(args.since_last) if args.since_last else None
+            try:
+                reviewed = review_range(args.base, head, state, branch)
+                diff = diff_between(reviewed.start, reviewed.head).strip()
+                if args.positions and reviewed.start != reviewed.merge_base:
+                    # Comments are posted on the whole pull request, not just the new commits.
+                    positions_diff = diff_between(reviewed.merge_base, reviewed.head)
+            except GitError as e:
+                print(f"Error: {e}", file=sys.stderr)
+                sys.exit(1)
+            print(reviewed.summary(), file=sys.stderr)
+        elif args.server or args.incremental or args.positions:
+            diff = sys.stdin.read().strip()
+        else:
+            diff = _stdin_lines()
+    if not diff and reviewed is None:
         print("Error: Empty diff.", file=sys.stderr)
         sys.exit(1)
 
-    guidelines = None
-    if args.guidelines:
-        with open(args.guidelines) as f:
-            guidelines = f.read()
+    guidelines = _read_guidelines(args.guidelines)
+    index = DiffIndex.from_diff(positions_diff or diff) if args.positions else None
 
-    comments = review(diff, context=args.context, guidelines=guidelines)
+    if not diff:
+        comments = []  # no new commits, or commits that cancel out
+    elif args.server:
+        from code_reviewer.client import ServerError, request_review
+
+        try:
+            comments = request_review(args.server, diff, context=args.context, guidelines=guidelines)
+        except (OSError, ServerError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+    elif (args.ndjson_output or args.sarif_output) and not args.incremental:
+        writer = SarifWriter(sys.stdout) if args.sarif_output else NdjsonWriter(sys.stdout)
+        try:
+            for comment in review_stream(diff, context=args.context, guidelines=guidelines, stats=stats, budget=budget):
+                writer.write(comment, index.anchor(comment.file, comment.line) if index else None)
+        finally:
+            # A failed review still leaves valid SARIF behind, with the comments found so far.
+            writer.close()
+        if budget is not None and budget.reason:
+            print(budget.summary(), file=sys.stderr)
+        elif state is not None:
+            state.record(branch, reviewed)
+            state.save()
+        stats.total = time.monotonic() - start
+        _report_stats(args, stats)
+        return
+    elif args.incremental:
+        comments = review_incremental(
+            diff, args.incremental, context=args.context, guidelines=guidelines, stats=stats, budget=budget
+        )
+    else:
+        comments = review(diff, context=args.context, guidelines=guidelines, stats=stats, budget=budget)
+    stats.comments = len(comments)
+    anchors = [index.anchor(c.file, c.line) for c in comments] if index else None
 
     if args.json_output:
-        print(format_json(comments))
+        print(format_json(comments, anchors))
+    elif args.ndjson_output or args.sarif_output:
+        writer = SarifWriter(sys.stdout) if args.sarif_output else NdjsonWriter(sys.stdout)
+        try:
+            for i, comment in enumerate(comments):
+                writer.write(comment, anchors[i] if anchors else None)
+        finally:
+            writer.close()
     else:
-        print(format_plain(comments))
+        print(format_plain(comments, anchors))
+    if budget is not None and budget.reason:
+        # Skipped files weren't reviewed, so the range isn't remembered as done.
+        print(budget.summary(), file=sys.stderr)
+    elif state is not None:
+        state.record(branch, reviewed)
+        state.save()
+    stats.total = time.monotonic() - start
+    _report_stats(args, stats)
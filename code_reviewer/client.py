@@ -0,0 +1,55 @@
+import http.client
+import json
+import socket
+
+from code_reviewer.output import ReviewComment
+
+UNIX_PREFIX = "unix:"
+
+
+class ServerError(RuntimeError):
+    pass
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float | None = None):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+def _connection(address: str, timeout: float | None) -> http.client.HTTPConnection:
+    if address.startswith(UNIX_PREFIX):
+        return _UnixConnection(address[len(UNIX_PREFIX):], timeout=timeout)
+    return http.client.HTTPConnection(address.removeprefix("http://").rstrip("/"), timeout=timeout)
+
+
+def request_review(
+    address: str,
+    diff: str,
+    context: str | None = None,
+    guidelines: str | None = None,
+    timeout: float | None = None,
+) -> list[ReviewComment]:
+    """Review ``diff`` on a ``code-reviewer serve`` daemon at ``HOST:PORT`` or ``unix:PATH``."""
+    body = json.dumps({"diff": diff, "context": context, "guidelines": guidelines})
+    connection = _connection(address, timeout)
+    try:
+        connection.request("POST", "/review", body=body, headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        data = response.read()
+    finally:
+        connection.close()
+
+    if response.status != 200:
+        try:
+            message = json.loads(data)["error"]
+        except (ValueError, KeyError, TypeError):
+            message = data.decode(errors="replace") or response.reason
+        raise ServerError(f"Server returned {response.status}: {message}")
+    return [ReviewComment(**item) for item in json.loads(data)]
@@ -0,0 +1,122 @@
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from code_reviewer.diff import FileDiff, Hunk, estimate_tokens, parse_diff
+
+
+@dataclass
+class CompactionReport:
+    whitespace_hunks: int = 0
+    deletion_hunks: int = 0
+    context_lines: int = 0
+    tokens_before: int = 0
+    tokens_after: int = 0
+
+    @property
+    def compacted(self) -> bool:
+        return self.tokens_after < self.tokens_before
+
+    def __add__(self, other: "CompactionReport") -> "CompactionReport":
+        return CompactionReport(
+            whitespace_hunks=self.whitespace_hunks + other.whitespace_hunks,
+            deletion_hunks=self.deletion_hunks + other.deletion_hunks,
+            context_lines=self.context_lines + other.context_lines,
+            tokens_before=self.tokens_before + other.tokens_before,
+            tokens_after=self.tokens_after + other.tokens_after,
+        )
+
+
+def _changes(hunk: Hunk, sign: str) -> list[str]:
+    return [line[1:] for line in hunk.lines if line.startswith(sign)]
+
+
+def _squash(line: str) -> str:
+    return "".join(line.split())
+
+
+def _is_whitespace_only(hunk: Hunk) -> bool:
+    removed, added = _changes(hunk, "-"), _changes(hunk, "+")
+    if not removed and not added:
+        return False
+    return sorted(_squash(line) for line in removed) == sorted(_squash(line) for line in added)
+
+
+def _is_deletion_only(hunk: Hunk) -> bool:
+    return bool(_changes(hunk, "-")) and not _changes(hunk, "+")
+
+
+def _drop_hunks(files: list[FileDiff], predicate: Callable[[Hunk], bool]) -> int:
+    dropped = 0
+    for file in files:
+        kept = [h for h in file.hunks if not predicate(h)]
+        dropped += len(file.hunks) - len(kept)
+        file.hunks = kept
+    return dropped
+
+
+def _drop_whitespace(files: list[FileDiff], report: CompactionReport) -> None:
+    report.whitespace_hunks += _drop_hunks(files, _is_whitespace_only)
+
+
+def _drop_deletions(files: list[FileDiff], report: CompactionReport) -> None:
+    # Comments anchor to new-file lines, so deletion-only hunks rarely yield any.
+    report.deletion_hunks += _drop_hunks(files, _is_deletion_only)
+
+
+def _trim_hunk(hunk: Hunk, keep: int) -> int:
+    lines = hunk.lines
+    if not any(line.startswith(("+", "-")) for line in lines):
+        return 0
+    lead = next(i for i, line in enumerate(lines) if not line.startswith(" ") and line != "")
+    trail = next(i for i, line in enumerate(reversed(lines)) if not line.startswith(" ") and line != "")
+    cut_lead, cut_trail = max(0, lead - keep), max(0, trail - keep)
+    if not cut_lead and not cut_trail:
+        return 0
+
+    hunk.lines = lines[cut_lead:len(lines) - cut_trail]
+    hunk.old_start += cut_lead
+    hunk.new_start += cut_lead
+    hunk.old_count -= cut_lead + cut_trail
+    hunk.new_count -= cut_lead + cut_trail
+    suffix = hunk.header.split("@@", 2)[2] if hunk.header.count("@@") >= 2 else ""
+    hunk.header = f"@@ -{hunk.old_start},{hunk.old_count} +{hunk.new_start},{hunk.new_count} @@{suffix}"
+    return cut_lead + cut_trail
+
+
+def _shrink_context(keep: int) -> Callable[[list[FileDiff], CompactionReport], None]:
+    def stage(files: list[FileDiff], report: CompactionReport) -> None:
+        for file in files:
+            for hunk in file.hunks:
+                report.context_lines += _trim_hunk(hunk, keep)
+
+    return stage
+
+
+# Ordered from least to most information lost.
+STAGES = [_drop_whitespace, _drop_deletions, _shrink_context(1), _shrink_context(0)]
+
+
+def _render(files: list[FileDiff], had_hunks: list[bool]) -> str:
+    return "\n".join(f.text for f, had in zip(files, had_hunks) if f.hunks or not had)
+
+
+def compact_diff(diff: str, budget: int) -> tuple[str, CompactionReport]:
+    """Shrink ``diff`` towards ``budget`` tokens, stopping as soon as it fits.
+
+    May still be over budget if every stage has run.
+    """
+    tokens = estimate_tokens(diff)
+    report = CompactionReport(tokens_before=tokens, tokens_after=tokens)
+    if tokens <= budget:
+        return diff, report
+
+    files = list(parse_diff(diff.splitlines()))
+    had_hunks = [bool(f.hunks) for f in files]
+    text = diff
+    for stage in STAGES:
+        stage(files, report)
+        text = _render(files, had_hunks)
+        if estimate_tokens(text) <= budget:
+            break
+    report.tokens_after = estimate_tokens(text)
+    return text, report
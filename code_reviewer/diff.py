@@ -0,0 +1,272 @@
+import math
+import re
+from bisect import bisect_right
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+
+CHARS_PER_TOKEN = 4
+
+# How a comment's line relates to the diff, see DiffIndex.anchor.
+EXACT = "exact"  # on a line of a hunk in the new file
+SNAPPED = "snapped"  # moved to the nearest line of a hunk in the new file
+OLD = "old"  # on a removed line, numbered in the old file
+FILE = "file"  # no line; a comment on the whole file
+INVALID = "invalid"  # the file isn't in the diff, or has no lines to comment on
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+@dataclass
+class Hunk:
+    header: str
+    old_start: int
+    old_count: int
+    new_start: int
+    new_count: int
+    lines: list[str] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return "\n".join([self.header, *self.lines])
+
+
+@dataclass
+class FileDiff:
+    path: str
+    header: list[str] = field(default_factory=list)
+    hunks: list[Hunk] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return "\n".join([*self.header, *(h.text for h in self.hunks)])
+
+
+def _parse_hunk_header(line: str) -> Hunk | None:
+    match = HUNK_HEADER.match(line)
+    if not match:
+        return None
+    old_start, old_count, new_start, new_count = match.groups()
+    return Hunk(
+        header=line,
+        old_start=int(old_start),
+        old_count=int(old_count) if old_count is not None else 1,
+        new_start=int(new_start),
+        new_count=int(new_count) if new_count is not None else 1,
+    )
+
+
+def _path_from_header(header: list[str]) -> str:
+    new_path = old_path = ""
+    for line in header:
+        if line.startswith("+++ "):
+            new_path = line[4:].split("\t")[0]
+        elif line.startswith("--- "):
+            old_path = line[4:].split("\t")[0]
+        elif line.startswith("diff --git ") and not new_path:
+            parts = line.split(" b/", 1)
+            if len(parts) == 2:
+                new_path = "b/" + parts[1]
+    path = new_path if new_path and new_path != "/dev/null" else old_path
+    if path.startswith(("a/", "b/")):
+        path = path[2:]
+    return path
+
+
+def parse_diff(lines: Iterable[str]) -> Iterator[FileDiff]:
+    """Split a unified diff into per-file records.
+
+    Anything that doesn't look like a diff is kept verbatim as the header of a
+    single pathless file, so arbitrary input round-trips through ``text``.
+    """
+    current: FileDiff | None = None
+    hunk: Hunk | None = None
+    old_left = new_left = 0
+
+    for line in lines:
+        line = line.rstrip("\n")
+        if hunk is not None and (old_left > 0 or new_left > 0 or line.startswith("\\")):
+            hunk.lines.append(line)
+            if line.startswith("+"):
+                new_left -= 1
+            elif line.startswith("-"):
+                old_left -= 1
+            elif not line.startswith("\\"):
+                old_left -= 1
+                new_left -= 1
+            continue
+
+        starts_file = line.startswith("diff --git ") or (
+            line.startswith("--- ") and (current is None or current.hunks)
+        )
+        if starts_file or current is None:
+            if current is not None:
+                current.path = _path_from_header(current.header)
+                yield current
+            current = FileDiff(path="")
+            hunk = None
+
+        parsed = _parse_hunk_header(line)
+        if parsed is not None:
+            hunk = parsed
+            old_left, new_left = hunk.old_count, hunk.new_count
+            current.hunks.append(hunk)
+        elif hunk is not None:
+            hunk.lines.append(line)
+        else:
+            current.header.append(line)
+
+    if current is not None:
+        current.path = _path_from_header(current.header)
+        yield current
+
+
+def _join(header: str, parts: list[str]) -> str:
+    return "\n".join([header, *parts]) if header else "\n".join(parts)
+
+
+def shard_files(files: Iterable[FileDiff], max_tokens: int) -> Iterator[str]:
+    """Pack files into diff shards of at most ``max_tokens`` each.
+
+    Files that don't fit on their own are split on hunk boundaries, repeating
+    the file header in every piece. A single hunk larger than the budget still
+    becomes its own (oversized) shard.
+    """
+    pending: list[str] = []
+    pending_tokens = 0
+
+    for file in files:
+        text = file.text
+        tokens = estimate_tokens(text)
+        if pending_tokens + tokens <= max_tokens:
+            pending.append(text)
+            pending_tokens += tokens
+            continue
+        if pending:
+            yield "\n".join(pending)
+        if tokens <= max_tokens or len(file.hunks) <= 1:
+            pending, pending_tokens = [text], tokens
+            continue
+
+        header = "\n".join(file.header)
+        header_tokens = estimate_tokens(header)
+        piece: list[str] = []
+        piece_tokens = header_tokens
+        for hunk in file.hunks:
+            hunk_text = hunk.text
+            hunk_tokens = estimate_tokens(hunk_text)
+            if piece and piece_tokens + hunk_tokens > max_tokens:
+                yield _join(header, piece)
+                piece, piece_tokens = [], header_tokens
+            piece.append(hunk_text)
+            piece_tokens += hunk_tokens
+        pending, pending_tokens = [_join(header, piece)], piece_tokens
+
+    if pending:
+        yield "\n".join(pending)
+
+
+def split_diff(diff: str, max_tokens: int) -> list[str]:
+    if estimate_tokens(diff) <= max_tokens:
+        return [diff]
+    return list(shard_files(parse_diff(diff.splitlines()), max_tokens))
+
+
+@dataclass
+class Anchor:
+    """Where a comment can be placed in a pull request's diff."""
+
+    status: str
+    line: int | None = None
+    side: str | None = None  # "RIGHT" for the new file, "LEFT" for the old one
+    position: int | None = None  # lines below the file's first hunk header, as GitHub counts them
+
+
+@dataclass
+class _FileIndex:
+    starts: list[int] = field(default_factory=list)  # new_start of each hunk with new-file lines
+    positions: list[list[int]] = field(default_factory=list)  # diff position of each of those lines
+    removed: dict[int, int] = field(default_factory=dict)  # old line number -> diff position
+
+
+def _index_file(file: FileDiff) -> _FileIndex:
+    index = _FileIndex()
+    position = -1  # the first hunk header is position 0
+    for hunk in file.hunks:
+        position += 1
+        old_line, new_line = hunk.old_start, hunk.new_start
+        new_positions: list[int] = []
+        for line in hunk.lines:
+            position += 1
+            if line.startswith("+"):
+                new_positions.append(position)
+                new_line += 1
+            elif line.startswith("-"):
+                index.removed[old_line] = position
+                old_line += 1
+            elif line.startswith(" "):
+                new_positions.append(position)
+                old_line += 1
+                new_line += 1
+        if new_positions:
+            index.starts.append(hunk.new_start)
+            index.positions.append(new_positions)
+    return index
+
+
+def _normalize_path(path: str) -> str:
+    path = path.removeprefix("./")
+    return path[2:] if path.startswith(("a/", "b/")) else path
+
+
+class DiffIndex:
+    """Per-file line ranges and GitHub diff positions of a diff, for placing comments.
+
+    Built once per diff; each lookup is a binary search over the file's hunks.
+    """
+
+    def __init__(self, files: Iterable[FileDiff]):
+        self._files: dict[str, _FileIndex] = {}
+        for file in files:
+            if file.path:
+                self._files[file.path] = _index_file(file)
+
+    @classmethod
+    def from_diff(cls, diff: str) -> "DiffIndex":
+        return cls(parse_diff(diff.splitlines()))
+
+    def anchor(self, path: str, line: int | None) -> Anchor:
+        """Place a comment on ``line`` of ``path``.
+
+        Lines outside every hunk are snapped to the nearest line that is in
+        one, unless they match a removed line of the old file.
+        """
+        index = self._files.get(path) or self._files.get(_normalize_path(path))
+        if index is None:
+            return Anchor(INVALID)
+        if line is None:
+            return Anchor(FILE)
+        if not isinstance(line, int):
+            return Anchor(INVALID)
+
+        i = bisect_right(index.starts, line) - 1
+        if i >= 0 and line < index.starts[i] + len(index.positions[i]):
+            return Anchor(EXACT, line, "RIGHT", index.positions[i][line - index.starts[i]])
+        if line in index.removed:
+            return Anchor(OLD, line, "LEFT", index.removed[line])
+        if not index.starts:
+            return Anchor(INVALID)
+
+        # Nearest of the end of the hunk before and the start of the one after.
+        candidates: list[tuple[int, int, int]] = []
+        if i >= 0:
+            end = index.starts[i] + len(index.positions[i]) - 1
+            candidates.append((line - end, end, index.positions[i][-1]))
+        if i + 1 < len(index.starts):
+            start = index.starts[i + 1]
+            candidates.append((start - line, start, index.positions[i + 1][0]))
+        _, snapped, position = min(candidates)
+        return Anchor(SNAPPED, snapped, "RIGHT", position)
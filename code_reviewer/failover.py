@@ -0,0 +1,213 @@
+import itertools
+import logging
+import threading
+import time
+from collections.abc import Awaitable, Callable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from code_reviewer.budget import BudgetExceeded
+from code_reviewer.stats import Usage
+
+if TYPE_CHECKING:
+    from code_reviewer.llm import Completion
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Tier:
+    provider: str
+    model: str
+    base_url: str | None = None  # None for the provider's configured endpoint
+
+
+class Race:
+    """Bookkeeping for trying a provider chain, shared by the thread and asyncio drivers.
+
+    A tier that fails, gives a reply ``usable`` rejects or outlives ``timeout``
+    seconds hands over to the next one. With ``hedge``, the next tier is also
+    started whenever the latest one has been running that many seconds, and
+    the first usable reply wins. ``running`` maps each in-flight future or
+    task to its tier and start time. Past the run's ``deadline``, everything
+    still running is given up on and :class:`BudgetExceeded` raised.
+    """
+
+    def __init__(
+        self,
+        chain: list[Tier],
+        usable: Callable[["Completion"], bool],
+        deadline: float | None = None,
+        timeout: float = 0,
+        hedge: float = 0,
+    ):
+        self.remaining = list(chain)
+        self.usable = usable
+        self.deadline = deadline
+        self.running: dict = {}
+        self.timeout = timeout
+        self.hedge = hedge
+        self.last_start = 0.0
+        self.error: Exception | None = None
+        self.invalid: "Completion | None" = None  # kept in case no tier does better
+
+    def next_tier(self) -> Tier | None:
+        if not self.remaining:
+            return None
+        tier = self.remaining.pop(0)
+        if self.running:
+            logger.info("Hedging with %s (%s)", tier.provider, tier.model)
+        self.last_start = time.monotonic()
+        return tier
+
+    def started(self, handle, tier: Tier) -> None:
+        self.running[handle] = (tier, self.last_start)
+
+    def wait_time(self) -> float | None:
+        deadlines = [start + self.timeout for _, start in self.running.values()] if self.timeout else []
+        if self.hedge and self.remaining:
+            deadlines.append(self.last_start + self.hedge)
+        if self.deadline is not None:
+            deadlines.append(self.deadline)
+        return max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+
+    def finished(self, handle, completion: "Completion | None", error: BaseException | None) -> "Completion | None":
+        """The winning completion, if ``handle``'s is one."""
+        tier, _ = self.running.pop(handle)
+        if error is not None:
+            logger.warning("%s (%s) failed: %s", tier.provider, tier.model, error)
+            self.error = error
+            return None
+        completion.provider = tier.provider
+        if self.usable(completion):
+            return completion
+        logger.warning("%s (%s) replied without a JSON array", tier.provider, tier.model)
+        self.invalid = completion
+        return None
+
+    def expired(self) -> list:
+        """Handles that ran past the attempt timeout or the run's deadline, now given up on."""
+        now = time.monotonic()
+        if self.deadline is not None and now >= self.deadline:
+            expired = list(self.running)
+            self.running.clear()
+            self.remaining.clear()
+            self.error = BudgetExceeded("The time budget ran out before a reply")
+            return expired
+        if not self.timeout:
+            return []
+        expired = [h for h, (_, start) in self.running.items() if now - start >= self.timeout]
+        for handle in expired:
+            tier, _ = self.running.pop(handle)
+            logger.warning("%s (%s) gave no reply within %gs", tier.provider, tier.model, self.timeout)
+            self.error = TimeoutError(f"{tier.provider} gave no reply within {self.timeout:g}s")
+        return expired
+
+    def want_next(self) -> bool:
+        if not self.running:
+            return True
+        return bool(self.hedge) and time.monotonic() - self.last_start >= self.hedge
+
+    def result(self) -> "Completion":
+        """What to return once every tier has failed."""
+        if self.invalid is not None and not isinstance(self.error, BudgetExceeded):
+            return self.invalid
+        raise self.error
+
+
+def _in_daemon_thread(fn: Callable[..., "Completion"], *args) -> Future:
+    # A losing request can't be interrupted, and a pool thread would keep the
+    # process alive until it finished.
+    future: Future = Future()
+
+    def run() -> None:
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+def complete_chain(race: Race, attempt: Callable[[Tier], "Completion"]) -> "Completion":
+    """Complete with the first tier of the ``race`` whose ``attempt`` gives a usable reply in time.
+
+    Losing requests are abandoned, not interrupted: their replies are discarded.
+    """
+    if len(race.remaining) == 1 and not race.timeout and race.deadline is None:
+        tier = race.remaining[0]
+        completion = attempt(tier)
+        completion.provider = tier.provider
+        return completion
+
+    while True:
+        if race.want_next() and (tier := race.next_tier()) is not None:
+            race.started(_in_daemon_thread(attempt, tier), tier)
+        if not race.running:
+            return race.result()
+        done, _ = wait(race.running, timeout=race.wait_time(), return_when=FIRST_COMPLETED)
+        for future in done:
+            error = future.exception()
+            if (winner := race.finished(future, None if error else future.result(), error)) is not None:
+                return winner
+        race.expired()
+
+
+async def acomplete_chain(race: Race, attempt: Callable[[Tier], Awaitable["Completion"]]) -> "Completion":
+    """Async variant of :func:`complete_chain`, which cancels losing requests."""
+    import asyncio
+
+    if len(race.remaining) == 1 and not race.timeout and race.deadline is None:
+        tier = race.remaining[0]
+        completion = await attempt(tier)
+        completion.provider = tier.provider
+        return completion
+
+    try:
+        while True:
+            if race.want_next() and (tier := race.next_tier()) is not None:
+                race.started(asyncio.ensure_future(attempt(tier)), tier)
+            if not race.running:
+                return race.result()
+            done, _ = await asyncio.wait(race.running, timeout=race.wait_time(), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                error = task.exception()
+                if (winner := race.finished(task, None if error else task.result(), error)) is not None:
+                    return winner
+            for task in race.expired():
+                task.cancel()
+    finally:
+        for task in race.running:
+            task.cancel()
+
+
+def stream_chain(
+    chain: list[Tier], open_stream: Callable[[Tier], Iterator[str | Usage]], reply: "Completion"
+) -> Iterator[str]:
+    """Stream from the first tier of ``chain`` that starts replying, setting ``reply``'s provider and usage.
+
+    Streams aren't hedged: only a tier that fails before its first chunk
+    hands over to the next. :class:`BudgetExceeded` is raised as is.
+    """
+    for i, tier in enumerate(chain):
+        stream = open_stream(tier)
+        try:
+            first = next(stream, None)
+        except BudgetExceeded:
+            raise
+        except Exception as e:
+            if i == len(chain) - 1:
+                raise
+            logger.warning("%s (%s) failed: %s", tier.provider, tier.model, e)
+            continue
+        reply.provider = tier.provider
+        for chunk in itertools.chain([first] if first is not None else [], stream):
+            if isinstance(chunk, Usage):
+                reply.usage = chunk
+            else:
+                yield chunk
+        return
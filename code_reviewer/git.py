@@ -0,0 +1,140 @@
+import json
+import logging
+import os
+import subprocess
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class GitError(RuntimeError):
+    pass
+
+
+def _git(*args: str) -> str:
+    try:
+        result = subprocess.run(["git", *args], capture_output=True, text=True)
+    except FileNotFoundError:
+        raise GitError("git is not installed") from None
+    if result.returncode != 0:
+        raise GitError(result.stderr.strip() or f"git {args[0]} failed")
+    return result.stdout
+
+
+def resolve(rev: str) -> str:
+    return _git("rev-parse", "--verify", "--quiet", f"{rev}^{{commit}}").strip()
+
+
+def merge_base(base: str, head: str) -> str:
+    return _git("merge-base", base, head).strip()
+
+
+def is_ancestor(ancestor: str, rev: str) -> bool:
+    try:
+        _git("merge-base", "--is-ancestor", ancestor, rev)
+    except GitError:
+        return False
+    return True
+
+
+def commits(start: str, end: str) -> list[str]:
+    """One ``"<short sha> <subject>"`` line per commit in ``start..end``, oldest first."""
+    return _git("log", "--reverse", "--format=%h %s", f"{start}..{end}").splitlines()
+
+
+def diff_between(start: str, end: str) -> str:
+    # Pin the options that user config could change, so parse_diff sees a plain unified diff.
+    return _git("diff", "--no-color", "--no-ext-diff", "--src-prefix=a/", "--dst-prefix=b/", start, end)
+
+
+def branch_name(head: str) -> str:
+    """What ``head`` is remembered as in the state file: the branch it names, if any."""
+    try:
+        return _git("rev-parse", "--abbrev-ref", head).strip() or head
+    except GitError:
+        return head
+
+
+@dataclass
+class Range:
+    """The part of ``base...head`` to review, and the commits it leaves out."""
+
+    merge_base: str
+    head: str
+    start: str  # the diff runs from here to head
+    commits: list[str] = field(default_factory=list)
+    skipped: list[str] = field(default_factory=list)  # reviewed by a previous run
+
+    def summary(self) -> str:
+        lines: list[str] = []
+        if self.skipped:
+            lines.append(f"Skipping {len(self.skipped)} commits reviewed in a previous run:")
+            lines += [f"  {commit}" for commit in self.skipped]
+        if self.commits:
+            lines.append(f"Reviewing {len(self.commits)} commits:")
+            lines += [f"  {commit}" for commit in self.commits]
+        else:
+            lines.append("No new commits to review.")
+        return "\n".join(lines)
+
+
+class RangeState:
+    """The last reviewed head of each branch, stored as JSON."""
+
+    def __init__(self, path: str | Path, branches: dict[str, dict] | None = None):
+        self.path = Path(path)
+        self.branches = branches or {}
+
+    @classmethod
+    def load(cls, path: str | Path) -> "RangeState":
+        try:
+            data = json.loads(Path(path).read_text())
+        except (OSError, ValueError):
+            return cls(path)
+        return cls(path, data.get("branches", {}))
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"branches": self.branches}, f, indent=2)
+        os.replace(tmp, self.path)
+
+    def record(self, branch: str, reviewed: Range) -> None:
+        self.branches[branch] = {"merge_base": reviewed.merge_base, "head": reviewed.head}
+
+
+def review_range(base: str, head: str = "HEAD", state: RangeState | None = None, branch: str = "") -> Range:
+    """What to review of ``head`` against its merge-base with ``base``.
+
+    With a ``state`` that remembers ``branch``, only commits added since the
+    last reviewed head are included. A rebase, force-push or new merge-base
+    makes the remembered head meaningless, so the whole branch is reviewed.
+    """
+    try:
+        base_sha, head_sha = resolve(base), resolve(head)
+    except GitError:
+        raise GitError(f"Unknown revision {base!r} or {head!r}") from None
+    start = merge_base(base_sha, head_sha)
+    full = Range(merge_base=start, head=head_sha, start=start)
+
+    last = state.branches.get(branch) if state is not None else None
+    if not last:
+        full.commits = commits(start, head_sha)
+        return full
+    if last.get("merge_base") != start:
+        logger.info("Merge-base with %s moved since the last review; reviewing the whole branch", base)
+    elif not is_ancestor(last.get("head", ""), head_sha):
+        logger.info("Last reviewed commit %s is no longer on %s; reviewing the whole branch", last.get("head"), head)
+    else:
+        return Range(
+            merge_base=start,
+            head=head_sha,
+            start=last["head"],
+            commits=commits(last["head"], head_sha),
+            skipped=commits(start, last["head"]),
+        )
+    full.commits = commits(start, head_sha)
+    return full
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from code_reviewer.ignore import _matches
+
+HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+FENCE = re.compile(r"^\s{0,3}(`{3,}|~{3,})")
+# "Applies to: *.py, scripts/*", optionally wrapped in an HTML comment so it doesn't render.
+APPLIES_TO = re.compile(r"^\s*(?:<!--\s*)?applies[ -]to:\s*(.*?)\s*(?:-->)?\s*$", re.IGNORECASE)
+
+# Headings that start with a language apply to its files. "Go" and "C" only
+# count capitalised, since "go" and "c" are also ordinary words and list markers.
+LANGUAGE_GLOBS = {
+    "python": ["*.py", "*.pyi"],
+    "Go": ["*.go"],
+    "golang": ["*.go"],
+    "javascript": ["*.js", "*.jsx", "*.mjs", "*.cjs"],
+    "typescript": ["*.ts", "*.tsx"],
+    "java": ["*.java"],
+    "kotlin": ["*.kt", "*.kts"],
+    "rust": ["*.rs"],
+    "ruby": ["*.rb"],
+    "C": ["*.c", "*.h"],
+    "c++": ["*.cc", "*.cpp", "*.cxx", "*.hh", "*.hpp", "*.h"],
+    "cpp": ["*.cc", "*.cpp", "*.cxx", "*.hh", "*.hpp", "*.h"],
+    "c#": ["*.cs"],
+    "csharp": ["*.cs"],
+    "swift": ["*.swift"],
+    "php": ["*.php"],
+    "scala": ["*.scala"],
+    "shell": ["*.sh", "*.bash"],
+    "bash": ["*.sh", "*.bash"],
+    "sql": ["*.sql"],
+    "terraform": ["*.tf"],
+    "dockerfile": ["Dockerfile", "*.dockerfile"],
+}
+CASE_SENSITIVE = {"Go", "C"}
+
+_indexes: dict[str, "GuidelinesIndex"] = {}
+
+
+@dataclass
+class Section:
+    text: str
+    globs: list[str] = field(default_factory=list)  # empty for sections that apply to every file
+
+    def applies_to(self, paths: list[str]) -> bool:
+        return not self.globs or any(_matches(path, glob) for path in paths for glob in self.globs)
+
+
+def _heading_globs(title: str) -> list[str]:
+    """The files a heading is about, if it leads with languages: "Python", "TypeScript components", "C and C++".
+
+    A language named later on, as in "Avoid SQL injection", is only mentioned
+    and doesn't scope the section.
+    """
+    globs: list[str] = []
+    for word in re.findall(r"[A-Za-z][A-Za-z0-9+#]*", title):
+        language = LANGUAGE_GLOBS.get(word if word in CASE_SENSITIVE else word.lower())
+        if language is None:
+            if globs and word.lower() in ("and", "or"):
+                continue
+            break
+        globs += [glob for glob in language if glob not in globs]
+    return globs
+
+
+@dataclass
+class GuidelinesIndex:
+    """Guidelines split into sections at their headings, each tagged with the files it applies to.
+
+    A section is tagged by an ``Applies to:`` line with comma-separated globs,
+    or else by the languages its heading starts with. Untagged sections inherit
+    their parent heading's tags; those with none at all apply everywhere.
+    """
+
+    sections: list[Section] = field(default_factory=list)
+
+    @classmethod
+    def parse(cls, text: str) -> "GuidelinesIndex":
+        sections: list[Section] = []
+        stack: list[tuple[int, list[str]]] = []  # (level, globs) of the enclosing headings
+        lines: list[str] = []
+        globs: list[str] = []
+        explicit: list[str] | None = None
+        fence = ""  # the open code fence, whose "# comments" aren't headings
+
+        def flush() -> None:
+            body = "\n".join(lines).strip()
+            if body:
+                sections.append(Section(body, explicit if explicit is not None else globs))
+
+        for line in text.splitlines():
+            marker = FENCE.match(line)
+            if fence:
+                # A fence is closed by one of the same character, at least as long.
+                if marker and marker.group(1)[0] == fence[0] and len(marker.group(1)) >= len(fence):
+                    fence = ""
+                lines.append(line)
+                continue
+            if marker:
+                fence = marker.group(1)
+                lines.append(line)
+                continue
+            heading = HEADING.match(line)
+            if heading:
+                flush()
+                level = len(heading.group(1))
+                while stack and stack[-1][0] >= level:
+                    stack.pop()
+                inherited = stack[-1][1] if stack else []
+                globs = _heading_globs(heading.group(2)) or inherited
+                stack.append((level, globs))
+                lines, explicit = [line], None
+                continue
+            applies = APPLIES_TO.match(line)
+            if applies and explicit is None:
+                explicit = [g for g in re.split(r"[,\s]+", applies.group(1)) if g]
+                if stack:
+                    stack[-1] = (stack[-1][0], explicit)  # subsections inherit these instead
+                continue
+            lines.append(line)
+        flush()
+        return cls(sections)
+
+    def select(self, paths: list[str]) -> str:
+        """The sections that apply to any of ``paths``, in their original order.
+
+        With no paths to go on, every section is kept.
+        """
+        if not paths:
+            return "\n\n".join(s.text for s in self.sections)
+        return "\n\n".join(s.text for s in self.sections if s.applies_to(paths))
+
+
+def load_index(text: str, cache_dir: str | Path | None = None) -> GuidelinesIndex:
+    """The index of ``text``, parsed once per process and, with ``cache_dir``, once per content hash."""
+    key = hashlib.sha256(text.encode()).hexdigest()
+    index = _indexes.get(key)
+    if index is not None:
+        return index
+
+    path = Path(cache_dir) / "guidelines" / f"{key}.json" if cache_dir else None
+    if path is not None:
+        try:
+            data = json.loads(path.read_text())
+            index = GuidelinesIndex([Section(**s) for s in data["sections"]])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+    if index is None:
+        index = GuidelinesIndex.parse(text)
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump({"sections": [asdict(s) for s in index.sections]}, f)
+            os.replace(tmp, path)
+    _indexes[key] = index
+    return index
@@ -0,0 +1,105 @@
+import os
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+from fnmatch import fnmatchcase
+
+from code_reviewer.diff import FileDiff, estimate_tokens, parse_diff
+
+IGNORE_FILE = ".code-reviewer-ignore"
+
+DEFAULT_IGNORE_PATTERNS = [
+    # Lockfiles
+    "*.lock",
+    "package-lock.json",
+    "npm-shrinkwrap.json",
+    "pnpm-lock.yaml",
+    "go.sum",
+    # Minified and generated code
+    "*.min.js",
+    "*.min.css",
+    "*.map",
+    "*_pb2.py",
+    "*_pb2_grpc.py",
+    "*.pb.go",
+    "*.generated.*",
+    # Snapshots
+    "*.snap",
+    "__snapshots__/*",
+    # Vendored and build output
+    "vendor/*",
+    "node_modules/*",
+    "third_party/*",
+    "dist/*",
+]
+
+BINARY_MARKERS = ("Binary files ", "GIT binary patch")
+
+
+@dataclass
+class FilterReport:
+    files: list[str] = field(default_factory=list)
+    bytes: int = 0
+    tokens: int = 0
+
+
+def load_patterns(path: str | None = None) -> list[str]:
+    """Built-in patterns followed by those in the ignore file, gitignore style.
+
+    Later patterns win, and a leading ``!`` re-includes a path, so the ignore
+    file can both add patterns and override the defaults.
+    """
+    path = path or os.environ.get("CODE_REVIEWER_IGNORE_FILE", IGNORE_FILE)
+    patterns = list(DEFAULT_IGNORE_PATTERNS)
+    try:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    patterns.append(line)
+    except FileNotFoundError:
+        pass
+    return patterns
+
+
+def _matches(path: str, pattern: str) -> bool:
+    # Unanchored patterns match at any directory depth, like .gitignore.
+    if pattern.endswith("/"):
+        pattern += "*"
+    if pattern.startswith("/"):
+        return fnmatchcase(path, pattern[1:])
+    parts = path.split("/")
+    return any(fnmatchcase("/".join(parts[i:]), pattern) for i in range(len(parts)))
+
+
+def is_ignored(path: str, patterns: list[str]) -> bool:
+    ignored = False
+    for pattern in patterns:
+        if pattern.startswith("!"):
+            if ignored and _matches(path, pattern[1:]):
+                ignored = False
+        elif not ignored and _matches(path, pattern):
+            ignored = True
+    return ignored
+
+
+def is_binary(file: FileDiff) -> bool:
+    return any(line.startswith(BINARY_MARKERS) for line in file.header)
+
+
+def filter_files(files: Iterable[FileDiff], patterns: list[str], report: FilterReport) -> Iterator[FileDiff]:
+    for file in files:
+        if file.path and (is_binary(file) or is_ignored(file.path, patterns)):
+            text = file.text
+            report.files.append(file.path)
+            report.bytes += len(text.encode())
+            report.tokens += estimate_tokens(text)
+            continue
+        yield file
+
+
+def filter_diff(diff: str, patterns: list[str]) -> tuple[str, FilterReport]:
+    report = FilterReport()
+    kept = [f.text for f in filter_files(parse_diff(diff.splitlines()), patterns, report)]
+    if not report.files:
+        return diff, report
+    return "\n".join(kept), report
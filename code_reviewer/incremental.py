@@ -0,0 +1,174 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+
+from code_reviewer.budget import Budget
+from code_reviewer.cache import cache_key
+from code_reviewer.diff import FileDiff, Hunk, parse_diff
+from code_reviewer.llm import _get_model, _get_provider, review
+from code_reviewer.output import ReviewComment
+from code_reviewer.prompt import build_system_prompt
+from code_reviewer.stats import Stats
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Unit:
+    file: FileDiff
+    hunk: Hunk | None
+    fingerprint: str
+
+    def contains(self, line: int) -> bool:
+        if self.hunk is None:
+            return False
+        return self.hunk.new_start <= line < self.hunk.new_start + max(self.hunk.new_count, 1)
+
+    def distance(self, line: int) -> int:
+        if self.hunk is None:
+            return 0
+        end = self.hunk.new_start + max(self.hunk.new_count, 1) - 1
+        return max(self.hunk.new_start - line, line - end, 0)
+
+
+def hunk_fingerprint(scope: str, path: str, hunk: Hunk | None, fallback: str = "") -> str:
+    body = "\n".join(hunk.lines) if hunk is not None else fallback
+    return hashlib.sha256(f"{scope}\0{path}\0{body}".encode()).hexdigest()
+
+
+def _units(files: list[FileDiff], scope: str) -> list[_Unit]:
+    units: list[_Unit] = []
+    for file in files:
+        if not file.hunks:
+            units.append(_Unit(file, None, hunk_fingerprint(scope, file.path, None, file.text)))
+        for hunk in file.hunks:
+            units.append(_Unit(file, hunk, hunk_fingerprint(scope, file.path, hunk)))
+    return units
+
+
+def _render(units: list[_Unit]) -> str:
+    parts: list[str] = []
+    current: FileDiff | None = None
+    for unit in units:
+        if unit.file is not current:
+            current = unit.file
+            parts.extend(current.header)
+        if unit.hunk is not None:
+            parts.append(unit.hunk.text)
+    return "\n".join(parts)
+
+
+def _attribute(units: list[_Unit], comment: ReviewComment) -> _Unit | None:
+    candidates = [u for u in units if u.file.path == comment.file]
+    if not candidates:
+        candidates = [u for u in units if not u.file.path]
+    if not candidates:
+        return None
+    if comment.line is None:
+        return candidates[0]
+    for unit in candidates:
+        if unit.contains(comment.line):
+            return unit
+    return min(candidates, key=lambda u: u.distance(comment.line))
+
+
+class HunkState:
+    """Review comments remembered per hunk fingerprint, stored as JSON.
+
+    Lines are kept relative to the start of their hunk in the new file so a
+    hunk that moved between revisions replays its comments in the right place.
+    """
+
+    def __init__(self, path: str | Path, hunks: dict[str, list[dict]] | None = None):
+        self.path = Path(path)
+        self.hunks = hunks or {}
+
+    @classmethod
+    def load(cls, path: str | Path) -> "HunkState":
+        try:
+            data = json.loads(Path(path).read_text())
+        except (OSError, ValueError):
+            return cls(path)
+        return cls(path, data.get("hunks", {}))
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"hunks": self.hunks}, f)
+        os.replace(tmp, self.path)
+
+    def replay(self, unit: _Unit) -> list[ReviewComment]:
+        comments: list[ReviewComment] = []
+        for item in self.hunks[unit.fingerprint]:
+            line = item["offset"]
+            if line is not None and unit.hunk is not None:
+                line += unit.hunk.new_start
+            comments.append(
+                ReviewComment(
+                    file=unit.file.path or item["file"],
+                    line=line,
+                    severity=item["severity"],
+                    comment=item["comment"],
+                )
+            )
+        return comments
+
+    def record(self, unit: _Unit, comments: list[ReviewComment]) -> None:
+        items: list[dict] = []
+        for c in comments:
+            offset = c.line
+            if offset is not None and unit.hunk is not None:
+                offset -= unit.hunk.new_start
+            items.append({"file": c.file, "offset": offset, "severity": c.severity, "comment": c.comment})
+        self.hunks[unit.fingerprint] = items
+
+
+def review_incremental(
+    diff: str,
+    state_path: str | Path,
+    context: str | None = None,
+    guidelines: str | None = None,
+    stats: Stats | None = None,
+    budget: Budget | None = None,
+) -> list[ReviewComment]:
+    provider = _get_provider()
+    scope = cache_key(provider, _get_model(provider), build_system_prompt(guidelines), "")
+    state = HunkState.load(state_path)
+    units = _units(list(parse_diff(diff.splitlines())), scope)
+    pending = [u for u in units if u.fingerprint not in state.hunks]
+    logger.info("Incremental review: %d of %d hunks unchanged", len(units) - len(pending), len(units))
+
+    by_unit: dict[str, list[ReviewComment]] = {u.fingerprint: [] for u in pending}
+    unattributed: list[ReviewComment] = []
+    if pending:
+        run = Stats()
+        for comment in review(_render(pending), context=context, guidelines=guidelines, stats=run, budget=budget):
+            unit = _attribute(pending, comment)
+            if unit is None:
+                unattributed.append(comment)
+            else:
+                by_unit[unit.fingerprint].append(comment)
+        if stats is not None:
+            stats += run
+        # Hunks the budget left out, or whose reply had no JSON array, stay pending for the next run.
+        skipped = set(budget.skipped if budget is not None else []) | set(run.unanswered)
+        for unit in pending:
+            if unit.file.path not in skipped:
+                state.record(unit, by_unit[unit.fingerprint])
+
+    comments: list[ReviewComment] = []
+    seen: set[str] = set()
+    for unit in units:
+        if unit.fingerprint in seen:
+            continue
+        seen.add(unit.fingerprint)
+        comments.extend(by_unit[unit.fingerprint] if unit.fingerprint in by_unit else state.replay(unit))
+
+    state.hunks = {fp: state.hunks[fp] for fp in seen if fp in state.hunks}
+    state.save()
+    return comments + unattributed
@@ -1,12 +1,42 @@
+import collections
+import itertools
 import json
+import logging
 import os
+import queue
 import re
+import threading
 import time
+import weakref
+from collections.abc import Awaitable, Callable, Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import TYPE_CHECKING
 
-from anthropic import Anthropic
-
+from code_reviewer.budget import Budget, BudgetExceeded
+from code_reviewer.cache import DEFAULT_MAX_BYTES, DEFAULT_TTL, ReviewCache, cache_key
+from code_reviewer.compact import CompactionReport, compact_diff
+from code_reviewer.diff import estimate_tokens, parse_diff, shard_files, split_diff
+from code_reviewer.failover import Race, Tier, acomplete_chain, complete_chain, stream_chain
+from code_reviewer.guidelines import GuidelinesIndex, load_index
+from code_reviewer.ignore import FilterReport, filter_diff, filter_files, load_patterns
 from code_reviewer.output import ReviewComment
-from code_reviewer.prompt import build_system_prompt, build_user_prompt
+from code_reviewer.parse import CommentStreamParser, comment_from_item
+from code_reviewer.prompt import CONTINUATION_PROMPT, build_system_prompt, build_user_prompt
+from code_reviewer.ratelimit import (
+    DEFAULT_MAX_IN_FLIGHT,
+    DEFAULT_MAX_RETRIES,
+    RateLimiter,
+    backoff,
+    is_retryable,
+    retry_after,
+)
+from code_reviewer.risk import order_by_risk
+from code_reviewer.stats import Stats, Usage
+from code_reviewer.triage import TRIAGE_SYSTEM_PROMPT, build_triage_batches, parse_triage_reply, select_hunks
+
+if TYPE_CHECKING:
+    import asyncio
 
 DEFAULT_MODELS = {
     "local": "llama3",
@@ -16,6 +46,34 @@ DEFAULT_MODELS = {
 
 DEFAULT_LOCAL_BASE_URL = "http://localhost:11434/v1"
 
+# Endpoints for providers used as fallbacks, which don't read CODE_REVIEWER_BASE_URL.
+DEFAULT_BASE_URLS = {
+    "local": DEFAULT_LOCAL_BASE_URL,
+    "openai": "https://api.openai.com/v1",
+}
+
+DEFAULT_CONTEXT_TOKENS = {
+    "local": 8192,
+    "openai": 128_000,
+    "anthropic": 200_000,
+}
+
+DEFAULT_SHARD_TOKENS = 8000
+DEFAULT_WORKERS = 8
+MIN_INPUT_TOKENS = 1024
+
+logger = logging.getLogger(__name__)
+
+_caches: dict[str, ReviewCache] = {}
+_limiters: dict[tuple, RateLimiter] = {}
+
+_clients: dict[tuple, object] = {}
+# Keyed by event loop; asyncio is imported lazily to keep CLI startup fast.
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[tuple, object]]" = (
+    weakref.WeakKeyDictionary()
+)
+_clients_lock = threading.Lock()
+
 
 def _get_provider() -> str:
     return os.environ.get("CODE_REVIEWER_PROVIDER", "local")
@@ -25,106 +83,1258 @@ def _get_model(provider: str) -> str:
     return os.environ.get("CODE_REVIEWER_MODEL", DEFAULT_MODELS.get(provider, ""))
 
 
-def _parse_comments(text: str) -> list[ReviewComment]:
+def _get_triage_provider() -> str | None:
+    return os.environ.get("CODE_REVIEWER_TRIAGE_PROVIDER") or None
+
+
+def _get_triage_model(provider: str) -> str:
+    return os.environ.get("CODE_REVIEWER_TRIAGE_MODEL", DEFAULT_MODELS.get(provider, ""))
+
+
+def _get_context_tokens(provider: str) -> int:
+    return int(os.environ.get("CODE_REVIEWER_CONTEXT_TOKENS", DEFAULT_CONTEXT_TOKENS.get(provider, 8192)))
+
+
+def _get_max_output_tokens() -> int:
+    return int(os.environ.get("CODE_REVIEWER_MAX_OUTPUT_TOKENS", MAX_OUTPUT_TOKENS))
+
+
+def _get_max_continuations() -> int:
+    return int(os.environ.get("CODE_REVIEWER_MAX_CONTINUATIONS", MAX_CONTINUATIONS))
+
+
+def _input_budget(provider: str, system: str, context: str | None) -> int:
+    """Tokens left for the diff once the prompt scaffolding and the reply are accounted for."""
+    overhead = estimate_tokens(system) + estimate_tokens(build_user_prompt("", context))
+    return max(MIN_INPUT_TOKENS, _get_context_tokens(provider) - _get_max_output_tokens() - overhead)
+
+
+def _get_shard_tokens() -> int:
+    return int(os.environ.get("CODE_REVIEWER_SHARD_TOKENS", DEFAULT_SHARD_TOKENS))
+
+
+def _get_workers() -> int:
+    return int(os.environ.get("CODE_REVIEWER_WORKERS", DEFAULT_WORKERS))
+
+
+def _get_cache() -> ReviewCache | None:
+    directory = os.environ.get("CODE_REVIEWER_CACHE_DIR")
+    if not directory:
+        return None
+    if directory not in _caches:
+        max_mb = float(os.environ.get("CODE_REVIEWER_CACHE_MAX_MB", DEFAULT_MAX_BYTES / 1024 / 1024))
+        ttl = float(os.environ.get("CODE_REVIEWER_CACHE_TTL", DEFAULT_TTL))
+        _caches[directory] = ReviewCache(directory, max_bytes=int(max_mb * 1024 * 1024), ttl=ttl)
+    return _caches[directory]
+
+
+def _get_max_retries() -> int:
+    return int(os.environ.get("CODE_REVIEWER_MAX_RETRIES", DEFAULT_MAX_RETRIES))
+
+
+def _get_limiter(provider: str) -> RateLimiter:
+    """The rate limiter shared by every request to ``provider`` in this process."""
+    key = (
+        provider,
+        float(os.environ.get("CODE_REVIEWER_RPM", 0)),
+        float(os.environ.get("CODE_REVIEWER_TPM", 0)),
+        int(os.environ.get("CODE_REVIEWER_MAX_IN_FLIGHT", DEFAULT_MAX_IN_FLIGHT)),
+    )
+    with _clients_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = RateLimiter(*key[1:])
+    return limiter
+
+
+def _client_key(provider: str, base_url: str | None, api_key: str | None) -> tuple:
+    if provider == "anthropic":
+        return ("anthropic", os.environ.get("ANTHROPIC_BASE_URL"), os.environ.get("ANTHROPIC_API_KEY"))
+    return ("openai", base_url, api_key)
+
+
+def _new_client(key: tuple, is_async: bool):
+    # Provider SDKs are slow to import, so only load the one being used.
+    kind, base_url, api_key = key
+    if kind == "anthropic":
+        from anthropic import Anthropic, AsyncAnthropic
+
+        cls = AsyncAnthropic if is_async else Anthropic
+    else:
+        from openai import AsyncOpenAI, OpenAI
+
+        cls = AsyncOpenAI if is_async else OpenAI
+    # Retries are scheduled by _complete so they respect the rate limiter.
+    return cls(base_url=base_url, api_key=api_key, max_retries=0)
+
+
+def _get_client(provider: str, base_url: str | None = None, api_key: str | None = None):
+    """Return a client shared by every call with the same provider, endpoint and key.
+
+    Reusing clients keeps their HTTP connection pools (keep-alive, TLS
+    sessions) warm across calls and threads.
+    """
+    key = _client_key(provider, base_url, api_key)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = _new_client(key, is_async=False)
+    return client
+
+
+def _get_async_client(provider: str, base_url: str | None = None, api_key: str | None = None):
+    import asyncio
+
+    # Async clients are bound to the event loop that created them.
+    loop = asyncio.get_running_loop()
+    key = _client_key(provider, base_url, api_key)
+    with _clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            client = clients[key] = _new_client(key, is_async=True)
+    return client
+
+
+def _json_array(text: str) -> list | None:
     match = re.search(r"\[.*\]", text, re.DOTALL)
     if not match:
-        return []
+        return None
+    try:
+        raw = json.loads(match.group())
+    except ValueError:
+        return None
+    return raw if isinstance(raw, list) else None
+
+
+def _parse_comments(text: str) -> list[ReviewComment]:
+    """Every complete comment in ``text``.
+
+    A reply that was cut off at the output limit, or is otherwise not valid
+    JSON, still yields each comment object that was fully written.
+    """
+    raw = _json_array(text)
+    if raw is None:
+        raw = CommentStreamParser().feed(text)
 
-    raw = json.loads(match.group())
     comments: list[ReviewComment] = []
     for item in raw:
-        comment_text = (
-            item.get("comment")
-            or item.get("message")
-            or item.get("description")
-            or item.get("text")
-            or ""
-        )
-        if not comment_text:
-            continue
-        comments.append(
-            ReviewComment(
-                file=item.get("file", "unknown"),
-                line=item.get("line"),
-                severity=item.get("severity", "suggestion"),
-                comment=comment_text,
-            )
-        )
+        comment = comment_from_item(item)
+        if comment is not None:
+            comments.append(comment)
     return comments
 
 
-def _call_openai(
-    system: str, user: str, model: str, base_url: str | None = None, api_key: str | None = None
-) -> str:
-    from openai import OpenAI
+@dataclass
+class Completion:
+    text: str
+    queued: float = 0.0  # seconds before generation started
+    generating: float = 0.0  # seconds spent producing the response
+    usage: Usage = field(default_factory=Usage)
+    truncated: bool = False  # generation stopped at the output token limit
+    throttled: float = 0.0  # seconds spent waiting on rate limits and retry backoff
+    provider: str = ""  # which provider of the chain served it
+
+
+def _openai_usage(usage) -> Usage:
+    if usage is None:
+        return Usage()
+    details = getattr(usage, "prompt_tokens_details", None)
+    return Usage(
+        input_tokens=int(usage.prompt_tokens or 0),
+        cached_tokens=int(getattr(details, "cached_tokens", 0) or 0),
+        output_tokens=int(usage.completion_tokens or 0),
+    )
+
+
+def _anthropic_usage(usage) -> Usage:
+    # Anthropic reports cache reads and writes separately from uncached input.
+    cached = int(getattr(usage, "cache_read_input_tokens", 0) or 0)
+    written = int(getattr(usage, "cache_creation_input_tokens", 0) or 0)
+    return Usage(
+        input_tokens=int(usage.input_tokens or 0) + cached + written,
+        cached_tokens=cached,
+        output_tokens=int(usage.output_tokens or 0),
+    )
 
-    client = OpenAI(base_url=base_url, api_key=api_key)
+
+def _anthropic_system(system: str) -> list[dict]:
+    """Send the system prompt as a cacheable prefix.
+
+    The system prompt (base instructions plus guidelines) is identical across
+    shards and reruns, so the provider can skip re-processing it.
+    """
+    return [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
+
+
+def _messages(user: str, previous: str | None = None) -> list[dict]:
+    """The conversation for a review, continued after ``previous`` if it was cut off."""
+    messages = [{"role": "user", "content": user}]
+    if previous is not None:
+        messages.append({"role": "assistant", "content": previous})
+        messages.append({"role": "user", "content": CONTINUATION_PROMPT})
+    return messages
+
+
+def _call_openai(
+    system: str,
+    user: str,
+    model: str,
+    base_url: str | None = None,
+    api_key: str | None = None,
+    previous: str | None = None,
+) -> Completion:
+    client = _get_client("openai", base_url, api_key)
+    start = time.monotonic()
     response = client.chat.completions.create(
+        model=model,
+        messages=[{"role": "system", "content": system}, *_messages(user, previous)],
+    )
+    return Completion(
+        text=response.choices[0].message.content or "",
+        generating=time.monotonic() - start,
+        usage=_openai_usage(response.usage),
+        truncated=response.choices[0].finish_reason == "length",
+    )
+
+
+BATCH_POLL_INITIAL = 1.0
+BATCH_POLL_MAX = 30.0
+BATCH_MAX_WAIT = 600
+MAX_OUTPUT_TOKENS = 4096
+MAX_CONTINUATIONS = 2
+
+MODES = ("interactive", "batch")
+
+
+def _get_mode() -> str:
+    mode = os.environ.get("CODE_REVIEWER_MODE", "interactive")
+    if mode not in MODES:
+        raise ValueError(f"Unknown CODE_REVIEWER_MODE {mode!r}; expected one of {', '.join(MODES)}")
+    return mode
+
+
+def _poll_delays(max_wait: float) -> Iterator[float]:
+    """Exponentially growing sleeps between batch status checks, up to ``max_wait`` in total."""
+    delay, elapsed = BATCH_POLL_INITIAL, 0.0
+    while elapsed < max_wait:
+        step = min(delay, max_wait - elapsed)
+        yield step
+        elapsed += step
+        delay = min(delay * 2, BATCH_POLL_MAX)
+
+
+def _call_anthropic_messages(system: str, user: str, model: str, previous: str | None = None) -> Completion:
+    client = _get_client("anthropic")
+    start = time.monotonic()
+    first_token: float | None = None
+    chunks: list[str] = []
+    with client.messages.stream(
+        model=model,
+        max_tokens=_get_max_output_tokens(),
+        system=_anthropic_system(system),
+        messages=_messages(user, previous),
+    ) as stream:
+        for chunk in stream.text_stream:
+            if first_token is None:
+                first_token = time.monotonic()
+            chunks.append(chunk)
+        message = stream.get_final_message()
+    end = time.monotonic()
+    if first_token is None:
+        first_token = end
+    return Completion(
+        text="".join(chunks),
+        queued=first_token - start,
+        generating=end - first_token,
+        usage=_anthropic_usage(message.usage),
+        truncated=message.stop_reason == "max_tokens",
+    )
+
+
+def _batch_request(system: str, user: str, model: str, previous: str | None = None) -> dict:
+    return {
+        "custom_id": "review",
+        "params": {
+            "model": model,
+            "max_tokens": _get_max_output_tokens(),
+            "system": _anthropic_system(system),
+            "messages": _messages(user, previous),
+        },
+    }
+
+
+def _batch_completion(batch_id: str, results, start: float) -> Completion:
+    # Batch results carry no timing, so the whole turnaround is reported as queued.
+    for result in results:
+        if result.result.type == "succeeded":
+            message = result.result.message
+            return Completion(
+                text=message.content[0].text,
+                queued=time.monotonic() - start,
+                usage=_anthropic_usage(message.usage),
+                truncated=message.stop_reason == "max_tokens",
+            )
+        raise RuntimeError(f"Batch request failed: {result.result.type}")
+
+    raise RuntimeError(f"Batch {batch_id} returned no results")
+
+
+def _retrying(provider: str, fn: Callable, *args):
+    """``fn(*args)``, retrying rate-limit, overload and connection errors on their own.
+
+    For requests that must not be repeated along with what came before them,
+    like polling a batch that has already been submitted.
+    """
+    attempt = 0
+    while True:
+        try:
+            return fn(*args)
+        except Exception as e:
+            delay = _retry_delay(provider, e, attempt)
+            if delay is None:
+                raise
+            attempt += 1
+            time.sleep(delay)
+
+
+async def _aretrying(provider: str, fn: Callable, *args):
+    """Async variant of :func:`_retrying` for a coroutine function ``fn``."""
+    import asyncio
+
+    attempt = 0
+    while True:
+        try:
+            return await fn(*args)
+        except Exception as e:
+            delay = _retry_delay(provider, e, attempt)
+            if delay is None:
+                raise
+            attempt += 1
+            await asyncio.sleep(delay)
+
+
+class BatchPollError(RuntimeError):
+    """Polling a submitted batch failed for good. Not retryable, so the batch isn't submitted twice."""
+
+
+def _call_anthropic_batch(system: str, user: str, model: str, previous: str | None = None) -> Completion:
+    client = _get_client("anthropic")
+    start = time.monotonic()
+    # Only creating the batch is retried by _complete, as a unit.
+    batch = client.messages.batches.create(requests=[_batch_request(system, user, model, previous)])
+
+    try:
+        delays = _poll_delays(BATCH_MAX_WAIT)
+        while True:
+            batch = _retrying("anthropic", client.messages.batches.retrieve, batch.id)
+            if batch.processing_status == "ended":
+                break
+            delay = next(delays, None)
+            if delay is None:
+                raise TimeoutError(f"Batch {batch.id} did not complete within {BATCH_MAX_WAIT}s")
+            time.sleep(delay)
+        results = _retrying("anthropic", lambda: list(client.messages.batches.results(batch.id)))
+    except TimeoutError:
+        raise
+    except Exception as e:
+        raise BatchPollError(f"Polling batch {batch.id} failed: {e}") from e
+    return _batch_completion(batch.id, results, start)
+
+
+def _call_anthropic(system: str, user: str, model: str, previous: str | None = None) -> Completion:
+    if _get_mode() == "batch":
+        return _call_anthropic_batch(system, user, model, previous)
+    return _call_anthropic_messages(system, user, model, previous)
+
+
+def _openai_endpoint(provider: str) -> tuple[str | None, str | None]:
+    if provider == "openai":
+        return os.environ.get("CODE_REVIEWER_BASE_URL"), os.environ.get("OPENAI_API_KEY")
+    return os.environ.get("CODE_REVIEWER_BASE_URL", DEFAULT_LOCAL_BASE_URL), "not-needed"
+
+
+def _log_completion(provider: str, model: str, completion: Completion) -> None:
+    usage = completion.usage
+    logger.info(
+        "%s (%s): %.2fs queued, %.2fs generating, %d input tokens (%d cached), %d output tokens",
+        provider,
+        model,
+        completion.queued,
+        completion.generating,
+        usage.input_tokens,
+        usage.cached_tokens,
+        usage.output_tokens,
+    )
+
+
+def _request_tokens(system: str, user: str, previous: str | None) -> int:
+    return estimate_tokens(system) + estimate_tokens(user) + (estimate_tokens(previous) if previous else 0)
+
+
+def _retry_delay(provider: str, error: Exception, attempt: int) -> float | None:
+    """How long to wait before retrying after ``error``, or None to give up."""
+    max_retries = _get_max_retries()
+    if attempt >= max_retries or not is_retryable(error):
+        return None
+    delay = backoff(attempt, retry_after(error))
+    logger.warning("%s request failed (%s); retry %d of %d in %.1fs", provider, error, attempt + 1, max_retries, delay)
+    return delay
+
+
+def _call(
+    provider: str, model: str, system: str, user: str, previous: str | None, base_url: str | None = None
+) -> Completion:
+    if provider == "anthropic":
+        return _call_anthropic(system, user, model, previous)
+    # openai, local
+    default_url, api_key = _openai_endpoint(provider)
+    return _call_openai(system, user, model, base_url=base_url or default_url, api_key=api_key, previous=previous)
+
+
+def _complete(
+    provider: str,
+    model: str,
+    system: str,
+    user: str,
+    previous: str | None = None,
+    base_url: str | None = None,
+) -> Completion:
+    """Call the provider within its rate limits, retrying rate-limit, overload and connection errors.
+
+    ``base_url`` overrides the configured endpoint of the openai and local providers.
+    """
+    limiter = _get_limiter(provider)
+    tokens = _request_tokens(system, user, previous)
+    attempt = 0
+    throttled = 0.0
+    while True:
+        wait = limiter.reserve(tokens)
+        if wait:
+            time.sleep(wait)
+            throttled += wait
+        try:
+            with limiter.slot():
+                completion = _call(provider, model, system, user, previous, base_url)
+        except Exception as e:
+            delay = _retry_delay(provider, e, attempt)
+            if delay is None:
+                raise
+            attempt += 1
+            time.sleep(delay)
+            throttled += delay
+            continue
+        completion.throttled = throttled
+        _log_completion(provider, model, completion)
+        return completion
+
+
+def _stream_openai(
+    system: str,
+    user: str,
+    model: str,
+    base_url: str | None = None,
+    api_key: str | None = None,
+    timeout: float | None = None,
+) -> Iterator[str | Usage]:
+    client = _get_client("openai", base_url, api_key)
+    # None would turn the client's own timeout off rather than keep it.
+    extra = {} if timeout is None else {"timeout": timeout}
+    stream = client.chat.completions.create(
         model=model,
         messages=[
             {"role": "system", "content": system},
             {"role": "user", "content": user},
         ],
+        stream=True,
+        stream_options={"include_usage": True},
+        **extra,
     )
-    return response.choices[0].message.content or ""
+    # Usage comes last, on a chunk of its own with no choices.
+    usage = None
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+        if getattr(chunk, "usage", None) is not None:
+            usage = chunk.usage
+    if usage is not None:
+        yield _openai_usage(usage)
 
 
-BATCH_POLL_INTERVAL = 10
-BATCH_MAX_WAIT = 600
+def _stream_anthropic(system: str, user: str, model: str, timeout: float | None = None) -> Iterator[str | Usage]:
+    if _get_mode() == "batch":
+        completion = _call_anthropic_batch(system, user, model)
+        yield completion.text
+        yield completion.usage
+        return
+
+    client = _get_client("anthropic")
+    extra = {} if timeout is None else {"timeout": timeout}
+    with client.messages.stream(
+        model=model,
+        max_tokens=_get_max_output_tokens(),
+        system=_anthropic_system(system),
+        messages=[{"role": "user", "content": user}],
+        **extra,
+    ) as stream:
+        yield from stream.text_stream
+        yield _anthropic_usage(stream.get_final_message().usage)
 
 
-def _call_anthropic(system: str, user: str, model: str) -> str:
-    client = Anthropic()
-    batch = client.messages.batches.create(
-        requests=[
-            {
-                "custom_id": "review",
-                "params": {
-                    "model": model,
-                    "max_tokens": 4096,
-                    "system": system,
-                    "messages": [{"role": "user", "content": user}],
-                },
-            }
-        ]
-    )
-
-    elapsed = 0
-    while elapsed < BATCH_MAX_WAIT:
-        batch = client.messages.batches.retrieve(batch.id)
-        if batch.processing_status == "ended":
-            break
-        time.sleep(BATCH_POLL_INTERVAL)
-        elapsed += BATCH_POLL_INTERVAL
-    else:
-        raise TimeoutError(f"Batch {batch.id} did not complete within {BATCH_MAX_WAIT}s")
+def _open_stream(
+    provider: str, model: str, system: str, user: str, base_url: str | None = None, timeout: float | None = None
+) -> Iterator[str | Usage]:
+    """The reply's text in chunks, followed by its :class:`Usage` if the provider reports it."""
+    extra = {} if timeout is None else {"timeout": timeout}
+    if provider == "anthropic":
+        return _stream_anthropic(system, user, model, **extra)
+    default_url, api_key = _openai_endpoint(provider)
+    return _stream_openai(system, user, model, base_url=base_url or default_url, api_key=api_key, **extra)
 
-    for result in client.messages.batches.results(batch.id):
-        if result.result.type == "succeeded":
-            return result.result.message.content[0].text
-        raise RuntimeError(f"Batch request failed: {result.result.type}")
 
-    raise RuntimeError(f"Batch {batch.id} returned no results")
+def _stream(
+    provider: str, model: str, system: str, user: str, base_url: str | None = None, deadline: float | None = None
+) -> Iterator[str | Usage]:
+    # Only a stream that failed before producing any text can be retried.
+    # Each attempt times out at the ``deadline``, so one whose first chunk never comes can't hang the run.
+    limiter = _get_limiter(provider)
+    tokens = _request_tokens(system, user, None)
+    attempt = 0
+    while True:
+        wait = limiter.reserve(tokens)
+        if wait:
+            time.sleep(wait)
+        timeout = None
+        if deadline is not None:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                raise BudgetExceeded("The time budget ran out before the stream started")
+        started = False
+        try:
+            with limiter.slot():
+                for chunk in _open_stream(provider, model, system, user, base_url, timeout):
+                    started = True
+                    yield chunk
+            return
+        except Exception as e:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise BudgetExceeded(f"The time budget ran out while streaming: {e}") from e
+            delay = None if started else _retry_delay(provider, e, attempt)
+            if delay is None:
+                raise
+            attempt += 1
+            time.sleep(delay)
+
+
+async def _acall_openai(
+    system: str,
+    user: str,
+    model: str,
+    base_url: str | None = None,
+    api_key: str | None = None,
+    previous: str | None = None,
+) -> Completion:
+    client = _get_async_client("openai", base_url, api_key)
+    start = time.monotonic()
+    response = await client.chat.completions.create(
+        model=model,
+        messages=[{"role": "system", "content": system}, *_messages(user, previous)],
+    )
+    return Completion(
+        text=response.choices[0].message.content or "",
+        generating=time.monotonic() - start,
+        usage=_openai_usage(response.usage),
+        truncated=response.choices[0].finish_reason == "length",
+    )
+
+
+async def _acall_anthropic_messages(
+    system: str, user: str, model: str, previous: str | None = None
+) -> Completion:
+    client = _get_async_client("anthropic")
+    start = time.monotonic()
+    first_token: float | None = None
+    chunks: list[str] = []
+    async with client.messages.stream(
+        model=model,
+        max_tokens=_get_max_output_tokens(),
+        system=_anthropic_system(system),
+        messages=_messages(user, previous),
+    ) as stream:
+        async for chunk in stream.text_stream:
+            if first_token is None:
+                first_token = time.monotonic()
+            chunks.append(chunk)
+        message = await stream.get_final_message()
+    end = time.monotonic()
+    if first_token is None:
+        first_token = end
+    return Completion(
+        text="".join(chunks),
+        queued=first_token - start,
+        generating=end - first_token,
+        usage=_anthropic_usage(message.usage),
+        truncated=message.stop_reason == "max_tokens",
+    )
+
+
+async def _acall_anthropic_batch(
+    system: str, user: str, model: str, previous: str | None = None
+) -> Completion:
+    import asyncio
+
+    client = _get_async_client("anthropic")
+    start = time.monotonic()
+    batch = await client.messages.batches.create(requests=[_batch_request(system, user, model, previous)])
+
+    async def results(batch_id: str) -> list:
+        return [result async for result in await client.messages.batches.results(batch_id)]
+
+    try:
+        delays = _poll_delays(BATCH_MAX_WAIT)
+        while True:
+            batch = await _aretrying("anthropic", client.messages.batches.retrieve, batch.id)
+            if batch.processing_status == "ended":
+                break
+            delay = next(delays, None)
+            if delay is None:
+                raise TimeoutError(f"Batch {batch.id} did not complete within {BATCH_MAX_WAIT}s")
+            await asyncio.sleep(delay)
+        collected = await _aretrying("anthropic", results, batch.id)
+    except TimeoutError:
+        raise
+    except Exception as e:
+        raise BatchPollError(f"Polling batch {batch.id} failed: {e}") from e
+    return _batch_completion(batch.id, collected, start)
+
+
+async def _acall(
+    provider: str, model: str, system: str, user: str, previous: str | None, base_url: str | None = None
+) -> Completion:
+    if provider == "anthropic":
+        if _get_mode() == "batch":
+            return await _acall_anthropic_batch(system, user, model, previous)
+        return await _acall_anthropic_messages(system, user, model, previous)
+    # openai, local
+    default_url, api_key = _openai_endpoint(provider)
+    return await _acall_openai(
+        system, user, model, base_url=base_url or default_url, api_key=api_key, previous=previous
+    )
+
+
+async def _acomplete(
+    provider: str,
+    model: str,
+    system: str,
+    user: str,
+    previous: str | None = None,
+    base_url: str | None = None,
+) -> Completion:
+    import asyncio
+
+    limiter = _get_limiter(provider)
+    tokens = _request_tokens(system, user, previous)
+    attempt = 0
+    throttled = 0.0
+    while True:
+        wait = limiter.reserve(tokens)
+        if wait:
+            await asyncio.sleep(wait)
+            throttled += wait
+        try:
+            async with limiter.aslot():
+                completion = await _acall(provider, model, system, user, previous, base_url)
+        except Exception as e:
+            delay = _retry_delay(provider, e, attempt)
+            if delay is None:
+                raise
+            attempt += 1
+            await asyncio.sleep(delay)
+            throttled += delay
+            continue
+        completion.throttled = throttled
+        _log_completion(provider, model, completion)
+        return completion
+
+
+def _get_chain() -> list[Tier]:
+    """The primary provider followed by those in CODE_REVIEWER_FALLBACK.
+
+    Fallbacks are written ``provider`` or ``provider:model``, comma-separated.
+    They use their provider's default model and endpoint, since
+    CODE_REVIEWER_MODEL and CODE_REVIEWER_BASE_URL describe the primary.
+    """
+    provider = _get_provider()
+    chain = [Tier(provider, _get_model(provider))]
+    for entry in os.environ.get("CODE_REVIEWER_FALLBACK", "").split(","):
+        name, _, model = entry.strip().partition(":")
+        if not name:
+            continue
+        if name not in DEFAULT_MODELS:
+            raise ValueError(
+                f"Unknown provider {name!r} in CODE_REVIEWER_FALLBACK; expected one of {', '.join(DEFAULT_MODELS)}"
+            )
+        chain.append(Tier(name, model or DEFAULT_MODELS[name], DEFAULT_BASE_URLS.get(name)))
+    return chain
+
+
+def _get_attempt_timeout() -> float:
+    return float(os.environ.get("CODE_REVIEWER_ATTEMPT_TIMEOUT", 0))
+
+
+def _get_hedge_after() -> float:
+    return float(os.environ.get("CODE_REVIEWER_HEDGE_AFTER", 0))
+
+
+def _usable(completion: Completion) -> bool:
+    # A cut-off reply is still worth continuing.
+    return completion.truncated or _json_array(completion.text) is not None
+
+
+def _race(chain: list[Tier], deadline: float | None) -> Race:
+    return Race(chain, _usable, deadline, timeout=_get_attempt_timeout(), hedge=_get_hedge_after())
+
+
+def _complete_chain(
+    chain: list[Tier], system: str, user: str, previous: str | None = None, deadline: float | None = None
+) -> Completion:
+    """Complete with the first tier of ``chain`` to give a valid reply in time; see :class:`Race`."""
+    return complete_chain(
+        _race(chain, deadline), lambda tier: _complete(tier.provider, tier.model, system, user, previous, tier.base_url)
+    )
+
+
+async def _acomplete_chain(
+    chain: list[Tier], system: str, user: str, previous: str | None = None, deadline: float | None = None
+) -> Completion:
+    def attempt(tier: Tier) -> Awaitable[Completion]:
+        return _acomplete(tier.provider, tier.model, system, user, previous, tier.base_url)
+
+    return await acomplete_chain(_race(chain, deadline), attempt)
+
+
+def _stream_chain(
+    chain: list[Tier], system: str, user: str, reply: Completion, deadline: float | None = None
+) -> Iterator[str]:
+    return stream_chain(
+        chain, lambda tier: _stream(tier.provider, tier.model, system, user, tier.base_url, deadline), reply
+    )
+
+
+def _map_ahead(
+    fn: Callable[[str], list[ReviewComment]], items: Iterable[str], workers: int
+) -> Iterator[list[ReviewComment]]:
+    """Like ``ThreadPoolExecutor.map``, but takes the next item only when a worker is free.
+
+    ``pool.map`` consumes its whole input up front, which would read a streamed
+    diff into memory before the first request is sent.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending: collections.deque[Future[list[ReviewComment]]] = collections.deque()
+        for item in items:
+            if len(pending) >= workers:
+                yield pending.popleft().result()
+            pending.append(pool.submit(fn, item))
+        while pending:
+            yield pending.popleft().result()
+
+
+@dataclass
+class _Prompt:
+    system: str
+    user: str
+    paths: list[str] = field(default_factory=list)  # the files in its shard
+
+
+@dataclass
+class _Plan:
+    provider: str
+    model: str
+    prompts: Iterator[_Prompt]
+    cache: ReviewCache | None
+    chain: list[Tier] = field(default_factory=list)
+    stats: Stats = field(default_factory=Stats)
+    budget: Budget | None = None
+
+    @property
+    def deadline(self) -> float | None:
+        return self.budget.deadline if self.budget is not None else None
+
+    def reserve(self, prompt: _Prompt, previous: str | None = None) -> int:
+        tokens = _request_tokens(prompt.system, prompt.user, previous)
+        if self.budget is not None and not self.budget.reserve(tokens):
+            raise BudgetExceeded(f"No {self.budget.reason} left")
+        return tokens
+
+    def complete(self, prompt: _Prompt, previous: str | None = None) -> Completion:
+        """Send ``prompt`` down the chain, raising :class:`BudgetExceeded` once the budget is spent."""
+        reserved = self.reserve(prompt, previous)
+        completion = _complete_chain(self.chain, prompt.system, prompt.user, previous, self.deadline)
+        self.record(completion, reserved)
+        return completion
+
+    async def acomplete(self, prompt: _Prompt, previous: str | None = None) -> Completion:
+        reserved = self.reserve(prompt, previous)
+        completion = await _acomplete_chain(self.chain, prompt.system, prompt.user, previous, self.deadline)
+        self.record(completion, reserved)
+        return completion
+
+    def skip(self, prompt: _Prompt) -> None:
+        logger.debug("Out of budget; skipping %s", ", ".join(prompt.paths))
+        self.budget.skip(prompt.paths)
+
+    def lookup(self, prompt: _Prompt) -> list[ReviewComment] | None:
+        if self.cache is None:
+            return None
+        return self.cache.get(cache_key(self.provider, self.model, prompt.system, prompt.user))
+
+    def store(self, prompt: _Prompt, comments: list[ReviewComment], providers: Iterable[str]) -> None:
+        """Cache ``comments`` if the primary provider served every request behind them.
+
+        Entries are keyed by the primary provider and model, so a fallback's
+        reply would otherwise be served later as the primary's own.
+        """
+        if self.cache is not None and set(providers) == {self.provider}:
+            self.cache.put(cache_key(self.provider, self.model, prompt.system, prompt.user), comments)
+
+    def record(self, completion: Completion, reserved: int = 0) -> None:
+        if self.budget is not None:
+            # Settle the reservation with what was really used, estimated when the provider doesn't say.
+            used = completion.usage.input_tokens + completion.usage.output_tokens
+            self.budget.charge(used - reserved if used else estimate_tokens(completion.text))
+        self.stats.add_request(completion.usage, completion.provider)
+        self.stats.add("throttle", completion.throttled)
+        self.stats.add("queued", completion.queued)
+        self.stats.add("generating", completion.generating)
+
+    def parse(self, text: str) -> list[ReviewComment]:
+        with self.stats.timer("parse"):
+            return _parse_comments(text)
+
+    def finish(self, stats: Stats | None) -> None:
+        self.log_summary()
+        if stats is not None:
+            stats += self.stats
+
+    def continuation(self, completion: Completion, comments: list[ReviewComment], attempt: int) -> str | None:
+        """What to replay as the assistant turn when asking for the rest of a cut-off reply.
+
+        Only complete comments are replayed, so the model never has to pick up
+        mid-token, and a reply that stays truncated can be continued again.
+        """
+        if not completion.truncated:
+            return None
+        if attempt >= _get_max_continuations():
+            logger.warning("Reply still truncated after %d continuations; keeping %d comments", attempt, len(comments))
+            return None
+        logger.info("Reply hit the output token limit after %d comments; asking for the rest", len(comments))
+        return json.dumps([asdict(c) for c in comments])
+
+    def log_summary(self) -> None:
+        if self.budget is not None and self.budget.reason:
+            logger.info("Stopped at the %s; skipped %d files", self.budget.reason, len(self.budget.skipped))
+        if self.cache is not None:
+            logger.info("Review cache: %d hits, %d misses", self.cache.hits, self.cache.misses)
+        if self.stats.served:
+            logger.info("Served by: %s", ", ".join(f"{p} {n}" for p, n in sorted(self.stats.served.items())))
+        usage = self.stats.usage
+        if usage.input_tokens:
+            logger.info(
+                "Tokens: %d input (%d cached, %d uncached), %d output",
+                usage.input_tokens,
+                usage.cached_tokens,
+                usage.input_tokens - usage.cached_tokens,
+                usage.output_tokens,
+            )
+
+
+def _triage(diff: str, context: str | None, stats: Stats, budget: Budget | None = None) -> str:
+    """``diff`` reduced to the hunks the triage model says need review.
+
+    Hunks in a triage request that fails or gets an unreadable reply are all
+    escalated, so triage can only ever save work, never lose it. That includes
+    requests still waiting when ``budget`` runs out of time; their tokens are
+    charged to it like the review's.
+    """
+    start = time.monotonic()
+    provider = _get_triage_provider()
+    model = _get_triage_model(provider)
+    # Like a fallback, triage has its own endpoint: CODE_REVIEWER_BASE_URL describes the primary.
+    base_url = os.environ.get("CODE_REVIEWER_TRIAGE_BASE_URL") or DEFAULT_BASE_URLS.get(provider)
+    files = list(parse_diff(diff.splitlines()))
+    # CODE_REVIEWER_CONTEXT_TOKENS describes the review model, not this one.
+    window = DEFAULT_CONTEXT_TOKENS.get(provider, 8192)
+    overhead = estimate_tokens(TRIAGE_SYSTEM_PROMPT) + _get_max_output_tokens()
+    max_tokens = max(MIN_INPUT_TOKENS, min(_get_shard_tokens(), window - overhead))
+    batches, escalated = build_triage_batches(files, context, max_tokens)
+    chain = [Tier(provider, model, base_url)]
+    deadline = budget.deadline if budget is not None else None
+
+    def triage_batch(numbers: list[int], prompt: str) -> set[int]:
+        try:
+            completion = _complete_chain(chain, TRIAGE_SYSTEM_PROMPT, prompt, deadline=deadline)
+        except Exception as e:
+            logger.warning("Triage request failed (%s); escalating its %d hunks", e, len(numbers))
+            return set(numbers)
+        if budget is not None:
+            used = completion.usage.input_tokens + completion.usage.output_tokens
+            budget.charge(used or _request_tokens(TRIAGE_SYSTEM_PROMPT, prompt, None) + estimate_tokens(completion.text))
+        stats.add_request(completion.usage)
+        flagged = parse_triage_reply(completion.text)
+        if flagged is None:
+            logger.warning("Unreadable triage reply; escalating its %d hunks", len(numbers))
+            return set(numbers)
+        return flagged & set(numbers)
+
+    workers = max(1, min(_get_workers(), len(batches)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for flagged in pool.map(lambda batch: triage_batch(batch.numbers, batch.prompt), batches):
+            escalated |= flagged
+
+    diff, report = select_hunks(files, escalated)
+    logger.info(
+        "Triage (%s, %s) escalated %d of %d hunks (~%d of ~%d tokens)",
+        provider,
+        model,
+        report.escalated,
+        report.hunks,
+        report.escalated_tokens,
+        report.tokens,
+    )
+    if report.skipped_files:
+        logger.info(
+            "Triage found nothing to review in %d files: %s", len(report.skipped_files), ", ".join(report.skipped_files)
+        )
+    stats.add("triage", time.monotonic() - start)
+    return diff
+
+
+def _prompts(
+    shards: Iterable[str],
+    provider: str,
+    budget: int,
+    context: str | None,
+    guidelines: GuidelinesIndex | None,
+    dropped: FilterReport,
+    stats: Stats,
+) -> Iterator[_Prompt]:
+    """Prompts for ``shards``, built one at a time as the review asks for them.
+
+    Each shard's system prompt carries only the guideline sections that apply
+    to the files it touches.
+    """
+    plain = build_system_prompt()
+    start = time.monotonic()
+    compaction = CompactionReport()
+    for shard in shards:
+        if not shard.strip():
+            continue
+        # Shards only exceed the budget when a single hunk is too big to split.
+        if estimate_tokens(shard) > budget:
+            shard, report = compact_diff(shard, budget)
+            compaction += report
+            if report.tokens_after > budget:
+                logger.warning(
+                    "Shard is still ~%d tokens after compaction, over the %d token budget for %s",
+                    report.tokens_after,
+                    budget,
+                    provider,
+                )
+            if not shard.strip():
+                # Every hunk was dropped, leaving nothing to review.
+                continue
+        paths = list(dict.fromkeys(file.path for file in parse_diff(shard.splitlines()) if file.path))
+        system = build_system_prompt(guidelines.select(paths)) if guidelines is not None else plain
+        prompt = _Prompt(system, build_user_prompt(shard, context), paths)
+        stats.add("prepare", time.monotonic() - start)
+        yield prompt
+        start = time.monotonic()
+
+    # Only known once a streamed diff has been read to the end.
+    if dropped.files:
+        logger.info(
+            "Skipped %d ignored or binary files (%d bytes, ~%d tokens): %s",
+            len(dropped.files),
+            dropped.bytes,
+            dropped.tokens,
+            ", ".join(dropped.files),
+        )
+    if compaction.compacted:
+        logger.info(
+            "Compacted diff from ~%d to ~%d tokens: dropped %d whitespace-only and "
+            "%d deletion-only hunks and %d context lines",
+            compaction.tokens_before,
+            compaction.tokens_after,
+            compaction.whitespace_hunks,
+            compaction.deletion_hunks,
+            compaction.context_lines,
+        )
+    stats.add("prepare", time.monotonic() - start)
+
+
+def _plan(
+    diff: str | Iterable[str], context: str | None, guidelines: str | None, budget: Budget | None = None
+) -> _Plan:
+    start = time.monotonic()
+    if budget is not None:
+        budget.start()
+    stats = Stats()
+    provider = _get_provider()
+    # Budgeted for every section, since a shard's files aren't known until it's packed.
+    input_budget = _input_budget(provider, build_system_prompt(guidelines), context)
+    index = load_index(guidelines, os.environ.get("CODE_REVIEWER_CACHE_DIR")) if guidelines else None
+    shard_tokens = min(_get_shard_tokens(), input_budget)
+    patterns = load_patterns()
+
+    if isinstance(diff, str):
+        diff, dropped = filter_diff(diff, patterns)
+    else:
+        dropped = FilterReport()
+        files = filter_files(parse_diff(diff), patterns, dropped)
+        if not _get_triage_provider() and budget is None:
+            # Read lazily: only the file being parsed and the shard being packed are held in memory.
+            shards: Iterable[str] = shard_files(files, shard_tokens)
+        else:
+            # Triage numbers every hunk up front, and risk ordering ranks every file, so both need the whole diff.
+            diff = "\n".join(file.text for file in files)
+    if isinstance(diff, str):
+        if _get_triage_provider() and diff.strip():
+            diff = _triage(diff, context, stats, budget)
+        if not diff.strip():
+            shards = []
+        elif budget is not None:
+            # Riskiest files first, so a budget that runs out cuts the least important ones.
+            shards = shard_files(order_by_risk(parse_diff(diff.splitlines())), shard_tokens)
+        else:
+            shards = split_diff(diff, shard_tokens)
+
+    chain = _get_chain()
+    plan = _Plan(
+        provider=provider,
+        model=chain[0].model,
+        prompts=_prompts(shards, provider, input_budget, context, index, dropped, stats),
+        cache=_get_cache(),
+        chain=chain,
+        stats=stats,
+        budget=budget,
+    )
+    stats.add("prepare", time.monotonic() - start - stats.seconds.get("triage", 0.0))
+    return plan
 
 
 def review(
     diff: str,
     context: str | None = None,
     guidelines: str | None = None,
+    stats: Stats | None = None,
+    budget: Budget | None = None,
 ) -> list[ReviewComment]:
-    provider = _get_provider()
-    model = _get_model(provider)
-    system = build_system_prompt(guidelines)
-    user = build_user_prompt(diff, context)
+    """Review ``diff``, adding stage timings and token usage to ``stats`` if given.
 
-    if provider == "anthropic":
-        raw = _call_anthropic(system, user, model)
-    elif provider == "openai":
-        api_key = os.environ.get("OPENAI_API_KEY")
-        base_url = os.environ.get("CODE_REVIEWER_BASE_URL")
-        raw = _call_openai(system, user, model, base_url=base_url, api_key=api_key)
-    else:  # local
-        base_url = os.environ.get("CODE_REVIEWER_BASE_URL", DEFAULT_LOCAL_BASE_URL)
-        raw = _call_openai(system, user, model, base_url=base_url, api_key="not-needed")
-
-    return _parse_comments(raw)
+    ``diff`` may also be an iterable of lines, such as an open file, which is
+    read only as far as the shards under review need.
+
+    With a ``budget``, the riskiest files are reviewed first and the run stops
+    once it's spent: the comments found so far are returned, and the files
+    not reviewed are listed in ``budget.skipped``.
+    """
+    plan = _plan(diff, context, guidelines, budget)
+
+    def review_shard(prompt: _Prompt) -> list[ReviewComment]:
+        comments = plan.lookup(prompt)
+        if comments is None:
+            comments = []
+            try:
+                completion = plan.complete(prompt)
+                comments = plan.parse(completion.text)
+                providers = [completion.provider]
+                attempt = 0
+                while (previous := plan.continuation(completion, comments, attempt)) is not None:
+                    attempt += 1
+                    completion = plan.complete(prompt, previous)
+                    comments += [c for c in plan.parse(completion.text) if c not in comments]
+                    providers.append(completion.provider)
+            except BudgetExceeded:
+                # Whatever was found before the budget ran out is kept, but not cached.
+                plan.skip(prompt)
+                return comments
+            # A reply without a JSON array, such as an apology, is worth asking for again.
+            if _json_array(completion.text) is None:
+                plan.stats.add_unanswered(prompt.paths)
+            else:
+                plan.store(prompt, comments, providers)
+        return comments
+
+    results = list(_map_ahead(review_shard, plan.prompts, max(1, _get_workers())))
+    if len(results) > 1:
+        logger.info("Reviewed diff in %d shards", len(results))
+
+    comments = [comment for shard in results for comment in shard]
+    plan.stats.comments = len(comments)
+    plan.finish(stats)
+    return comments
+
+
+async def areview(
+    diff: str,
+    context: str | None = None,
+    guidelines: str | None = None,
+    stats: Stats | None = None,
+    budget: Budget | None = None,
+) -> list[ReviewComment]:
+    """Async variant of :func:`review` built on the SDKs' async clients."""
+    import asyncio
+
+    # In a thread, since triage makes blocking requests.
+    plan = await asyncio.to_thread(_plan, diff, context, guidelines, budget)
+    limit = asyncio.Semaphore(max(1, _get_workers()))
+
+    async def review_shard(prompt: _Prompt) -> list[ReviewComment]:
+        comments = plan.lookup(prompt)
+        if comments is None:
+            comments = []
+            try:
+                # The budget is checked once a slot is free, so shards waiting for one aren't all let through.
+                async with limit:
+                    completion = await plan.acomplete(prompt)
+                comments = plan.parse(completion.text)
+                providers = [completion.provider]
+                attempt = 0
+                while (previous := plan.continuation(completion, comments, attempt)) is not None:
+                    attempt += 1
+                    async with limit:
+                        completion = await plan.acomplete(prompt, previous)
+                    comments += [c for c in plan.parse(completion.text) if c not in comments]
+                    providers.append(completion.provider)
+            except BudgetExceeded:
+                plan.skip(prompt)
+                return comments
+            # A reply without a JSON array, such as an apology, is worth asking for again.
+            if _json_array(completion.text) is None:
+                plan.stats.add_unanswered(prompt.paths)
+            else:
+                plan.store(prompt, comments, providers)
+        return comments
+
+    prompts = await asyncio.to_thread(list, plan.prompts)
+    if len(prompts) > 1:
+        logger.info("Reviewing diff in %d shards", len(prompts))
+    results = await asyncio.gather(*(review_shard(prompt) for prompt in prompts))
+
+    comments = [comment for shard in results for comment in shard]
+    plan.stats.comments = len(comments)
+    plan.finish(stats)
+    return comments
+
+
+_SHARD_DONE = object()
+
+
+def review_stream(
+    diff: str,
+    context: str | None = None,
+    guidelines: str | None = None,
+    stats: Stats | None = None,
+    budget: Budget | None = None,
+) -> Iterator[ReviewComment]:
+    """Like :func:`review`, but yields each comment as soon as the model has finished writing it.
+
+    Shards are streamed concurrently, so comments arrive in completion order
+    rather than diff order. A time ``budget`` is checked as each chunk
+    arrives, and a stream that stalls is timed out at its deadline.
+    """
+    plan = _plan(diff, context, guidelines, budget)
+
+    def stream_shard(prompt: _Prompt) -> Iterator[ReviewComment]:
+        cached = plan.lookup(prompt)
+        if cached is not None:
+            yield from cached
+            return
+        try:
+            reserved = plan.reserve(prompt)
+        except BudgetExceeded:
+            plan.skip(prompt)
+            return
+        parser = CommentStreamParser()
+        comments: list[ReviewComment] = []
+        # Parsing overlaps generation, so the phases are timed here from the chunks.
+        start = time.monotonic()
+        first_chunk: float | None = None
+        reply = Completion("")
+        chunks: list[str] = []
+        cut = False
+        stream = _stream_chain(plan.chain, prompt.system, prompt.user, reply, plan.deadline)
+        try:
+            for chunk in stream:
+                if first_chunk is None:
+                    first_chunk = time.monotonic()
+                chunks.append(chunk)
+                for item in parser.feed(chunk):
+                    comment = comment_from_item(item)
+                    if comment is not None:
+                        comments.append(comment)
+                        yield comment
+                if plan.deadline is not None and time.monotonic() >= plan.deadline:
+                    stream.close()
+                    plan.skip(prompt)
+                    cut = True
+                    break
+        except BudgetExceeded:
+            plan.skip(prompt)
+            cut = True
+        end = time.monotonic()
+        reply.text = "".join(chunks)
+        reply.queued, reply.generating = (first_chunk or end) - start, end - (first_chunk or end)
+        plan.record(reply, reserved)
+        if not cut and not parser.closed:
+            plan.stats.add_unanswered(prompt.paths)
+        elif not cut:
+            plan.store(prompt, comments, [reply.provider])
+
+    results: queue.Queue = queue.Queue()
+
+    def run(prompt: _Prompt) -> None:
+        try:
+            for comment in stream_shard(prompt):
+                results.put(comment)
+        finally:
+            results.put(_SHARD_DONE)
+
+    emitted = 0
+    prompts = iter(plan.prompts)
+    ahead = list(itertools.islice(prompts, 2))
+    if len(ahead) <= 1:
+        # One shard streams in this thread, so the model's output is only read as fast as it's consumed.
+        for prompt in ahead:
+            for comment in stream_shard(prompt):
+                emitted += 1
+                yield comment
+        plan.stats.comments = emitted
+        plan.finish(stats)
+        return
+
+    # Shards are only prepared as workers free up, so a streamed diff is never read far ahead.
+    workers = max(1, _get_workers())
+    prompts = itertools.chain(ahead, prompts)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        running = 0
+        while True:
+            while running < workers and (prompt := next(prompts, None)) is not None:
+                futures.append(pool.submit(run, prompt))
+                running += 1
+            if not running:
+                break
+            item = results.get()
+            if item is _SHARD_DONE:
+                running -= 1
+            else:
+                emitted += 1
+                yield item
+        for future in futures:
+            future.result()
+    if len(futures) > 1:
+        logger.info("Streamed review of %d shards", len(futures))
+
+    plan.stats.comments = emitted
+    plan.finish(stats)
@@ -1,5 +1,8 @@
 import json
 from dataclasses import asdict, dataclass
+from typing import TextIO
+
+from code_reviewer.diff import INVALID, OLD, SNAPPED, Anchor
 
 
 @dataclass
@@ -17,16 +20,51 @@ SEVERITY_SYMBOLS = {
 }
 
 
-def format_plain(comments: list[ReviewComment]) -> str:
+# SARIF has no "suggestion" level; "note" is its lowest.
+SARIF_LEVELS = {
+    "error": "error",
+    "warning": "warning",
+    "suggestion": "note",
+}
+
+SARIF_SCHEMA = "https://json.schemastore.org/sarif-2.1.0.json"
+
+
+ANCHOR_NOTES = {
+    OLD: "old file",
+    INVALID: "not in diff",
+}
+
+
+def _record(comment: ReviewComment, anchor: Anchor | None) -> dict:
+    record = asdict(comment)
+    if anchor is not None:
+        record.update(line=anchor.line, side=anchor.side, position=anchor.position, status=anchor.status)
+        if anchor.status == SNAPPED:
+            record["original_line"] = comment.line
+    return record
+
+
+def _location(comment: ReviewComment, anchor: Anchor | None) -> str:
+    line = comment.line if anchor is None or anchor.line is None else anchor.line
+    location = comment.file if line is None else f"{comment.file}:{line}"
+    if anchor is None:
+        return location
+    if anchor.status == SNAPPED:
+        return f"{location} (moved from line {comment.line})"
+    if anchor.status in ANCHOR_NOTES:
+        return f"{location} ({ANCHOR_NOTES[anchor.status]})"
+    return location
+
+
+def format_plain(comments: list[ReviewComment], anchors: list[Anchor] | None = None) -> str:
     if not comments:
         return "No issues found."
 
     lines: list[str] = []
-    for c in comments:
+    for i, c in enumerate(comments):
         symbol = SEVERITY_SYMBOLS.get(c.severity, "?")
-        location = c.file
-        if c.line is not None:
-            location += f":{c.line}"
+        location = _location(c, anchors[i] if anchors else None)
         lines.append(f"  {symbol} [{c.severity}] {location}")
         lines.append(f"    {c.comment}")
         lines.append("")
@@ -34,5 +72,79 @@ def format_plain(comments: list[ReviewComment]) -> str:
     return "\n".join(lines).rstrip("\n")
 
 
-def format_json(comments: list[ReviewComment]) -> str:
-    return json.dumps([asdict(c) for c in comments], indent=2)
+def format_json(comments: list[ReviewComment], anchors: list[Anchor] | None = None) -> str:
+    return json.dumps([_record(c, anchors[i] if anchors else None) for i, c in enumerate(comments)], indent=2)
+
+
+def format_ndjson(comment: ReviewComment, anchor: Anchor | None = None) -> str:
+    return json.dumps(_record(comment, anchor))
+
+
+class NdjsonWriter:
+    """Writes each comment as a line of JSON as soon as it's given one."""
+
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+
+    def write(self, comment: ReviewComment, anchor: Anchor | None = None) -> None:
+        self.stream.write(format_ndjson(comment, anchor) + "\n")
+        self.stream.flush()
+
+    def close(self) -> None:
+        pass
+
+
+class SarifWriter:
+    """Writes a SARIF 2.1.0 log for code scanning, one result at a time.
+
+    The log's opening is written up front and its closing by :meth:`close`,
+    so only the current comment is ever held in memory. Each severity is a
+    rule whose default level follows ``SARIF_LEVELS``.
+    """
+
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+        self.count = 0
+        driver = {
+            "name": "code-reviewer",
+            "rules": [
+                {
+                    "id": severity,
+                    "shortDescription": {"text": f"Review {severity}"},
+                    "defaultConfiguration": {"level": SARIF_LEVELS[severity]},
+                }
+                for severity in SEVERITY_SYMBOLS
+            ],
+        }
+        header = json.dumps({"$schema": SARIF_SCHEMA, "version": "2.1.0", "runs": [{"tool": {"driver": driver}}]})
+        # Leave the run open at its results array: everything up to the closing "}]}".
+        self.stream.write(header[: -len("}]}")] + ', "results": [')
+        self.stream.flush()
+
+    def write(self, comment: ReviewComment, anchor: Anchor | None = None) -> None:
+        self.stream.write((",\n" if self.count else "\n") + json.dumps(sarif_result(comment, anchor)))
+        self.stream.flush()
+        self.count += 1
+
+    def close(self) -> None:
+        self.stream.write("\n]}]}\n")
+        self.stream.flush()
+
+
+def sarif_result(comment: ReviewComment, anchor: Anchor | None = None) -> dict:
+    location: dict = {"artifactLocation": {"uri": comment.file}}
+    line = comment.line if anchor is None or anchor.line is None else anchor.line
+    # Code scanning places results in the new file, so lines of the old one are left out.
+    # Lines only reach here unchecked from the Python API; SARIF requires a positive integer.
+    if type(line) is int and line > 0 and (anchor is None or anchor.status != OLD):
+        location["region"] = {"startLine": line}
+    result: dict = {
+        "level": SARIF_LEVELS.get(comment.severity, "note"),
+        "message": {"text": comment.comment},
+        "locations": [{"physicalLocation": location}],
+    }
+    if comment.severity in SEVERITY_SYMBOLS:
+        result = {"ruleId": comment.severity, **result}
+    if anchor is not None and anchor.status == SNAPPED:
+        result["properties"] = {"originalLine": comment.line}
+    return result
@@ -0,0 +1,108 @@
+import json
+
+from code_reviewer.output import ReviewComment
+
+
+def _line(value: object) -> int | None:
+    """``value`` as a line number, if it is one. Models sometimes write ``"42"`` or ``42.0``."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            return None
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return None
+
+
+def comment_from_item(item: object) -> ReviewComment | None:
+    if not isinstance(item, dict):
+        return None
+    comment_text = (
+        item.get("comment")
+        or item.get("message")
+        or item.get("description")
+        or item.get("text")
+        or ""
+    )
+    if not comment_text:
+        return None
+    return ReviewComment(
+        file=item.get("file", "unknown"),
+        line=_line(item.get("line")),
+        severity=item.get("severity", "suggestion"),
+        comment=comment_text,
+    )
+
+
+class CommentStreamParser:
+    """Incrementally extracts the objects of a JSON array from streamed text.
+
+    Text before the opening ``[`` is skipped. Each top-level object is decoded
+    as soon as its closing brace arrives, so callers see comments while the
+    model is still generating. Objects that fail to decode are dropped.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = ""
+        self._pos = 0
+        self._started = False
+        self._closed = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._object_start: int | None = None
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def feed(self, chunk: str) -> list[dict]:
+        items: list[dict] = []
+        self._buffer += chunk
+        buffer = self._buffer
+
+        while self._pos < len(buffer) and not self._closed:
+            char = buffer[self._pos]
+            if not self._started:
+                if char == "[":
+                    self._started = True
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 0 and char == "{":
+                    self._object_start = self._pos
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0:
+                    self._closed = char == "]"
+                else:
+                    self._depth -= 1
+                    if self._depth == 0 and self._object_start is not None:
+                        try:
+                            item = json.loads(buffer[self._object_start:self._pos + 1])
+                        except ValueError:
+                            item = None
+                        if isinstance(item, dict):
+                            items.append(item)
+                        self._object_start = None
+            self._pos += 1
+
+        # Keep only what an unfinished object still needs.
+        keep = self._object_start if self._object_start is not None else self._pos
+        self._buffer = buffer[keep:]
+        self._pos -= keep
+        if self._object_start is not None:
+            self._object_start = 0
+        return items
@@ -45,3 +45,10 @@ def build_user_prompt(diff: str, context: str | None = None) -> str:
         parts.append(f"Context: {context}\n")
     parts.append(f"```diff\n{diff}\n```")
     return "\n".join(parts)
+
+
+CONTINUATION_PROMPT = """\
+Your previous response was cut off because it reached the output length limit. \
+The comments it contained are repeated above. Respond with ONLY a JSON array of \
+the remaining comments, without repeating any of those. If there are no more, respond with: []\
+"""
@@ -0,0 +1,116 @@
+import random
+import threading
+import time
+import weakref
+from collections.abc import AsyncIterator, Callable, Iterator
+from contextlib import asynccontextmanager, contextmanager
+
+DEFAULT_MAX_IN_FLIGHT = 16
+DEFAULT_MAX_RETRIES = 4
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+
+# 529 is Anthropic's "overloaded".
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504, 529}
+# Matched by name so neither SDK has to be imported to classify its errors.
+RETRYABLE_ERRORS = {"APIConnectionError", "APITimeoutError"}
+
+
+class TokenBucket:
+    """Refills ``per_minute`` units evenly over each minute, holding at most a minute's worth.
+
+    Callers reserve units up front and are told how long to wait before using
+    them, so concurrent callers are served in order instead of racing.
+    """
+
+    def __init__(self, per_minute: float, clock: Callable[[], float] = time.monotonic):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self._clock = clock
+        self._level = per_minute
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            now = self._clock()
+            self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+            self._updated = now
+            # A request bigger than the bucket could otherwise never be served.
+            self._level -= min(amount, self.capacity)
+            return max(0.0, -self._level / self.rate)
+
+
+class RateLimiter:
+    """Requests/min and tokens/min budgets plus a cap on requests in flight.
+
+    A limit of 0 disables that budget. The in-flight cap is shared by threads,
+    and applies separately within each event loop for async callers.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    ):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_in_flight = max_in_flight
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._async_slots: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def reserve(self, tokens: int) -> float:
+        """Seconds to wait before sending a request of about ``tokens`` tokens."""
+        delays = [0.0]
+        if self.requests is not None:
+            delays.append(self.requests.reserve(1))
+        if self.tokens is not None:
+            delays.append(self.tokens.reserve(tokens))
+        return max(delays)
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        with self._slots:
+            yield
+
+    @asynccontextmanager
+    async def aslot(self) -> AsyncIterator[None]:
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        slots = self._async_slots.get(loop)
+        if slots is None:
+            slots = self._async_slots[loop] = asyncio.Semaphore(self.max_in_flight)
+        async with slots:
+            yield
+
+
+def is_retryable(error: BaseException) -> bool:
+    if getattr(error, "status_code", None) in RETRYABLE_STATUSES:
+        return True
+    return any(cls.__name__ in RETRYABLE_ERRORS for cls in type(error).__mro__)
+
+
+def retry_after(error: BaseException) -> float | None:
+    """The server's requested delay, from ``retry-after-ms`` or ``retry-after`` (in seconds)."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    for name, scale in (("retry-after-ms", 1000), ("retry-after", 1)):
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value) / scale)
+        except ValueError:
+            pass  # HTTP-date form; fall back to our own backoff
+    return None
+
+
+def backoff(attempt: int, server_delay: float | None = None) -> float:
+    """Delay before retry number ``attempt + 1``: the server's if it gave one, else full-jitter exponential."""
+    if server_delay is not None:
+        return min(server_delay, RETRY_MAX_DELAY)
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt))
@@ -0,0 +1,55 @@
+import math
+import re
+from collections.abc import Iterable
+
+from code_reviewer.diff import FileDiff
+
+# Path fragments marking code where a bug costs the most, and how much each adds.
+RISK_PATTERNS = [
+    (re.compile(r"auth|login|passw|secret|credential|token|crypt|secur|permission|oauth|session"), 3.0),
+    (re.compile(r"payment|billing|invoice|checkout|wallet"), 3.0),
+    (re.compile(r"(?<![a-z])db(?![a-z])|database|sql|migration|schema|query|transaction"), 2.0),
+    (re.compile(r"(?<![a-z])api(?![a-z])|handler|middleware|route|views?(?![a-z])|serializ|upload"), 1.0),
+]
+
+# How much a file's type counts, relative to 1.0 for source code.
+TYPE_WEIGHTS = {
+    ".md": 0.2,
+    ".rst": 0.2,
+    ".txt": 0.2,
+    ".json": 0.5,
+    ".yaml": 0.5,
+    ".yml": 0.5,
+    ".toml": 0.5,
+    ".ini": 0.5,
+    ".cfg": 0.5,
+    ".csv": 0.2,
+    ".sql": 1.5,
+}
+TEST_PATH = re.compile(r"(^|/)(tests?|spec|__tests__)/|(^|/)test_[^/]*$|_test\.[^/]+$|\.(test|spec)\.[^/]+$")
+TEST_WEIGHT = 0.5
+
+
+def churn(file: FileDiff) -> int:
+    """Lines added and removed in ``file``."""
+    return sum(1 for hunk in file.hunks for line in hunk.lines if line[:1] in ("+", "-"))
+
+
+def risk_score(file: FileDiff) -> float:
+    """A cheap guess at how much reviewing ``file`` matters, from its path, type and size of change.
+
+    Only relative order means anything: scores grow with sensitive path
+    fragments and with the logarithm of the lines changed.
+    """
+    path = file.path.lower()
+    weight = 1.0 + sum(score for pattern, score in RISK_PATTERNS if pattern.search(path))
+    suffix = path[path.rfind(".") :] if "." in path.rsplit("/", 1)[-1] else ""
+    weight *= TYPE_WEIGHTS.get(suffix, 1.0)
+    if TEST_PATH.search(path):
+        weight *= TEST_WEIGHT
+    return weight * (1.0 + math.log2(1 + churn(file)))
+
+
+def order_by_risk(files: Iterable[FileDiff]) -> list[FileDiff]:
+    """``files`` riskiest first, keeping diff order among equal scores."""
+    return sorted(files, key=risk_score, reverse=True)
@@ -0,0 +1,190 @@
+import json
+import logging
+import os
+import socketserver
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from code_reviewer.client import UNIX_PREFIX
+from code_reviewer.llm import _get_client, _get_provider, _openai_endpoint, review
+from code_reviewer.output import format_json
+
+DEFAULT_ADDRESS = "127.0.0.1:8750"
+DEFAULT_CONCURRENCY = 4
+DEFAULT_QUEUE_SIZE = 32
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class ReviewQueue:
+    """Runs up to ``concurrency`` reviews at once with up to ``queue_size`` more waiting.
+
+    Requests beyond that are rejected immediately rather than piling up
+    behind slow model calls.
+    """
+
+    def __init__(self, concurrency: int = DEFAULT_CONCURRENCY, queue_size: int = DEFAULT_QUEUE_SIZE):
+        self._admitted = threading.BoundedSemaphore(concurrency + queue_size)
+        self._running = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self.running = 0
+        self.queued = 0
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        if not self._admitted.acquire(blocking=False):
+            raise QueueFull
+        try:
+            with self._lock:
+                self.queued += 1
+            with self._running:
+                with self._lock:
+                    self.queued -= 1
+                    self.running += 1
+                try:
+                    yield
+                finally:
+                    with self._lock:
+                        self.running -= 1
+        finally:
+            self._admitted.release()
+
+
+class ReviewHandler(BaseHTTPRequestHandler):
+    """``POST /review`` with ``{"diff", "context", "guidelines"}`` returns the ``--json`` output."""
+
+    protocol_version = "HTTP/1.1"  # keep-alive, so clients can reuse the connection
+
+    def address_string(self) -> str:
+        # Unix socket peers have no address.
+        return self.client_address[0] if self.client_address else UNIX_PREFIX
+
+    def log_message(self, format: str, *args) -> None:
+        logger.info("%s %s", self.address_string(), format % args)
+
+    def _send(self, status: int, body: str, headers: dict[str, str] | None = None) -> None:
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status: int, message: str, headers: dict[str, str] | None = None) -> None:
+        self._send(status, json.dumps({"error": message}), headers)
+
+    def do_GET(self) -> None:
+        if self.path != "/health":
+            self._error(404, f"Unknown path {self.path}")
+            return
+        queue = self.server.review_queue
+        self._send(200, json.dumps({"status": "ok", "running": queue.running, "queued": queue.queued}))
+
+    def do_POST(self) -> None:
+        if self.path != "/review":
+            self._error(404, f"Unknown path {self.path}")
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        except ValueError:
+            self._error(400, "Request body must be JSON")
+            return
+        diff = request.get("diff") if isinstance(request, dict) else None
+        if not isinstance(diff, str) or not diff.strip():
+            self._error(400, "Request must include a non-empty 'diff'")
+            return
+
+        guidelines = request.get("guidelines") or self.server.guidelines
+        try:
+            with self.server.review_queue.slot():
+                comments = review(diff.strip(), context=request.get("context"), guidelines=guidelines)
+        except QueueFull:
+            self._error(503, "Review queue is full", {"Retry-After": "1"})
+            return
+        except Exception as e:
+            logger.exception("Review failed")
+            self._error(502, f"Review failed: {e}")
+            return
+        self._send(200, format_json(comments))
+
+
+class _ReviewServerMixin:
+    daemon_threads = True
+    review_queue: ReviewQueue
+    guidelines: str | None
+
+
+class TCPReviewServer(_ReviewServerMixin, ThreadingHTTPServer):
+    pass
+
+
+class UnixReviewServer(_ReviewServerMixin, socketserver.ThreadingUnixStreamServer):
+    def server_bind(self) -> None:
+        # A socket file left behind by a previous run would make bind fail.
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        super().server_bind()
+
+    def server_close(self) -> None:
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+def parse_address(address: str) -> str | tuple[str, int]:
+    """``unix:PATH`` gives a socket path, anything else ``[http://]HOST:PORT``."""
+    if address.startswith(UNIX_PREFIX):
+        return address[len(UNIX_PREFIX):]
+    address = address.removeprefix("http://").rstrip("/")
+    host, _, port = address.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"Expected HOST:PORT or unix:PATH, got {address!r}")
+    return host, int(port)
+
+
+def make_server(
+    address: str = DEFAULT_ADDRESS,
+    guidelines: str | None = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+) -> TCPReviewServer | UnixReviewServer:
+    parsed = parse_address(address)
+    if isinstance(parsed, str):
+        server: TCPReviewServer | UnixReviewServer = UnixReviewServer(parsed, ReviewHandler)
+    else:
+        server = TCPReviewServer(parsed, ReviewHandler)
+    server.review_queue = ReviewQueue(concurrency, queue_size)
+    server.guidelines = guidelines
+    return server
+
+
+def warm_up() -> None:
+    """Import the provider SDK and open its client now rather than on the first request."""
+    provider = _get_provider()
+    if provider == "anthropic":
+        _get_client("anthropic")
+    else:
+        _get_client("openai", *_openai_endpoint(provider))
+
+
+def serve(
+    address: str = DEFAULT_ADDRESS,
+    guidelines: str | None = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+) -> None:
+    warm_up()
+    with make_server(address, guidelines, concurrency, queue_size) as server:
+        logger.info("Serving reviews on %s (%d concurrent, %d queued)", address, concurrency, queue_size)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,188 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+
+# In pipeline order. Stage times are summed over shards, so with several
+# workers they can add up to more than the wall-clock total.
+STAGES = (
+    "read",  # reading the diff
+    "triage",  # asking the triage model which hunks need review
+    "prepare",  # filtering, sharding, compacting and building prompts
+    "throttle",  # waiting on rate limits and retry backoff
+    "queued",  # before the first token; in batch mode, the whole batch turnaround
+    "generating",  # from the first token to the end of the response
+    "parse",  # extracting comments from responses
+)
+
+METRIC_PREFIX = "code_reviewer"
+
+
+@dataclass
+class Usage:
+    input_tokens: int = 0  # all prompt tokens, including cached ones
+    cached_tokens: int = 0  # prompt tokens served from the provider's prefix cache
+    output_tokens: int = 0
+
+    def __add__(self, other: "Usage") -> "Usage":
+        return Usage(
+            input_tokens=self.input_tokens + other.input_tokens,
+            cached_tokens=self.cached_tokens + other.cached_tokens,
+            output_tokens=self.output_tokens + other.output_tokens,
+        )
+
+    def __iadd__(self, other: "Usage") -> "Usage":
+        # In place, so a Usage held by Stats can be accumulated into.
+        self.input_tokens += other.input_tokens
+        self.cached_tokens += other.cached_tokens
+        self.output_tokens += other.output_tokens
+        return self
+
+
+@dataclass
+class Stats:
+    """Per-stage durations, request counts and token usage for one or more reviews.
+
+    Safe to update from several threads.
+    """
+
+    seconds: dict[str, float] = field(default_factory=dict)
+    requests: int = 0
+    comments: int = 0
+    total: float = 0.0  # wall-clock seconds, set by whoever times the whole run
+    usage: Usage = field(default_factory=Usage)
+    served: dict[str, int] = field(default_factory=dict)  # requests answered, per provider
+    unanswered: list[str] = field(default_factory=list)  # files whose reply had no JSON array
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(stage, time.monotonic() - start)
+
+    def add_request(self, usage: Usage, provider: str = "") -> None:
+        with self._lock:
+            self.requests += 1
+            self.usage += usage
+            if provider:
+                self.served[provider] = self.served.get(provider, 0) + 1
+
+    def add_unanswered(self, paths: list[str]) -> None:
+        with self._lock:
+            self.unanswered += [path for path in paths if path not in self.unanswered]
+
+    def __iadd__(self, other: "Stats") -> "Stats":
+        with other._lock:
+            seconds, requests, comments, usage = dict(other.seconds), other.requests, other.comments, other.usage
+            served, unanswered = dict(other.served), list(other.unanswered)
+        with self._lock:
+            self.unanswered += [path for path in unanswered if path not in self.unanswered]
+            for stage, value in seconds.items():
+                self.seconds[stage] = self.seconds.get(stage, 0.0) + value
+            for provider, count in served.items():
+                self.served[provider] = self.served.get(provider, 0) + count
+            self.requests += requests
+            self.comments += comments
+            self.usage += usage
+        return self
+
+    def _stages(self) -> list[tuple[str, float]]:
+        known = [(stage, self.seconds.get(stage, 0.0)) for stage in STAGES]
+        return known + sorted((s, v) for s, v in self.seconds.items() if s not in STAGES)
+
+    def to_dict(self) -> dict:
+        return {
+            "seconds": {stage: round(value, 6) for stage, value in self._stages()},
+            "total_seconds": round(self.total, 6),
+            "requests": self.requests,
+            "comments": self.comments,
+            "tokens": {
+                "input": self.usage.input_tokens,
+                "cached": self.usage.cached_tokens,
+                "output": self.usage.output_tokens,
+            },
+            "served_by": dict(sorted(self.served.items())),
+        }
+
+    def format(self) -> str:
+        stages = ", ".join(f"{stage} {value:.2f}s" for stage, value in self._stages())
+        return (
+            f"Stages: {stages}; total {self.total:.2f}s\n"
+            f"Tokens: {self.usage.input_tokens} input ({self.usage.cached_tokens} cached), "
+            f"{self.usage.output_tokens} output in {self.requests} requests; {self.comments} comments"
+            + (f"\nServed by: {self._served()}" if self.served else "")
+        )
+
+    def _served(self) -> str:
+        return ", ".join(f"{provider} {count}" for provider, count in sorted(self.served.items()))
+
+    def prometheus(self) -> str:
+        """The stats as gauges in the Prometheus text exposition format."""
+        p = METRIC_PREFIX
+        lines = [
+            f"# HELP {p}_stage_seconds Seconds spent in each review stage in the last run.",
+            f"# TYPE {p}_stage_seconds gauge",
+        ]
+        lines += [f'{p}_stage_seconds{{stage="{stage}"}} {value:.6f}' for stage, value in self._stages()]
+        lines += [
+            f"# HELP {p}_tokens Provider-reported tokens in the last run.",
+            f"# TYPE {p}_tokens gauge",
+            f'{p}_tokens{{kind="input"}} {self.usage.input_tokens}',
+            f'{p}_tokens{{kind="cached"}} {self.usage.cached_tokens}',
+            f'{p}_tokens{{kind="output"}} {self.usage.output_tokens}',
+        ]
+        if self.served:
+            lines += [
+                f"# HELP {p}_served_requests Requests answered by each provider in the last run.",
+                f"# TYPE {p}_served_requests gauge",
+            ]
+            lines += [f'{p}_served_requests{{provider="{k}"}} {v}' for k, v in sorted(self.served.items())]
+        for name, value, help in (
+            ("duration_seconds", f"{self.total:.6f}", "Wall-clock seconds of the last run."),
+            ("requests", self.requests, "Provider requests in the last run."),
+            ("comments", self.comments, "Review comments produced in the last run."),
+            ("last_run_timestamp_seconds", f"{time.time():.3f}", "When the last run finished."),
+        ):
+            lines += [f"# HELP {p}_{name} {help}", f"# TYPE {p}_{name} gauge", f"{p}_{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    # Scrapers must never see a half-written file.
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def write_stats(stats: Stats, path: str | Path) -> None:
+    """Write ``stats`` as a JSON sidecar file."""
+    _write_atomic(Path(path), json.dumps(stats.to_dict(), indent=2) + "\n")
+
+
+def export_metrics(stats: Stats, path: str | Path) -> None:
+    """Export ``stats`` for dashboards.
+
+    A ``.prom`` path is overwritten as a Prometheus textfile-collector file;
+    anything else gets one timestamped JSON line appended per run.
+    """
+    path = Path(path)
+    if path.suffix == ".prom":
+        _write_atomic(path, stats.prometheus())
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps({"timestamp": round(time.time(), 3), **stats.to_dict()}) + "\n")
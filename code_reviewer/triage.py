@@ -0,0 +1,132 @@
+import json
+import re
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+
+from code_reviewer.diff import FileDiff, Hunk, estimate_tokens
+
+TRIAGE_SYSTEM_PROMPT = """\
+You are triaging a change before code review. You will receive numbered hunks from a git diff.
+
+Decide which hunks need careful review by a senior engineer: anything that could change runtime behaviour, \
+such as logic, control flow, error handling, security, concurrency, data handling or public interfaces.
+
+Hunks that do NOT need review:
+- Formatting, whitespace and import reordering
+- Comments, docstrings and documentation
+- Pure renames and moved code
+- Version bumps and routine dependency or configuration updates
+- Test fixtures and sample data
+
+When unsure, flag the hunk for review.
+
+Respond with ONLY a JSON array of the numbers of the hunks that need review, for example: [1, 4]
+If none do, respond with: []\
+"""
+
+
+@dataclass
+class TriageReport:
+    hunks: int = 0
+    escalated: int = 0
+    tokens: int = 0
+    escalated_tokens: int = 0
+    skipped_files: list[str] = field(default_factory=list)  # files with no hunk escalated
+
+
+@dataclass
+class TriageBatch:
+    numbers: list[int]
+    prompt: str
+
+
+def number_hunks(files: list[FileDiff]) -> Iterator[tuple[int, FileDiff, Hunk]]:
+    number = 0
+    for file in files:
+        for hunk in file.hunks:
+            number += 1
+            yield number, file, hunk
+
+
+def _hunk_block(number: int, file: FileDiff, hunk: Hunk) -> str:
+    return f"Hunk {number} in {file.path or '(unknown file)'}:\n```diff\n{hunk.text}\n```"
+
+
+def build_triage_batches(
+    files: list[FileDiff], context: str | None, max_tokens: int
+) -> tuple[list[TriageBatch], set[int]]:
+    """Pack numbered hunks into triage prompts of about ``max_tokens`` each.
+
+    Also returns the numbers of hunks too large to triage on their own, which
+    are escalated without asking.
+    """
+    prefix = f"Context: {context}\n\n" if context else ""
+    batches: list[TriageBatch] = []
+    oversized: set[int] = set()
+    numbers: list[int] = []
+    blocks: list[str] = []
+    tokens = estimate_tokens(prefix)
+
+    for number, file, hunk in number_hunks(files):
+        block = _hunk_block(number, file, hunk)
+        block_tokens = estimate_tokens(block)
+        if estimate_tokens(prefix) + block_tokens > max_tokens:
+            oversized.add(number)
+            continue
+        if blocks and tokens + block_tokens > max_tokens:
+            batches.append(TriageBatch(numbers, prefix + "\n\n".join(blocks)))
+            numbers, blocks, tokens = [], [], estimate_tokens(prefix)
+        numbers.append(number)
+        blocks.append(block)
+        tokens += block_tokens
+    if blocks:
+        batches.append(TriageBatch(numbers, prefix + "\n\n".join(blocks)))
+    return batches, oversized
+
+
+def parse_triage_reply(text: str) -> set[int] | None:
+    """The hunk numbers flagged in ``text``, or None if it isn't a JSON array of numbers."""
+    match = re.search(r"\[.*?\]", text, re.DOTALL)
+    if not match:
+        return None
+    try:
+        raw = json.loads(match.group())
+    except ValueError:
+        return None
+    flagged: set[int] = set()
+    for item in raw:
+        try:
+            flagged.add(int(item))
+        except (TypeError, ValueError):
+            return None
+    return flagged
+
+
+def select_hunks(files: list[FileDiff], escalated: set[int]) -> tuple[str, TriageReport]:
+    """The diff reduced to the ``escalated`` hunks, and what was dropped.
+
+    Files without hunks, such as pure renames or input that isn't a diff, are
+    kept as they are.
+    """
+    report = TriageReport()
+    kept: list[str] = []
+    number = 0
+    for file in files:
+        if not file.hunks:
+            kept.append(file.text)
+            continue
+        hunks = []
+        for hunk in file.hunks:
+            number += 1
+            tokens = estimate_tokens(hunk.text)
+            report.hunks += 1
+            report.tokens += tokens
+            if number in escalated:
+                hunks.append(hunk)
+                report.escalated += 1
+                report.escalated_tokens += tokens
+        if hunks:
+            kept.append(FileDiff(file.path, file.header, hunks).text)
+        else:
+            report.skipped_files.append(file.path)
+    return "\n".join(kept), report
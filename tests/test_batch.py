@@ -0,0 +1,205 @@
+import io
+import json
+from unittest.mock import MagicMock, patch
+
+from code_reviewer.batch import BatchItem, chunk_requests, load_items, run_batch
+
+
+def _result(custom_id, text=None, result_type="succeeded"):
+    result = MagicMock()
+    result.custom_id = custom_id
+    result.result.type = result_type
+    if text is not None:
+        result.result.message.content = [MagicMock(text=text)]
+    return result
+
+
+def _batch(batch_id, status):
+    batch = MagicMock()
+    batch.id = batch_id
+    batch.processing_status = status
+    return batch
+
+
+class TestLoadItems:
+    def test_directory(self, tmp_path):
+        (tmp_path / "pr-2.diff").write_text("+ two\n")
+        (tmp_path / "pr-1.patch").write_text("+ one\n")
+        (tmp_path / "notes.txt").write_text("ignored")
+
+        items = load_items(tmp_path)
+
+        assert items == [BatchItem(id="pr-1", diff="+ one"), BatchItem(id="pr-2", diff="+ two")]
+
+    def test_jsonl(self, tmp_path):
+        path = tmp_path / "diffs.jsonl"
+        path.write_text(
+            json.dumps({"id": 7, "diff": "+ a", "context": "ctx"}) + "\n\n"
+            + json.dumps({"id": "b", "diff": "+ b"}) + "\n"
+        )
+
+        items = load_items(path)
+
+        assert items == [BatchItem(id="7", diff="+ a", context="ctx"), BatchItem(id="b", diff="+ b")]
+
+
+class TestChunkRequests:
+    def test_single_chunk(self):
+        requests = [{"custom_id": str(i)} for i in range(3)]
+        assert list(chunk_requests(requests)) == [requests]
+
+    def test_count_limit(self):
+        requests = [{"custom_id": str(i)} for i in range(5)]
+        chunks = list(chunk_requests(requests, max_requests=2))
+        assert [len(c) for c in chunks] == [2, 2, 1]
+
+    def test_size_limit(self):
+        requests = [{"custom_id": str(i), "pad": "x" * 100} for i in range(4)]
+        size = len(json.dumps(requests[0]).encode())
+        chunks = list(chunk_requests(requests, max_bytes=size * 2))
+        assert [len(c) for c in chunks] == [2, 2]
+
+    def test_oversized_request_gets_own_chunk(self):
+        requests = [{"custom_id": "a", "pad": "x" * 100}, {"custom_id": "b"}]
+        assert [len(c) for c in chunk_requests(requests, max_bytes=10)] == [1, 1]
+
+
+class TestRunBatch:
+    @patch("code_reviewer.batch.time.sleep")
+    def test_writes_results_per_diff(self, mock_sleep):
+        client = MagicMock()
+        client.messages.batches.create.return_value = _batch("b1", "in_progress")
+        client.messages.batches.retrieve.side_effect = [_batch("b1", "in_progress"), _batch("b1", "ended")]
+        client.messages.batches.results.return_value = [
+            _result("diff-1", "[]"),
+            _result("diff-0", '[{"file": "a.py", "line": 3, "severity": "error", "comment": "bug"}]'),
+            _result("diff-2", result_type="errored"),
+        ]
+        items = [BatchItem("pr-a", "+ a", "own ctx"), BatchItem("pr-b", "+ b"), BatchItem("pr-c", "+ c")]
+        output = io.StringIO()
+
+        with patch("code_reviewer.batch._get_client", return_value=client):
+            run_batch(items, output, context="shared ctx", guidelines="be strict")
+
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        assert records == [
+            {"id": "pr-b", "comments": []},
+            {"id": "pr-a", "comments": [{"file": "a.py", "line": 3, "severity": "error", "comment": "bug"}]},
+            {"id": "pr-c", "error": "errored"},
+        ]
+
+        requests = client.messages.batches.create.call_args.kwargs["requests"]
+        assert [r["custom_id"] for r in requests] == ["diff-0", "diff-1", "diff-2"]
+        system = requests[0]["params"]["system"]
+        assert "be strict" in system[0]["text"]
+        assert system[0]["cache_control"] == {"type": "ephemeral"}
+        assert "own ctx" in requests[0]["params"]["messages"][0]["content"]
+        assert "shared ctx" in requests[1]["params"]["messages"][0]["content"]
+        mock_sleep.assert_called_once()
+
+    @patch("code_reviewer.llm.time.sleep")
+    @patch("code_reviewer.batch.time.sleep")
+    def test_transient_errors_are_retried(self, mock_sleep, mock_retry_sleep):
+        overloaded = RuntimeError("overloaded")
+        overloaded.status_code = 529
+        client = MagicMock()
+        client.messages.batches.create.side_effect = [overloaded, _batch("b1", "in_progress")]
+        client.messages.batches.retrieve.side_effect = [overloaded, _batch("b1", "ended")]
+        client.messages.batches.results.side_effect = [overloaded, [_result("diff-0", "[]")]]
+        output = io.StringIO()
+
+        with patch("code_reviewer.batch._get_client", return_value=client):
+            run_batch([BatchItem("a", "+ a")], output)
+
+        assert json.loads(output.getvalue()) == {"id": "a", "comments": []}
+        assert client.messages.batches.create.call_count == 2
+        assert mock_retry_sleep.call_count == 3
+
+    @patch("code_reviewer.llm.time.sleep")
+    @patch("code_reviewer.batch.time.sleep")
+    def test_results_dropped_midway_are_read_again(self, mock_sleep, mock_retry_sleep):
+        dropped = RuntimeError("connection reset")
+        dropped.status_code = 502
+
+        def torn():
+            yield _result("diff-0", "[]")
+            raise dropped
+
+        client = MagicMock()
+        client.messages.batches.create.return_value = _batch("b1", "ended")
+        client.messages.batches.retrieve.return_value = _batch("b1", "ended")
+        client.messages.batches.results.side_effect = [torn(), [_result("diff-0", "[]"), _result("diff-1", "[]")]]
+        output = io.StringIO()
+
+        with patch("code_reviewer.batch._get_client", return_value=client):
+            run_batch([BatchItem("a", "+ a"), BatchItem("b", "+ b")], output)
+
+        assert [json.loads(line)["id"] for line in output.getvalue().splitlines()] == ["a", "b"]
+        assert mock_retry_sleep.call_count == 1
+
+    @patch("code_reviewer.batch.time.sleep")
+    def test_guideline_sections_per_diff(self, mock_sleep):
+        client = MagicMock()
+        client.messages.batches.create.return_value = _batch("b1", "ended")
+        client.messages.batches.retrieve.return_value = _batch("b1", "ended")
+        client.messages.batches.results.return_value = [_result("diff-0", "[]"), _result("diff-1", "[]")]
+        items = [
+            BatchItem("py", "diff --git a/a.py b/a.py\n--- a/a.py\n+++ b/a.py\n@@ -1 +1 @@\n+x"),
+            BatchItem("go", "diff --git a/a.go b/a.go\n--- a/a.go\n+++ b/a.go\n@@ -1 +1 @@\n+x"),
+        ]
+
+        with patch("code_reviewer.batch._get_client", return_value=client):
+            run_batch(items, io.StringIO(), guidelines="## Python\nType hints.\n\n## Go\nWrap errors.")
+
+        requests = client.messages.batches.create.call_args.kwargs["requests"]
+        py, go = (r["params"]["system"][0]["text"] for r in requests)
+        assert "Type hints." in py and "Wrap errors." not in py
+        assert "Wrap errors." in go and "Type hints." not in go
+
+    @patch("code_reviewer.batch.time.sleep")
+    def test_chunks_into_several_batches(self, mock_sleep):
+        client = MagicMock()
+        client.messages.batches.create.side_effect = [_batch("b1", "in_progress"), _batch("b2", "in_progress")]
+        client.messages.batches.retrieve.side_effect = [
+            _batch("b1", "in_progress"),
+            _batch("b2", "ended"),
+            _batch("b1", "ended"),
+        ]
+        client.messages.batches.results.side_effect = lambda batch_id: {
+            "b1": [_result("diff-0", "[]")],
+            "b2": [_result("diff-1", "[]")],
+        }[batch_id]
+        output = io.StringIO()
+
+        with patch("code_reviewer.batch.chunk_requests", side_effect=lambda r: ([x] for x in r)):
+            with patch("code_reviewer.batch._get_client", return_value=client):
+                run_batch([BatchItem("a", "+ a"), BatchItem("b", "+ b")], output)
+
+        assert client.messages.batches.create.call_count == 2
+        ids = [json.loads(line)["id"] for line in output.getvalue().splitlines()]
+        assert ids == ["b", "a"]
+
+    def test_fully_ignored_diff_not_submitted(self):
+        client = MagicMock()
+        output = io.StringIO()
+        lock = "diff --git a/uv.lock b/uv.lock\n--- a/uv.lock\n+++ b/uv.lock\n@@ -1 +1 @@\n-a\n+b"
+
+        with patch("code_reviewer.batch._get_client", return_value=client):
+            run_batch([BatchItem("a", lock)], output)
+
+        assert json.loads(output.getvalue()) == {"id": "a", "comments": []}
+        client.messages.batches.create.assert_not_called()
+
+    @patch("code_reviewer.batch.time.sleep")
+    def test_timeout_reports_unfinished(self, mock_sleep):
+        client = MagicMock()
+        client.messages.batches.create.return_value = _batch("b1", "in_progress")
+        client.messages.batches.retrieve.return_value = _batch("b1", "in_progress")
+        output = io.StringIO()
+
+        with patch("code_reviewer.batch._get_client", return_value=client):
+            run_batch([BatchItem("a", "+ a")], output, max_wait=20)
+
+        record = json.loads(output.getvalue())
+        assert record["id"] == "a"
+        assert "did not complete" in record["error"]
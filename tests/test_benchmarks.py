@@ -0,0 +1,51 @@
+import json
+
+from benchmarks import run
+from benchmarks.diffgen import generate_diff
+from benchmarks.mock_server import reply_for
+from code_reviewer.diff import parse_diff
+
+
+class TestDiffGen:
+    def test_size_and_reproducibility(self):
+        diff = generate_diff(1000)
+        assert 1000 <= len(diff.splitlines()) < 1100
+        assert generate_diff(1000) == diff
+        assert generate_diff(1000, seed=1) != diff
+
+    def test_hunk_headers_match_bodies(self):
+        files = list(parse_diff(generate_diff(2000).splitlines()))
+        assert len(files) > 1
+        for file in files:
+            for hunk in file.hunks:
+                assert len(hunk.lines) == hunk.old_count + hunk.new_count - sum(
+                    1 for line in hunk.lines if line.startswith(" ")
+                )
+
+
+class TestMockServer:
+    def test_one_comment_per_file(self):
+        diff = generate_diff(900, lines_per_file=300)
+        comments = json.loads(reply_for(diff))
+        assert [c["file"] for c in comments] == ["src/module_0.py", "src/module_1.py", "src/module_2.py"]
+        assert all(c["line"] == 1 for c in comments)
+
+
+class TestRun:
+    def test_end_to_end_smoke(self, monkeypatch, tmp_path, capsys):
+        for name in ("CODE_REVIEWER_PROVIDER", "CODE_REVIEWER_BASE_URL"):
+            monkeypatch.setenv(name, "")
+        monkeypatch.delenv("CODE_REVIEWER_CACHE_DIR", raising=False)
+        results = tmp_path / "results.json"
+
+        run.main(["--sizes", "10", "--runs", "1", "--latency", "0", "--json", str(results)])
+        run.main(["--sizes", "10", "--runs", "1", "--latency", "0", "--scenarios", "review", "--compare", str(results)])
+
+        saved = json.loads(results.read_text())
+        assert [r["scenario"] for r in saved] == list(run.SCENARIOS)
+        assert all(r["p50"] > 0 and r["peak_mb"] > 0 for r in saved)
+        assert "p50 vs base" in capsys.readouterr().out
+
+    def test_percentile(self):
+        assert run.percentile([3.0, 1.0, 2.0], 50) == 2.0
+        assert run.percentile([float(i) for i in range(1, 21)], 95) == 19.0
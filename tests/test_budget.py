@@ -0,0 +1,41 @@
+import time
+
+from code_reviewer.budget import Budget
+
+
+class TestBudget:
+    def test_unlimited(self):
+        budget = Budget()
+        budget.start()
+        assert budget.remaining() is None
+        assert budget.reserve(10**9)
+        assert budget.summary() == ""
+
+    def test_tokens_are_reserved_and_settled(self):
+        budget = Budget(max_tokens=100)
+        assert budget.reserve(60)
+        budget.charge(-20)  # the request used less than estimated
+        assert budget.reserve(60)
+        assert not budget.reserve(1)
+        assert budget.reason == "token budget of 100"
+
+    def test_first_refusal_is_final(self):
+        budget = Budget(max_tokens=100)
+        assert not budget.reserve(150)
+        assert not budget.reserve(10)
+
+    def test_time_runs_out(self):
+        budget = Budget(max_seconds=0.01)
+        budget.start()
+        assert 0 < budget.remaining() <= 0.01
+        time.sleep(0.02)
+        assert budget.remaining() == 0
+        assert not budget.reserve(1)
+        assert budget.reason == "time budget of 0.01s"
+
+    def test_skip_lists_files_once(self):
+        budget = Budget(max_seconds=5)
+        budget.skip(["a.py", "b.py"])
+        budget.skip(["b.py", "c.py"])
+        assert budget.reason == "time budget of 5s"
+        assert budget.summary() == "Stopped at the time budget of 5s; skipped 3 files:\n  a.py\n  b.py\n  c.py"
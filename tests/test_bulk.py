@@ -0,0 +1,146 @@
+import io
+import json
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from code_reviewer.batch import BatchItem
+from code_reviewer.bulk import BulkReport, resume, run_bulk
+from code_reviewer.llm import Completion, Usage
+from code_reviewer.output import ReviewComment
+
+
+def _items(n):
+    return [BatchItem(id=f"d{i}", diff=f"+ change {i}") for i in range(n)]
+
+
+def _records(output):
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+class TestRunBulk:
+    def test_writes_in_completion_order(self):
+        def fake_review(diff, context=None, guidelines=None, stats=None):
+            index = int(diff.split()[-1])
+            time.sleep(0.02 * (3 - index))
+            return [ReviewComment(file=f"f{index}.py", line=1, severity="warning", comment="c")]
+
+        output = io.StringIO()
+        with patch("code_reviewer.bulk.review", side_effect=fake_review):
+            report = run_bulk(_items(3), output, workers=3)
+
+        records = _records(output)
+        assert [r["id"] for r in records] == ["d2", "d1", "d0"]
+        assert records[0]["comments"][0]["file"] == "f2.py"
+        assert report.reviewed == 3
+        assert len(report.latencies) == 3
+
+    def test_workers_bound_concurrency(self):
+        lock = threading.Lock()
+        in_flight = peak = 0
+
+        def fake_review(diff, context=None, guidelines=None, stats=None):
+            nonlocal in_flight, peak
+            with lock:
+                in_flight += 1
+                peak = max(peak, in_flight)
+            time.sleep(0.01)
+            with lock:
+                in_flight -= 1
+            return []
+
+        with patch("code_reviewer.bulk.review", side_effect=fake_review):
+            run_bulk(_items(6), io.StringIO(), workers=2)
+
+        assert peak == 2
+
+    def test_interrupted_run_stops_submitting(self):
+        reviewed = []
+
+        def fake_review(diff, context=None, guidelines=None, stats=None):
+            reviewed.append(diff)
+            return []
+
+        class Interrupted(io.StringIO):
+            def write(self, text):
+                raise KeyboardInterrupt
+
+        with patch("code_reviewer.bulk.review", side_effect=fake_review):
+            with pytest.raises(KeyboardInterrupt):
+                run_bulk(_items(50), Interrupted(), workers=2)
+
+        assert len(reviewed) <= 2
+
+    def test_failure_is_recorded_and_run_continues(self):
+        def fake_review(diff, context=None, guidelines=None, stats=None):
+            if diff.endswith("1"):
+                raise RuntimeError("provider down")
+            return []
+
+        output = io.StringIO()
+        with patch("code_reviewer.bulk.review", side_effect=fake_review):
+            report = run_bulk(_items(3), output, workers=1)
+
+        by_id = {r["id"]: r for r in _records(output)}
+        assert by_id["d1"] == {"id": "d1", "error": "provider down"}
+        assert by_id["d0"]["comments"] == []
+        assert (report.reviewed, report.failed) == (2, 1)
+
+    def test_skips_done_and_passes_context(self):
+        items = [BatchItem(id="a", diff="+ a"), BatchItem(id="b", diff="+ b", context="own")]
+
+        with patch("code_reviewer.bulk.review", return_value=[]) as mock_review:
+            report = run_bulk(items, io.StringIO(), context="shared", guidelines="rules", done={"a"})
+
+        mock_review.assert_called_once()
+        assert mock_review.call_args.kwargs["context"] == "own"
+        assert mock_review.call_args.kwargs["guidelines"] == "rules"
+        assert report.skipped == 1
+
+    def test_collects_token_usage(self, monkeypatch):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        completion = Completion("[]", usage=Usage(input_tokens=100, cached_tokens=40, output_tokens=5))
+
+        with patch("code_reviewer.llm._call_openai", return_value=completion):
+            report = run_bulk(_items(2), io.StringIO(), workers=2)
+
+        assert report.usage == Usage(input_tokens=200, cached_tokens=80, output_tokens=10)
+
+
+class TestBulkReport:
+    def test_percentiles(self):
+        report = BulkReport(latencies=[float(i) for i in range(1, 101)])
+        assert report.percentile(50) == 50
+        assert report.percentile(95) == 95
+        assert BulkReport().percentile(50) == 0
+
+    def test_summary(self):
+        report = BulkReport(
+            reviewed=4, failed=1, skipped=2, seconds=2.0, latencies=[0.5, 1.0, 1.5, 2.0],
+            usage=Usage(input_tokens=4000, output_tokens=200),
+        )
+        summary = report.summary()
+        assert "Reviewed 4 diffs (1 failed, 2 already done) in 2.0s: 2.00 diffs/s" in summary
+        assert "p50 1.00s p95 2.00s" in summary
+        assert "2000 input and 100 output tokens/s" in summary
+
+
+class TestResume:
+    def test_missing_file(self, tmp_path):
+        assert resume(tmp_path / "out.jsonl") == set()
+
+    def test_skips_failures_and_torn_lines(self, tmp_path):
+        path = tmp_path / "out.jsonl"
+        path.write_text('{"id": "a", "comments": []}\n{"id": "b", "error": "x"}\n{"id": "c", "comm')
+
+        assert resume(path) == {"a"}
+        assert path.read_text().endswith('"comm\n')
+
+    def test_leaves_complete_file_alone(self, tmp_path):
+        path = tmp_path / "out.jsonl"
+        path.write_text('{"id": 7, "comments": []}\n')
+
+        assert resume(path) == {"7"}
+        assert path.read_text() == '{"id": 7, "comments": []}\n'
@@ -0,0 +1,107 @@
+import json
+import os
+import time
+
+from code_reviewer.cache import ReviewCache, cache_key
+from code_reviewer.output import ReviewComment
+
+
+def _comments(text="bug"):
+    return [ReviewComment(file="a.py", line=1, severity="error", comment=text)]
+
+
+class TestCacheKey:
+    def test_stable(self):
+        assert cache_key("local", "m", "sys", "user") == cache_key("local", "m", "sys", "user")
+
+    def test_every_field_matters(self):
+        base = cache_key("local", "m", "sys", "user")
+        assert cache_key("openai", "m", "sys", "user") != base
+        assert cache_key("local", "n", "sys", "user") != base
+        assert cache_key("local", "m", "other", "user") != base
+        assert cache_key("local", "m", "sys", "other") != base
+
+    def test_fields_do_not_run_together(self):
+        assert cache_key("ab", "c", "s", "u") != cache_key("a", "bc", "s", "u")
+
+
+class TestReviewCache:
+    def test_miss_then_hit(self, tmp_path):
+        cache = ReviewCache(tmp_path)
+        assert cache.get("k") is None
+        cache.put("k", _comments())
+        assert cache.get("k") == _comments()
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_empty_result_is_cached(self, tmp_path):
+        cache = ReviewCache(tmp_path)
+        cache.put("k", [])
+        assert cache.get("k") == []
+
+    def test_persists_across_instances(self, tmp_path):
+        ReviewCache(tmp_path).put("k", _comments())
+        assert ReviewCache(tmp_path).get("k") == _comments()
+
+    def test_expired_entry_is_a_miss(self, tmp_path):
+        cache = ReviewCache(tmp_path, ttl=60)
+        cache.put("k", _comments())
+        entry = json.loads((tmp_path / "k.json").read_text())
+        entry["created"] -= 120
+        (tmp_path / "k.json").write_text(json.dumps(entry))
+
+        assert cache.get("k") is None
+        assert not (tmp_path / "k.json").exists()
+
+    def test_hit_survives_a_concurrent_eviction(self, tmp_path, monkeypatch):
+        cache = ReviewCache(tmp_path)
+        cache.put("k", _comments())
+
+        def evicted(*args):
+            raise FileNotFoundError
+
+        monkeypatch.setattr(os, "utime", evicted)
+
+        assert cache.get("k") == _comments()
+        assert cache.hits == 1
+
+    def test_corrupt_entry_is_a_miss(self, tmp_path):
+        (tmp_path / "k.json").write_text("not json")
+        cache = ReviewCache(tmp_path)
+        assert cache.get("k") is None
+        assert cache.misses == 1
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        cache = ReviewCache(tmp_path)
+        for key in ("old", "used", "new"):
+            cache.put(key, _comments(key * 50))
+        now = time.time()
+        os.utime(tmp_path / "old.json", (now - 30, now - 30))
+        os.utime(tmp_path / "used.json", (now - 20, now - 20))
+        os.utime(tmp_path / "new.json", (now - 10, now - 10))
+        cache.get("used")
+
+        cache.max_bytes = sum(p.stat().st_size for p in tmp_path.glob("*.json")) - 1
+        cache.evict()
+
+        assert sorted(p.name for p in tmp_path.glob("*.json")) == ["new.json", "used.json"]
+
+    def test_evicts_stale_entries(self, tmp_path):
+        cache = ReviewCache(tmp_path, ttl=60)
+        cache.put("stale", _comments())
+        old = time.time() - 120
+        os.utime(tmp_path / "stale.json", (old, old))
+        cache.put("fresh", _comments())
+
+        assert [p.name for p in tmp_path.glob("*.json")] == ["fresh.json"]
+
+    def test_hits_do_not_extend_the_ttl(self, tmp_path):
+        cache = ReviewCache(tmp_path, ttl=60)
+        cache.put("k", _comments())
+        written = time.time() - 50
+        os.utime(tmp_path / "k.json", (written, written))
+        assert cache.get("k") == _comments()
+        assert (tmp_path / "k.json").stat().st_mtime == written
+
+        cache.ttl = 40
+        cache.evict()
+        assert not (tmp_path / "k.json").exists()
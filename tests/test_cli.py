@@ -7,6 +7,7 @@ import pytest
 
 from code_reviewer.cli import main, parse_args
 from code_reviewer.output import ReviewComment
+from code_reviewer.stats import Stats
 
 
 class FakeStdin(io.StringIO):
@@ -22,6 +23,7 @@ class TestParseArgs:
         assert args.context is None
         assert args.guidelines is None
         assert args.json_output is False
+        assert args.verbose is False
 
     def test_context_short(self):
         args = parse_args(["-c", "refactoring auth"])
@@ -105,3 +107,401 @@ class TestMain:
 
         _, kwargs = mock_review.call_args
         assert kwargs["guidelines"] == "Always check error handling."
+
+    def test_verbose_configures_logging(self, monkeypatch):
+        monkeypatch.setattr("sys.stdin", FakeStdin("+ code"))
+
+        with patch("code_reviewer.cli.review", return_value=[]):
+            with patch("code_reviewer.cli.logging.basicConfig") as mock_config:
+                main(["-v"])
+
+        mock_config.assert_called_once()
+
+    def test_incremental_flag(self, monkeypatch, capsys, tmp_path):
+        monkeypatch.setattr("sys.stdin", FakeStdin("+ code"))
+        state = str(tmp_path / "state.json")
+
+        with patch("code_reviewer.cli.review_incremental", return_value=[]) as mock_review:
+            main(["--incremental", state, "-c", "ctx"])
+
+        args, kwargs = mock_review.call_args
+        assert args == ("+ code", state)
+        assert kwargs["context"] == "ctx"
+
+
+class TestBatchMain:
+    def test_dispatches_subcommand(self, tmp_path):
+        (tmp_path / "one.diff").write_text("+ a")
+        guidelines = tmp_path / "rules.md"
+        guidelines.write_text("rules")
+        output = tmp_path / "out.jsonl"
+
+        with patch("code_reviewer.cli.run_batch") as mock_run:
+            main(["batch", str(tmp_path), "-o", str(output), "-g", str(guidelines), "--max-wait", "5"])
+
+        args, kwargs = mock_run.call_args
+        assert [item.id for item in args[0]] == ["one"]
+        assert kwargs["guidelines"] == "rules"
+        assert kwargs["max_wait"] == 5
+        assert output.exists()
+
+    def test_writes_to_stdout_by_default(self, tmp_path):
+        (tmp_path / "one.diff").write_text("+ a")
+
+        with patch("code_reviewer.cli.run_batch") as mock_run:
+            main(["batch", str(tmp_path)])
+
+        assert mock_run.call_args[0][1] is sys.stdout
+
+    def test_no_items_exits(self, tmp_path, capsys):
+        with pytest.raises(SystemExit) as exc_info:
+            main(["batch", str(tmp_path)])
+        assert exc_info.value.code == 1
+        assert "No diffs found" in capsys.readouterr().err
+
+    def test_ndjson_streams_comments(self, monkeypatch, capsys):
+        monkeypatch.setattr("sys.stdin", FakeStdin("+ code"))
+        comments = [
+            ReviewComment(file="a.py", line=1, severity="error", comment="one"),
+            ReviewComment(file="b.py", line=2, severity="warning", comment="two"),
+        ]
+
+        with patch("code_reviewer.cli.review_stream", return_value=iter(comments)) as mock_stream:
+            main(["--ndjson", "-c", "ctx"])
+
+        assert mock_stream.call_args.kwargs["context"] == "ctx"
+        lines = capsys.readouterr().out.splitlines()
+        assert [json.loads(line)["comment"] for line in lines] == ["one", "two"]
+
+    def test_ndjson_with_incremental(self, monkeypatch, capsys, tmp_path):
+        monkeypatch.setattr("sys.stdin", FakeStdin("+ code"))
+        comments = [ReviewComment(file="a.py", line=1, severity="error", comment="one")]
+
+        with patch("code_reviewer.cli.review_incremental", return_value=comments):
+            main(["--ndjson", "--incremental", str(tmp_path / "state.json")])
+
+        assert json.loads(capsys.readouterr().out)["comment"] == "one"
+
+    def test_sarif_streams_comments(self, monkeypatch, capsys):
+        monkeypatch.setattr("sys.stdin", FakeStdin("+ code"))
+        comments = [
+            ReviewComment(file="a.py", line=1, severity="error", comment="one"),
+            ReviewComment(file="b.py", line=2, severity="suggestion", comment="two"),
+        ]
+
+        with patch("code_reviewer.cli.review_stream", return_value=iter(comments)):
+            main(["--sarif"])
+
+        results = json.loads(capsys.readouterr().out)["runs"][0]["results"]
+        assert [(r["message"]["text"], r["level"]) for r in results] == [("one", "error"), ("two", "note")]
+
+    def test_sarif_stays_valid_when_the_review_fails(self, monkeypatch, capsys):
+        monkeypatch.setattr("sys.stdin", FakeStdin("+ code"))
+
+        def failing(*args, **kwargs):
+            yield ReviewComment(file="a.py", line=1, severity="error", comment="one")
+            raise RuntimeError("provider down")
+
+        with patch("code_reviewer.cli.review_stream", side_effect=failing):
+            with pytest.raises(RuntimeError):
+                main(["--sarif"])
+
+        [result] = json.loads(capsys.readouterr().out)["runs"][0]["results"]
+        assert result["message"]["text"] == "one"
+
+    def test_sarif_with_incremental(self, monkeypatch, capsys, tmp_path):
+        monkeypatch.setattr("sys.stdin", FakeStdin("+ code"))
+        comments = [ReviewComment(file="a.py", line=1, severity="error", comment="one")]
+
+        with patch("code_reviewer.cli.review_incremental", return_value=comments):
+            main(["--sarif", "--incremental", str(tmp_path / "state.json")])
+
+        [result] = json.loads(capsys.readouterr().out)["runs"][0]["results"]
+        assert result["ruleId"] == "error"
+
+    def test_budget_flags(self, monkeypatch, capsys):
+        monkeypatch.setattr("sys.stdin", FakeStdin("+ code"))
+        found = [ReviewComment(file="auth.py", line=1, severity="error", comment="one")]
+
+        def partial(diff, **kwargs):
+            kwargs["budget"].reserve(10**6)
+            kwargs["budget"].skip(["docs.md"])
+            return found
+
+        with patch("code_reviewer.cli.review", side_effect=partial) as mock_review:
+            main(["--json", "--max-tokens", "5000", "--max-seconds", "60"])
+
+        budget = mock_review.call_args.kwargs["budget"]
+        assert (budget.max_tokens, budget.max_seconds) == (5000, 60)
+        captured = capsys.readouterr()
+        assert json.loads(captured.out)[0]["comment"] == "one"
+        assert "Stopped at the token budget of 5000; skipped 1 files:\n  docs.md" in captured.err
+
+    def test_streamed_budget_summary(self, monkeypatch, capsys):
+        monkeypatch.setattr("sys.stdin", FakeStdin("+ code"))
+
+        def partial(diff, **kwargs):
+            kwargs["budget"].skip(["b.py"])
+            return iter([])
+
+        with patch("code_reviewer.cli.review_stream", side_effect=partial):
+            main(["--ndjson", "--max-seconds", "1"])
+
+        assert "skipped 1 files:\n  b.py" in capsys.readouterr().err
+
+    def test_no_budget_by_default(self, monkeypatch):
+        monkeypatch.setattr("sys.stdin", FakeStdin("+ code"))
+        with patch("code_reviewer.cli.review", return_value=[]) as mock_review:
+            main([])
+        assert mock_review.call_args.kwargs["budget"] is None
+
+    def test_budget_with_server_rejected(self, capsys):
+        with pytest.raises(SystemExit):
+            main(["--server", "localhost:1", "--max-tokens", "10"])
+        assert "--max-seconds and --max-tokens" in capsys.readouterr().err
+
+    def test_json_and_ndjson_are_exclusive(self):
+        with pytest.raises(SystemExit):
+            parse_args(["--json", "--ndjson"])
+        with pytest.raises(SystemExit):
+            parse_args(["--ndjson", "--sarif"])
+
+
+class TestServe:
+    def test_dispatches_subcommand(self, tmp_path):
+        guidelines = tmp_path / "rules.md"
+        guidelines.write_text("rules")
+
+        with patch("code_reviewer.serve.serve") as mock_serve:
+            main(["serve", "--listen", "unix:/tmp/cr.sock", "-g", str(guidelines), "--concurrency", "2"])
+
+        mock_serve.assert_called_once_with("unix:/tmp/cr.sock", guidelines="rules", concurrency=2, queue_size=32)
+
+    def test_server_flag_uses_daemon(self, monkeypatch, capsys):
+        monkeypatch.setattr("sys.stdin", FakeStdin("+ code"))
+        comments = [ReviewComment(file="a.py", line=1, severity="error", comment="bug")]
+
+        with patch("code_reviewer.client.request_review", return_value=comments) as mock_request:
+            with patch("code_reviewer.cli.review") as mock_review:
+                main(["--server", "127.0.0.1:9", "--json", "-c", "ctx"])
+
+        mock_request.assert_called_once_with("127.0.0.1:9", "+ code", context="ctx", guidelines=None)
+        mock_review.assert_not_called()
+        assert json.loads(capsys.readouterr().out)[0]["comment"] == "bug"
+
+    def test_server_error_exits(self, monkeypatch, capsys):
+        monkeypatch.setattr("sys.stdin", FakeStdin("+ code"))
+
+        with patch("code_reviewer.client.request_review", side_effect=ConnectionRefusedError("refused")):
+            with pytest.raises(SystemExit) as exc_info:
+                main(["--server", "127.0.0.1:9"])
+
+        assert exc_info.value.code == 1
+        assert "refused" in capsys.readouterr().err
+
+    def test_server_and_incremental_are_exclusive(self, capsys):
+        with pytest.raises(SystemExit):
+            main(["--server", "127.0.0.1:9", "--incremental", "state.json"])
+        assert "--incremental" in capsys.readouterr().err
+
+
+class TestBulkMain:
+    def test_appends_and_resumes(self, tmp_path, capsys):
+        source = tmp_path / "diffs.jsonl"
+        source.write_text("\n".join(json.dumps({"id": i, "diff": f"+ {i}"}) for i in ("a", "b")))
+        output = tmp_path / "out.jsonl"
+        output.write_text('{"id": "a", "comments": []}\n')
+
+        with patch("code_reviewer.bulk.review", return_value=[]) as mock_review:
+            main(["bulk", str(source), "-o", str(output), "--workers", "2"])
+
+        mock_review.assert_called_once()
+        assert [json.loads(line)["id"] for line in output.read_text().splitlines()] == ["a", "b"]
+        assert "Reviewed 1 diffs (0 failed, 1 already done)" in capsys.readouterr().err
+
+    def test_stdout_and_failure_exit(self, tmp_path, capsys):
+        (tmp_path / "one.diff").write_text("+ a")
+
+        with patch("code_reviewer.bulk.review", side_effect=RuntimeError("boom")):
+            with pytest.raises(SystemExit) as exc_info:
+                main(["bulk", str(tmp_path)])
+
+        assert exc_info.value.code == 1
+        assert json.loads(capsys.readouterr().out) == {"id": "one", "error": "boom"}
+
+    def test_no_items_exits(self, tmp_path, capsys):
+        with pytest.raises(SystemExit):
+            main(["bulk", str(tmp_path)])
+        assert "No diffs found" in capsys.readouterr().err
+
+
+class TestStats:
+    COMMENTS = [ReviewComment(file="a.py", line=1, severity="error", comment="bug")]
+
+    def test_stats_to_stderr(self, monkeypatch, capsys):
+        monkeypatch.setattr("sys.stdin", FakeStdin("+ code"))
+
+        with patch("code_reviewer.cli.review", return_value=self.COMMENTS) as mock_review:
+            main(["--stats"])
+
+        assert isinstance(mock_review.call_args.kwargs["stats"], Stats)
+        err = capsys.readouterr().err
+        assert "Stages: read" in err
+        assert "1 comments" in err
+
+    def test_stats_sidecar_and_metrics(self, monkeypatch, tmp_path):
+        monkeypatch.setattr("sys.stdin", FakeStdin("+ code"))
+        sidecar, metrics = tmp_path / "stats.json", tmp_path / "review.prom"
+
+        with patch("code_reviewer.cli.review", return_value=self.COMMENTS):
+            main(["--stats", str(sidecar), "--metrics", str(metrics)])
+
+        assert json.loads(sidecar.read_text())["seconds"]["read"] >= 0
+        assert "code_reviewer_comments 1" in metrics.read_text()
+
+    def test_stats_for_streamed_and_remote_reviews(self, monkeypatch, tmp_path):
+        metrics = tmp_path / "metrics.jsonl"
+        monkeypatch.setattr("sys.stdin", FakeStdin("+ code"))
+        with patch("code_reviewer.cli.review_stream", return_value=iter(self.COMMENTS)):
+            main(["--ndjson", "--metrics", str(metrics)])
+
+        monkeypatch.setattr("sys.stdin", FakeStdin("+ code"))
+        with patch("code_reviewer.client.request_review", return_value=self.COMMENTS):
+            main(["--server", "127.0.0.1:9", "--metrics", str(metrics)])
+
+        records = [json.loads(line) for line in metrics.read_text().splitlines()]
+        assert [r["comments"] for r in records] == [0, 1]
+
+    def test_no_report_by_default(self, monkeypatch, capsys):
+        monkeypatch.setattr("sys.stdin", FakeStdin("+ code"))
+        with patch("code_reviewer.cli.review", return_value=[]):
+            main([])
+        assert capsys.readouterr().err == ""
+
+
+class TestPositions:
+    DIFF = "--- a/a.py\n+++ b/a.py\n@@ -1,1 +1,2 @@\n x\n+y"
+
+    def test_json_includes_anchor(self, monkeypatch, capsys):
+        monkeypatch.setattr("sys.stdin", FakeStdin(self.DIFF))
+        comments = [ReviewComment(file="a.py", line=9, severity="error", comment="bug")]
+
+        with patch("code_reviewer.cli.review", return_value=comments):
+            main(["--json", "--positions"])
+
+        record = json.loads(capsys.readouterr().out)[0]
+        assert (record["line"], record["position"], record["status"], record["original_line"]) == (2, 2, "snapped", 9)
+
+    def test_streamed_and_listed_ndjson(self, monkeypatch, capsys):
+        comments = [ReviewComment(file="a.py", line=1, severity="error", comment="bug")]
+        monkeypatch.setattr("sys.stdin", FakeStdin(self.DIFF))
+        with patch("code_reviewer.cli.review_stream", return_value=iter(comments)):
+            main(["--ndjson", "--positions"])
+        monkeypatch.setattr("sys.stdin", FakeStdin(self.DIFF))
+        with patch("code_reviewer.cli.review_incremental", return_value=comments):
+            main(["--ndjson", "--positions", "--incremental", "state.json"])
+
+        records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert [r["position"] for r in records] == [1, 1]
+
+
+class TestGitRange:
+    DIFF = "--- a/a.py\n+++ b/a.py\n@@ -1,1 +1,2 @@\n x\n+y"
+
+    @pytest.fixture
+    def git(self, monkeypatch):
+        from code_reviewer.git import Range
+
+        monkeypatch.setattr("sys.stdin", FakeStdin(""))
+        reviewed = Range(merge_base="mb", head="h2", start="h1", commits=["h2 add y"], skipped=["h1 add x"])
+        with (
+            patch("code_reviewer.git.branch_name", return_value="feature"),
+            patch("code_reviewer.git.review_range", return_value=reviewed) as review_range,
+            patch("code_reviewer.git.diff_between", return_value=self.DIFF) as diff_between,
+        ):
+            yield review_range, diff_between
+
+    def test_since_last_reviews_range_and_saves_state(self, git, tmp_path, capsys):
+        review_range, diff_between = git
+        state_path = tmp_path / "state.json"
+
+        with patch("code_reviewer.cli.review", return_value=[]) as mock_review:
+            main(["--base", "origin/main", "--since-last", str(state_path)])
+
+        assert review_range.call_args[0][:2] == ("origin/main", "HEAD")
+        assert diff_between.call_args[0] == ("h1", "h2")
+        assert mock_review.call_args[0][0] == self.DIFF
+        err = capsys.readouterr().err
+        assert "Skipping 1 commits reviewed in a previous run:\n  h1 add x" in err
+        assert "Reviewing 1 commits:\n  h2 add y" in err
+        assert json.loads(state_path.read_text()) == {"branches": {"feature": {"merge_base": "mb", "head": "h2"}}}
+
+    def test_positions_counted_in_whole_branch(self, git, capsys):
+        _, diff_between = git
+
+        with patch("code_reviewer.cli.review", return_value=[]):
+            main(["--base", "main", "--head", "feature", "--positions", "--json"])
+
+        assert [c[0] for c in diff_between.call_args_list] == [("h1", "h2"), ("mb", "h2")]
+
+    def test_no_new_commits(self, git, tmp_path, capsys):
+        _, diff_between = git
+        diff_between.return_value = ""
+
+        with patch("code_reviewer.cli.review") as mock_review:
+            main(["--base", "main", "--json", "--since-last", str(tmp_path / "state.json")])
+
+        mock_review.assert_not_called()
+        assert json.loads(capsys.readouterr().out) == []
+        assert (tmp_path / "state.json").exists()
+
+    def test_streamed_review_saves_state(self, git, tmp_path):
+        with patch("code_reviewer.cli.review_stream", return_value=iter([])):
+            main(["--base", "main", "--ndjson", "--since-last", str(tmp_path / "state.json")])
+
+        assert (tmp_path / "state.json").exists()
+
+    def test_budget_cut_short_does_not_save_state(self, git, tmp_path, capsys):
+        def partial(diff, **kwargs):
+            kwargs["budget"].skip(["a.py"])
+            return []
+
+        with patch("code_reviewer.cli.review", side_effect=partial):
+            main(["--base", "main", "--max-seconds", "30", "--since-last", str(tmp_path / "state.json")])
+
+        assert "Stopped at the time budget of 30s; skipped 1 files:\n  a.py" in capsys.readouterr().err
+        assert not (tmp_path / "state.json").exists()
+
+    def test_git_error(self, git, capsys):
+        from code_reviewer.git import GitError
+
+        git[0].side_effect = GitError("Unknown revision 'nope' or 'HEAD'")
+        with pytest.raises(SystemExit) as exc:
+            main(["--base", "nope"])
+        assert exc.value.code == 1
+        assert "Unknown revision" in capsys.readouterr().err
+
+    @pytest.mark.parametrize("argv", [["--head", "x"], ["--since-last", "state.json"]])
+    def test_requires_base(self, argv, monkeypatch, capsys):
+        monkeypatch.setattr("sys.stdin", FakeStdin(self.DIFF))
+        with pytest.raises(SystemExit):
+            main(argv)
+        assert "require --base" in capsys.readouterr().err
+
+
+class TestStreamedStdin:
+    def test_stdin_is_passed_lazily(self, monkeypatch):
+        monkeypatch.setattr("sys.stdin", FakeStdin("\n\n--- a/x.py\n+++ b/x.py\n"))
+
+        with patch("code_reviewer.cli.review", return_value=[]) as mock_review:
+            main([])
+
+        diff = mock_review.call_args[0][0]
+        assert not isinstance(diff, str)
+        assert list(diff) == ["--- a/x.py\n", "+++ b/x.py\n"]
+
+    def test_blank_stdin_is_empty(self, monkeypatch, capsys):
+        monkeypatch.setattr("sys.stdin", FakeStdin("\n  \n"))
+        with pytest.raises(SystemExit):
+            main(["--ndjson"])
+        assert "Empty diff" in capsys.readouterr().err
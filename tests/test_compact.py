@@ -0,0 +1,64 @@
+from code_reviewer.compact import CompactionReport, compact_diff
+from code_reviewer.diff import estimate_tokens, parse_diff
+
+
+def _file(path: str, *hunks: str) -> str:
+    return "\n".join([f"diff --git a/{path} b/{path}", f"--- a/{path}", f"+++ b/{path}", *hunks])
+
+
+CONTEXT = [f" context {i}" for i in range(3)]
+
+REAL = "\n".join(["@@ -10,7 +10,7 @@ def handler():", *CONTEXT, "-    return run(query)", "+    return run(escape(query))", *CONTEXT])
+WHITESPACE = "\n".join(["@@ -30,2 +30,2 @@", "-if x:", "-    y()", "+if  x:", "+\ty()"])
+DELETION = "\n".join(["@@ -50,2 +49,0 @@", "-old_one()", "-old_two()"])
+
+
+class TestCompactDiff:
+    def test_within_budget_is_untouched(self):
+        diff = _file("a.py", REAL)
+        result, report = compact_diff(diff, 10_000)
+        assert result is diff
+        assert not report.compacted
+
+    def test_drops_whitespace_only_hunks_first(self):
+        diff = _file("a.py", REAL, WHITESPACE)
+        budget = estimate_tokens(_file("a.py", REAL))
+
+        result, report = compact_diff(diff, budget)
+
+        assert result == _file("a.py", REAL)
+        assert report.whitespace_hunks == 1
+        assert report.deletion_hunks == report.context_lines == 0
+
+    def test_drops_deletion_only_hunks(self):
+        diff = _file("a.py", REAL, DELETION)
+        result, report = compact_diff(diff, estimate_tokens(_file("a.py", REAL)))
+        assert "old_one" not in result
+        assert report.deletion_hunks == 1
+
+    def test_shrinks_context_and_rewrites_header(self):
+        diff = _file("a.py", REAL)
+        result, report = compact_diff(diff, estimate_tokens(diff) - 5)
+
+        hunk = list(parse_diff(result.splitlines()))[0].hunks[0]
+        assert hunk.header == "@@ -12,3 +12,3 @@ def handler():"
+        assert hunk.lines == [" context 2", "-    return run(query)", "+    return run(escape(query))", " context 0"]
+        assert report.context_lines == 4
+        assert report.tokens_after < report.tokens_before
+
+    def test_zero_context_when_needed(self):
+        diff = _file("a.py", REAL)
+        result, report = compact_diff(diff, 1)
+
+        hunk = list(parse_diff(result.splitlines()))[0].hunks[0]
+        assert hunk.header == "@@ -13,1 +13,1 @@ def handler():"
+        assert report.context_lines == 6
+        assert report.tokens_after > 1
+
+    def test_keeps_pathless_input(self):
+        result, _ = compact_diff("just some text " * 20, 1)
+        assert result == "just some text " * 20
+
+    def test_report_addition(self):
+        total = CompactionReport(1, 3, 4, 100, 50) + CompactionReport(1, 1, 1, 10, 10)
+        assert total == CompactionReport(2, 4, 5, 110, 60)
@@ -0,0 +1,217 @@
+from code_reviewer.diff import (
+    EXACT,
+    FILE,
+    INVALID,
+    OLD,
+    SNAPPED,
+    DiffIndex,
+    FileDiff,
+    estimate_tokens,
+    parse_diff,
+    shard_files,
+    split_diff,
+)
+from code_reviewer.llm import _parse_comments
+
+DIFF = """\
+diff --git a/src/app.py b/src/app.py
+index 1111111..2222222 100644
+--- a/src/app.py
++++ b/src/app.py
+@@ -1,3 +1,4 @@
+ import os
++import sys
+ 
+ def main():
+@@ -10,2 +11,2 @@ def main():
+--- old comment
++-- new comment
+ return 0
+diff --git a/src/old.py b/src/old.py
+deleted file mode 100644
+--- a/src/old.py
++++ /dev/null
+@@ -1 +0,0 @@
+-print("bye")
+\\ No newline at end of file"""
+
+
+def _hunk_file(path: str, hunks: int, body_lines: int = 20) -> str:
+    parts = [f"diff --git a/{path} b/{path}", f"--- a/{path}", f"+++ b/{path}"]
+    for i in range(hunks):
+        start = i * 100 + 1
+        parts.append(f"@@ -{start},0 +{start},{body_lines} @@")
+        parts.extend(f"+line {i}-{n} of {path}" for n in range(body_lines))
+    return "\n".join(parts)
+
+
+class TestEstimateTokens:
+    def test_empty(self):
+        assert estimate_tokens("") == 0
+
+    def test_rounds_up(self):
+        assert estimate_tokens("abcde") == 2
+
+
+class TestParseDiff:
+    def test_files_and_paths(self):
+        files = list(parse_diff(DIFF.splitlines()))
+        assert [f.path for f in files] == ["src/app.py", "src/old.py"]
+
+    def test_hunks(self):
+        app = next(parse_diff(DIFF.splitlines()))
+        assert len(app.hunks) == 2
+        first = app.hunks[0]
+        assert (first.old_start, first.old_count, first.new_start, first.new_count) == (1, 3, 1, 4)
+
+    def test_removed_line_resembling_header_stays_in_hunk(self):
+        app = next(parse_diff(DIFF.splitlines()))
+        assert app.hunks[1].lines[0] == "--- old comment"
+
+    def test_no_newline_marker_attached_to_hunk(self):
+        old = list(parse_diff(DIFF.splitlines()))[1]
+        assert old.hunks[0].lines[-1].startswith("\\")
+
+    def test_round_trip(self):
+        files = parse_diff(DIFF.splitlines())
+        assert "\n".join(f.text for f in files) == DIFF
+
+    def test_non_diff_input_kept_verbatim(self):
+        files = list(parse_diff(["+ new line", "something else"]))
+        assert len(files) == 1
+        assert files[0].path == ""
+        assert files[0].text == "+ new line\nsomething else"
+
+    def test_plain_unified_diff_without_git_header(self):
+        text = "--- a.txt\n+++ a.txt\n@@ -1 +1 @@\n-a\n+b\n--- b.txt\n+++ b.txt\n@@ -1 +1 @@\n-c\n+d"
+        files = list(parse_diff(text.splitlines()))
+        assert [f.path for f in files] == ["a.txt", "b.txt"]
+
+    def test_missing_counts_default_to_one(self):
+        files = list(parse_diff(["--- a/x", "+++ b/x", "@@ -3 +3 @@", "-a", "+b"]))
+        hunk = files[0].hunks[0]
+        assert hunk.old_count == 1
+        assert hunk.new_count == 1
+
+
+class TestShardFiles:
+    def test_packs_small_files_together(self):
+        files = [FileDiff(path="a", header=["a"]), FileDiff(path="b", header=["b"])]
+        assert list(shard_files(files, 100)) == ["a\nb"]
+
+    def test_splits_files_across_shards(self):
+        files = list(parse_diff((_hunk_file("a.py", 1) + "\n" + _hunk_file("b.py", 1)).splitlines()))
+        budget = max(estimate_tokens(f.text) for f in files)
+        shards = list(shard_files(files, budget))
+        assert len(shards) == 2
+        assert "a.py" in shards[0] and "b.py" not in shards[0]
+        assert "b.py" in shards[1]
+
+    def test_splits_large_file_on_hunks_with_header(self):
+        files = list(parse_diff(_hunk_file("big.py", 4).splitlines()))
+        budget = estimate_tokens(files[0].text) // 2
+        shards = list(shard_files(files, budget))
+        assert len(shards) >= 2
+        for shard in shards:
+            assert shard.startswith("diff --git a/big.py b/big.py")
+        body = [line for shard in shards for line in shard.splitlines() if line.startswith("+line")]
+        assert body == [line for line in files[0].text.splitlines() if line.startswith("+line")]
+
+    def test_oversized_hunk_gets_own_shard(self):
+        files = list(parse_diff(_hunk_file("huge.py", 1, body_lines=200).splitlines()))
+        shards = list(shard_files(files, 10))
+        assert len(shards) == 1
+
+    def test_headerless_hunks(self):
+        lines = ["@@ -1,0 +1,1 @@", "+a" * 50, "@@ -9,0 +10,1 @@", "+b" * 50]
+        files = list(parse_diff(lines))
+        shards = list(shard_files(files, 30))
+        assert shards == ["@@ -1,0 +1,1 @@\n" + "+a" * 50, "@@ -9,0 +10,1 @@\n" + "+b" * 50]
+
+
+class TestSplitDiff:
+    def test_small_diff_unchanged(self):
+        assert split_diff(DIFF, 10_000) == [DIFF]
+
+    def test_large_diff_sharded_in_order(self):
+        diff = "\n".join(_hunk_file(f"f{i}.py", 1) for i in range(5))
+        budget = estimate_tokens(_hunk_file("f0.py", 1)) + 5
+        shards = split_diff(diff, budget)
+        assert len(shards) == 5
+        assert [s.splitlines()[0] for s in shards] == [
+            f"diff --git a/f{i}.py b/f{i}.py" for i in range(5)
+        ]
+
+
+class TestDiffIndex:
+    # Positions: app.py header 0, lines 1-4, second header 5, lines 6-9; util.py header 0, lines 1-2.
+    INDEX_DIFF = """\
+diff --git a/src/app.py b/src/app.py
+--- a/src/app.py
++++ b/src/app.py
+@@ -1,3 +1,3 @@
+ a
+-b
++B
+ c
+@@ -20,3 +20,4 @@ def f():
+ x
++y
+ z
+\\ No newline at end of file
+diff --git a/gone.py b/gone.py
+deleted file mode 100644
+--- a/gone.py
++++ /dev/null
+@@ -1,2 +0,0 @@
+-one
+-two
+diff --git a/src/util.py b/src/util.py
+--- a/src/util.py
++++ b/src/util.py
+@@ -5,1 +5,2 @@
+ keep
++added"""
+
+    def setup_method(self):
+        self.index = DiffIndex.from_diff(self.INDEX_DIFF)
+
+    def test_exact_lines_map_to_positions(self):
+        assert [self.index.anchor("src/app.py", line).position for line in (1, 2, 3, 20, 21, 22)] == [1, 3, 4, 6, 7, 8]
+        anchor = self.index.anchor("src/util.py", 6)
+        assert (anchor.status, anchor.line, anchor.side, anchor.position) == (EXACT, 6, "RIGHT", 2)
+
+    def test_snaps_to_nearest_hunk(self):
+        assert (self.index.anchor("src/app.py", 5).line, self.index.anchor("src/app.py", 5).status) == (3, SNAPPED)
+        assert self.index.anchor("src/app.py", 18).line == 20
+        assert self.index.anchor("src/app.py", 500).line == 22
+        assert self.index.anchor("src/util.py", 1).line == 5
+
+    def test_removed_lines_of_the_old_file(self):
+        anchor = self.index.anchor("gone.py", 2)
+        assert (anchor.status, anchor.side, anchor.position) == (OLD, "LEFT", 2)
+        assert self.index.anchor("gone.py", 9).status == INVALID
+
+    def test_file_level_and_unknown_files(self):
+        assert self.index.anchor("src/app.py", None).status == FILE
+        assert self.index.anchor("other.py", 1).status == INVALID
+
+    def test_non_integer_lines_are_invalid(self):
+        assert self.index.anchor("src/app.py", "2").status == INVALID
+        assert self.index.anchor("src/app.py", 2.5).status == INVALID
+
+    def test_model_lines_written_as_strings_or_floats(self):
+        reply = '[{"file": "src/app.py", "line": "21", "comment": "a"}, {"file": "src/app.py", "line": 2.0, "comment": "b"}]'
+        anchors = [self.index.anchor(c.file, c.line) for c in _parse_comments(reply)]
+        assert [(a.status, a.position) for a in anchors] == [(EXACT, 7), (EXACT, 3)]
+
+    def test_path_prefixes_are_normalized(self):
+        assert self.index.anchor("b/src/app.py", 1).status == EXACT
+        assert self.index.anchor("./src/util.py", 5).status == EXACT
+
+    def test_many_hunks(self):
+        hunks = "\n".join(f"@@ -{n},1 +{n},1 @@\n-old\n+new" for n in range(10, 10_000, 10))
+        index = DiffIndex.from_diff(f"--- a/big.py\n+++ b/big.py\n{hunks}")
+        assert index.anchor("big.py", 5000).status == EXACT
+        assert index.anchor("big.py", 5004).line == 5000
+        assert index.anchor("big.py", 5006).line == 5010
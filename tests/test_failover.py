@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+import pytest
+
+from code_reviewer.budget import BudgetExceeded
+from code_reviewer.failover import Race, Tier, acomplete_chain, complete_chain, stream_chain
+from code_reviewer.llm import Completion
+from code_reviewer.stats import Usage
+
+CHAIN = [Tier("local", "llama3"), Tier("openai", "gpt-4o")]
+
+
+def _usable(completion):
+    return completion.text.startswith("[")
+
+
+class TestCompleteChain:
+    def test_single_tier_is_called_directly(self):
+        completion = complete_chain(Race(CHAIN[:1], _usable), lambda tier: Completion("[]"))
+        assert (completion.text, completion.provider) == ("[]", "local")
+
+    def test_unusable_reply_falls_over(self):
+        replies = {"local": "sorry", "openai": "[1]"}
+        completion = complete_chain(Race(CHAIN, _usable), lambda tier: Completion(replies[tier.provider]))
+        assert (completion.text, completion.provider) == ("[1]", "openai")
+
+    def test_unusable_reply_is_kept_when_every_tier_fails(self):
+        def attempt(tier):
+            if tier.provider == "openai":
+                raise ValueError("down")
+            return Completion("sorry")
+
+        assert complete_chain(Race(CHAIN, _usable), attempt).text == "sorry"
+
+    def test_past_deadline_raises(self):
+        def attempt(tier):
+            time.sleep(1)
+            return Completion("[]")
+
+        with pytest.raises(BudgetExceeded):
+            complete_chain(Race(CHAIN, _usable, deadline=time.monotonic() + 0.05), attempt)
+
+    def test_async_falls_over(self):
+        async def attempt(tier):
+            if tier.provider == "local":
+                raise ValueError("down")
+            return Completion("[]")
+
+        completion = asyncio.run(acomplete_chain(Race(CHAIN, _usable), attempt))
+        assert completion.provider == "openai"
+
+
+class TestStreamChain:
+    def test_falls_over_before_first_chunk_and_collects_usage(self):
+        def open_stream(tier):
+            if tier.provider == "local":
+                raise ValueError("connection refused")
+            yield "[]"
+            yield Usage(input_tokens=10, output_tokens=1)
+
+        reply = Completion("")
+        assert list(stream_chain(CHAIN, open_stream, reply)) == ["[]"]
+        assert (reply.provider, reply.usage) == ("openai", Usage(input_tokens=10, output_tokens=1))
+
+    def test_budget_exceeded_does_not_fall_over(self):
+        def open_stream(tier):
+            raise BudgetExceeded("out of time")
+            yield
+
+        with pytest.raises(BudgetExceeded):
+            list(stream_chain(CHAIN, open_stream, Completion("")))
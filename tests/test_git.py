@@ -0,0 +1,139 @@
+import json
+import subprocess
+
+import pytest
+
+from code_reviewer.git import (
+    GitError,
+    RangeState,
+    branch_name,
+    commits,
+    diff_between,
+    is_ancestor,
+    review_range,
+)
+
+
+def _run(*args: str) -> str:
+    return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+
+
+def _commit(path: str, text: str, message: str) -> str:
+    with open(path, "w") as f:
+        f.write(text)
+    _run("add", path)
+    _run("commit", "-q", "-m", message)
+    return _run("rev-parse", "HEAD")
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for var in ("AUTHOR", "COMMITTER"):
+        monkeypatch.setenv(f"GIT_{var}_NAME", "Test")
+        monkeypatch.setenv(f"GIT_{var}_EMAIL", "test@example.com")
+    _run("init", "-q", "-b", "main")
+    _run("config", "diff.noprefix", "true")  # must not leak into the diffs we read
+    _commit("app.py", "x = 1\n", "initial")
+    _run("checkout", "-q", "-b", "feature")
+    return tmp_path
+
+
+class TestGitHelpers:
+    def test_commits_and_diff(self, repo):
+        first = _commit("app.py", "x = 2\n", "change x")
+        _commit("util.py", "y = 1\n", "add util")
+
+        assert [c.split(" ", 1)[1] for c in commits("main", "feature")] == ["change x", "add util"]
+        diff = diff_between("main", first)
+        assert "--- a/app.py\n+++ b/app.py" in diff
+        assert "+x = 2" in diff
+        assert is_ancestor(first, "feature")
+        assert not is_ancestor("feature", first)
+
+    def test_branch_name(self, repo):
+        assert branch_name("HEAD") == "feature"
+        assert branch_name("no-such-rev") == "no-such-rev"
+
+    def test_errors(self, repo):
+        with pytest.raises(GitError, match="Unknown revision 'nope'"):
+            review_range("nope")
+
+
+class TestReviewRange:
+    def test_whole_branch_without_state(self, repo):
+        _commit("app.py", "x = 2\n", "change x")
+        reviewed = review_range("main")
+
+        assert reviewed.start == reviewed.merge_base == _run("rev-parse", "main")
+        assert len(reviewed.commits) == 1
+        assert reviewed.skipped == []
+        assert reviewed.summary().startswith("Reviewing 1 commits:\n  ")
+
+    def test_since_last_reviews_only_new_commits(self, repo):
+        first = _commit("app.py", "x = 2\n", "change x")
+        state = RangeState(repo / "state.json")
+        state.record("feature", review_range("main", state=state, branch="feature"))
+        state.save()
+        _commit("util.py", "y = 1\n", "add util")
+
+        state = RangeState.load(repo / "state.json")
+        reviewed = review_range("main", state=state, branch="feature")
+
+        assert reviewed.start == first
+        assert [c.split(" ", 1)[1] for c in reviewed.commits] == ["add util"]
+        assert [c.split(" ", 1)[1] for c in reviewed.skipped] == ["change x"]
+        diff = diff_between(reviewed.start, reviewed.head)
+        assert "util.py" in diff and "app.py" not in diff
+        assert "Skipping 1 commits reviewed in a previous run:" in reviewed.summary()
+
+    def test_nothing_new(self, repo):
+        _commit("app.py", "x = 2\n", "change x")
+        state = RangeState(repo / "state.json")
+        state.record("feature", review_range("main"))
+
+        reviewed = review_range("main", state=state, branch="feature")
+        assert reviewed.commits == []
+        assert reviewed.summary().endswith("No new commits to review.")
+
+    def test_rewritten_history_reviews_whole_branch(self, repo, caplog):
+        _commit("app.py", "x = 2\n", "change x")
+        state = RangeState(repo / "state.json")
+        state.record("feature", review_range("main"))
+        _run("commit", "-q", "--amend", "-m", "change x again")
+
+        with caplog.at_level("INFO", logger="code_reviewer.git"):
+            reviewed = review_range("main", state=state, branch="feature")
+
+        assert reviewed.start == reviewed.merge_base
+        assert reviewed.skipped == []
+        assert "no longer on HEAD" in caplog.text
+
+    def test_moved_merge_base_reviews_whole_branch(self, repo, caplog):
+        _commit("app.py", "x = 2\n", "change x")
+        state = RangeState(repo / "state.json")
+        state.record("feature", review_range("main"))
+        _run("checkout", "-q", "main")
+        _commit("other.py", "z = 1\n", "upstream change")
+        _run("checkout", "-q", "feature")
+        _run("merge", "-q", "--no-edit", "main")
+
+        with caplog.at_level("INFO", logger="code_reviewer.git"):
+            reviewed = review_range("main", state=state, branch="feature")
+
+        assert reviewed.start == reviewed.merge_base == _run("rev-parse", "main")
+        assert "Merge-base with main moved" in caplog.text
+
+
+class TestRangeState:
+    def test_round_trip(self, tmp_path):
+        path = tmp_path / "nested" / "state.json"
+        state = RangeState(path, {"feature": {"merge_base": "a", "head": "b"}})
+        state.save()
+        assert json.loads(path.read_text()) == {"branches": {"feature": {"merge_base": "a", "head": "b"}}}
+        assert RangeState.load(path).branches == state.branches
+
+    def test_missing_or_corrupt(self, tmp_path):
+        assert RangeState.load(tmp_path / "missing.json").branches == {}
+        (tmp_path / "bad.json").write_text("{")
+        assert RangeState.load(tmp_path / "bad.json").branches == {}
@@ -0,0 +1,128 @@
+import json
+
+import pytest
+
+from code_reviewer import guidelines
+from code_reviewer.guidelines import GuidelinesIndex, Section, load_index
+
+GUIDELINES = """\
+Be concise.
+
+## General
+Prefer small functions.
+
+## Python
+Use type hints.
+
+### Errors
+Never use bare except.
+
+## Go
+Wrap errors with %w.
+
+## Frontend
+<!-- Applies to: *.tsx, web/ -->
+No inline styles.
+
+### Tests
+Use testing-library.
+"""
+
+
+@pytest.fixture(autouse=True)
+def _fresh_memo(monkeypatch):
+    monkeypatch.setattr(guidelines, "_indexes", {})
+
+
+class TestParse:
+    def test_sections_are_tagged(self):
+        index = GuidelinesIndex.parse(GUIDELINES)
+        assert [(s.text.splitlines()[0], s.globs) for s in index.sections] == [
+            ("Be concise.", []),
+            ("## General", []),
+            ("## Python", ["*.py", "*.pyi"]),
+            ("### Errors", ["*.py", "*.pyi"]),
+            ("## Go", ["*.go"]),
+            ("## Frontend", ["*.tsx", "web/"]),
+            ("### Tests", ["*.tsx", "web/"]),
+        ]
+
+    def test_applies_to_line_is_stripped(self):
+        frontend = GuidelinesIndex.parse(GUIDELINES).sections[5]
+        assert frontend.text == "## Frontend\nNo inline styles."
+
+    def test_applies_to_overrides_heading(self):
+        index = GuidelinesIndex.parse("## Python\nApplies to: scripts/*.py\nOnly scripts.")
+        assert index.sections[0].globs == ["scripts/*.py"]
+
+    def test_lowercase_go_and_c_are_words(self):
+        assert GuidelinesIndex.parse("## How to go about a review").sections[0].globs == []
+        assert GuidelinesIndex.parse("## C and C++").sections[0].globs == [
+            "*.c", "*.h", "*.cc", "*.cpp", "*.cxx", "*.hh", "*.hpp"
+        ]
+
+    def test_languages_mentioned_later_do_not_scope(self):
+        text = "# Security\n\n## Avoid SQL injection\nUse parameters.\n\n## Don't shell out with user input\nNever."
+        index = GuidelinesIndex.parse(text)
+        assert [s.globs for s in index.sections] == [[], [], []]
+        assert "Use parameters." in index.select(["app/db.py"]) and "Never." in index.select(["app/db.py"])
+        assert GuidelinesIndex.parse("## TypeScript components").sections[0].globs == ["*.ts", "*.tsx"]
+
+    def test_fenced_code_is_part_of_its_section(self):
+        text = (
+            "## Python\nAvoid bare except:\n\n```python\n# bad\ntry:\n    run()\nexcept:\n    pass\n"
+            "# Applies to: *\n```\n\n~~~~\n## not a heading\n~~~\n~~~~\n\n## Go\nWrap errors."
+        )
+        index = GuidelinesIndex.parse(text)
+        assert [s.globs for s in index.sections] == [["*.py", "*.pyi"], ["*.go"]]
+        assert "# bad" in index.sections[0].text and "## not a heading" in index.sections[0].text
+        assert index.select(["main.go"]) == "## Go\nWrap errors."
+
+
+class TestSelect:
+    def test_only_matching_sections(self):
+        selected = GuidelinesIndex.parse(GUIDELINES).select(["src/app/models.py"])
+        assert "Use type hints." in selected and "Never use bare except." in selected
+        assert "Prefer small functions." in selected and "Be concise." in selected
+        assert "Wrap errors" not in selected and "No inline styles." not in selected
+
+    def test_directory_glob(self):
+        selected = GuidelinesIndex.parse(GUIDELINES).select(["web/index.html"])
+        assert "No inline styles." in selected and "testing-library" in selected
+        assert "Use type hints." not in selected
+
+    def test_no_paths_keeps_everything(self):
+        assert GuidelinesIndex.parse(GUIDELINES).select([]) == GUIDELINES.strip().replace(
+            "<!-- Applies to: *.tsx, web/ -->\n", ""
+        )
+
+    def test_section_applies_everywhere_without_globs(self):
+        assert Section("x").applies_to(["any.rs"])
+
+
+class TestLoadIndex:
+    def test_memoized_by_content(self):
+        assert load_index(GUIDELINES) is load_index(GUIDELINES)
+        assert load_index(GUIDELINES) is not load_index(GUIDELINES + "\nMore.")
+
+    def test_cached_on_disk_by_hash(self, tmp_path, monkeypatch):
+        index = load_index(GUIDELINES, tmp_path)
+        [path] = (tmp_path / "guidelines").iterdir()
+        assert json.loads(path.read_text())["sections"][2] == {
+            "text": "## Python\nUse type hints.",
+            "globs": ["*.py", "*.pyi"],
+        }
+
+        # A later run reads the index back instead of parsing.
+        monkeypatch.setattr(guidelines, "_indexes", {})
+        monkeypatch.setattr(GuidelinesIndex, "parse", classmethod(lambda cls, text: pytest.fail("parsed")))
+        assert load_index(GUIDELINES, tmp_path) == index
+
+    def test_corrupt_cache_is_rebuilt(self, tmp_path):
+        load_index(GUIDELINES, tmp_path)
+        [path] = (tmp_path / "guidelines").iterdir()
+        path.write_text("{not json")
+        guidelines._indexes.clear()
+
+        assert load_index(GUIDELINES, tmp_path).sections[0].text == "Be concise."
+        assert json.loads(path.read_text())["sections"][0]["text"] == "Be concise."
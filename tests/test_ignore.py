@@ -0,0 +1,99 @@
+from code_reviewer.diff import parse_diff
+from code_reviewer.ignore import (
+    DEFAULT_IGNORE_PATTERNS,
+    filter_diff,
+    is_binary,
+    is_ignored,
+    load_patterns,
+)
+
+
+def _file(path: str, body: str = "+x") -> str:
+    return f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n@@ -1,0 +1,1 @@\n{body}"
+
+
+BINARY = "diff --git a/logo.png b/logo.png\nindex 1..2 100644\nBinary files a/logo.png and b/logo.png differ"
+
+
+class TestIsIgnored:
+    def test_defaults(self):
+        for path in (
+            "uv.lock",
+            "frontend/package-lock.json",
+            "static/app.min.js",
+            "tests/__snapshots__/view.test.js.snap",
+            "src/vendor/lib/a.go",
+            "node_modules/x/index.js",
+            "api/service_pb2.py",
+        ):
+            assert is_ignored(path, DEFAULT_IGNORE_PATTERNS), path
+
+    def test_regular_source_kept(self):
+        for path in ("src/app.py", "lockfile.py", "docs/vendor.md", "src/distance.py"):
+            assert not is_ignored(path, DEFAULT_IGNORE_PATTERNS), path
+
+    def test_negation_reincludes(self):
+        assert not is_ignored("vendor/ours/a.go", ["vendor/*", "!vendor/ours/*"])
+        assert is_ignored("vendor/theirs/a.go", ["vendor/*", "!vendor/ours/*"])
+
+    def test_last_match_wins(self):
+        assert is_ignored("a.lock", ["*.lock", "!a.lock", "*.lock"])
+
+    def test_anchored_pattern(self):
+        assert is_ignored("build/out.js", ["/build/*"])
+        assert not is_ignored("src/build/out.js", ["/build/*"])
+
+    def test_directory_pattern_with_trailing_slash(self):
+        assert is_ignored("src/gen/models.py", ["gen/"])
+        assert not is_ignored("generate.py", ["gen/"])
+
+
+class TestLoadPatterns:
+    def test_missing_file_uses_defaults(self, tmp_path):
+        assert load_patterns(str(tmp_path / "missing")) == DEFAULT_IGNORE_PATTERNS
+
+    def test_appends_file_patterns(self, tmp_path):
+        path = tmp_path / "ignore"
+        path.write_text("# comment\n\n*.csv\n!uv.lock\n")
+        assert load_patterns(str(path)) == DEFAULT_IGNORE_PATTERNS + ["*.csv", "!uv.lock"]
+
+    def test_env_override(self, tmp_path, monkeypatch):
+        path = tmp_path / "ignore"
+        path.write_text("*.csv\n")
+        monkeypatch.setenv("CODE_REVIEWER_IGNORE_FILE", str(path))
+        assert load_patterns()[-1] == "*.csv"
+
+
+class TestFilterDiff:
+    def test_drops_ignored_and_binary_files(self):
+        diff = "\n".join([_file("src/app.py"), _file("uv.lock", "+" + "x" * 400), BINARY])
+        filtered, report = filter_diff(diff, DEFAULT_IGNORE_PATTERNS)
+
+        assert filtered == _file("src/app.py")
+        assert report.files == ["uv.lock", "logo.png"]
+        assert report.bytes == len(_file("uv.lock", "+" + "x" * 400)) + len(BINARY)
+        assert report.tokens > 100
+
+    def test_unchanged_when_nothing_dropped(self):
+        diff = _file("src/app.py") + "\n"
+        filtered, report = filter_diff(diff, DEFAULT_IGNORE_PATTERNS)
+        assert filtered is diff
+        assert report.files == []
+
+    def test_non_diff_input_kept(self):
+        filtered, _ = filter_diff("+ new line", DEFAULT_IGNORE_PATTERNS)
+        assert filtered == "+ new line"
+
+    def test_everything_dropped(self):
+        filtered, report = filter_diff(_file("uv.lock"), DEFAULT_IGNORE_PATTERNS)
+        assert filtered == ""
+        assert report.files == ["uv.lock"]
+
+
+class TestIsBinary:
+    def test_git_binary_patch(self):
+        file = next(parse_diff(["diff --git a/x.bin b/x.bin", "GIT binary patch", "literal 10"]))
+        assert is_binary(file)
+
+    def test_text_file(self):
+        assert not is_binary(next(parse_diff(_file("a.py").splitlines())))
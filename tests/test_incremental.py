@@ -0,0 +1,184 @@
+import json
+from unittest.mock import patch
+
+from code_reviewer.budget import Budget
+from code_reviewer.incremental import HunkState, review_incremental
+from code_reviewer.output import ReviewComment
+from code_reviewer.stats import Stats
+
+V1 = """\
+diff --git a/app.py b/app.py
+--- a/app.py
++++ b/app.py
+@@ -10,2 +10,3 @@
+ a = 1
++b = eval(x)
+ c = 3
+@@ -40,2 +41,3 @@
+ d = 4
++e = 5
+ f = 6"""
+
+# A new hunk above shifts the unchanged eval() hunk down by two lines.
+V2 = """\
+diff --git a/app.py b/app.py
+--- a/app.py
++++ b/app.py
+@@ -1,1 +1,3 @@
+ import os
++import sys
++import json
+@@ -10,2 +12,3 @@
+ a = 1
++b = eval(x)
+ c = 3
+@@ -40,2 +43,3 @@
+ d = 4
++e = 5
+ f = 6"""
+
+
+def _run(diff, state, response):
+    with patch("code_reviewer.incremental.review", return_value=response) as mock_review:
+        comments = review_incremental(diff, state)
+    return comments, mock_review
+
+
+class TestReviewIncremental:
+    def test_first_run_reviews_everything(self, tmp_path):
+        state = tmp_path / "state.json"
+        found = [ReviewComment(file="app.py", line=11, severity="error", comment="eval")]
+
+        comments, mock_review = _run(V1, state, found)
+
+        assert comments == found
+        assert mock_review.call_args[0][0] == V1
+        assert len(json.loads(state.read_text())["hunks"]) == 2
+
+    def test_unchanged_hunks_replayed_and_reanchored(self, tmp_path):
+        state = tmp_path / "state.json"
+        _run(V1, state, [ReviewComment(file="app.py", line=11, severity="error", comment="eval")])
+
+        comments, mock_review = _run(V2, state, [])
+
+        sent = mock_review.call_args[0][0]
+        assert "+import sys" in sent
+        assert "eval" not in sent
+        assert "+e = 5" not in sent
+        assert comments == [ReviewComment(file="app.py", line=13, severity="error", comment="eval")]
+
+    def test_no_provider_call_when_nothing_changed(self, tmp_path):
+        state = tmp_path / "state.json"
+        _run(V1, state, [])
+
+        comments, mock_review = _run(V1, state, [])
+
+        mock_review.assert_not_called()
+        assert comments == []
+
+    def test_comments_returned_in_diff_order(self, tmp_path):
+        state = tmp_path / "state.json"
+        _run(V1, state, [ReviewComment(file="app.py", line=11, severity="error", comment="eval")])
+
+        new = ReviewComment(file="app.py", line=2, severity="warning", comment="unused")
+        comments, _ = _run(V2, state, [new])
+
+        assert [c.comment for c in comments] == ["unused", "eval"]
+
+    def test_state_pruned_to_current_hunks(self, tmp_path):
+        state = tmp_path / "state.json"
+        _run(V2, state, [])
+        _run(V1, state, [])
+        assert len(json.loads(state.read_text())["hunks"]) == 2
+
+    def test_settings_change_invalidates_state(self, tmp_path, monkeypatch):
+        state = tmp_path / "state.json"
+        monkeypatch.setenv("CODE_REVIEWER_MODEL", "a")
+        _run(V1, state, [])
+        monkeypatch.setenv("CODE_REVIEWER_MODEL", "b")
+
+        _, mock_review = _run(V1, state, [])
+
+        mock_review.assert_called_once()
+
+    def test_comment_outside_hunks_snaps_to_nearest(self, tmp_path):
+        state = tmp_path / "state.json"
+        far = ReviewComment(file="app.py", line=100, severity="warning", comment="far")
+        _run(V1, state, [far])
+
+        comments, _ = _run(V2, state, [])
+
+        assert comments == [ReviewComment(file="app.py", line=102, severity="warning", comment="far")]
+
+    def test_unknown_file_comment_not_remembered(self, tmp_path):
+        state = tmp_path / "state.json"
+        stray = ReviewComment(file="other.py", line=None, severity="suggestion", comment="stray")
+
+        comments, _ = _run(V1, state, [stray])
+        assert comments == [stray]
+
+        comments, _ = _run(V1, state, [])
+        assert comments == []
+
+    def test_files_skipped_by_budget_stay_pending(self, tmp_path):
+        state = tmp_path / "state.json"
+        budget = Budget(max_tokens=1)
+
+        def skip_all(diff, **kwargs):
+            kwargs["budget"].skip(["app.py"])
+            return []
+
+        with patch("code_reviewer.incremental.review", side_effect=skip_all):
+            review_incremental(V1, state, budget=budget)
+        assert json.loads(state.read_text())["hunks"] == {}
+
+        _, mock_review = _run(V1, state, [])
+        assert mock_review.call_args[0][0] == V1
+
+    def test_string_and_float_lines_from_the_model(self, tmp_path, monkeypatch):
+        from code_reviewer.llm import Completion
+
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        state = tmp_path / "state.json"
+        reply = '[{"file": "app.py", "line": "11", "comment": "eval"}, {"file": "app.py", "line": 42.0, "comment": "e"}]'
+
+        with patch("code_reviewer.llm._call_openai", return_value=Completion(reply)):
+            review_incremental(V1, state)
+        comments, _ = _run(V2, state, [])
+
+        assert [(c.line, c.comment) for c in comments] == [(13, "eval"), (44, "e")]
+
+    def test_reply_without_array_stays_pending(self, tmp_path, monkeypatch):
+        from code_reviewer.llm import Completion
+
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        state = tmp_path / "state.json"
+        stats = Stats()
+
+        with patch("code_reviewer.llm._call_openai", return_value=Completion("Sorry, I'm overloaded.")):
+            assert review_incremental(V1, state, stats=stats) == []
+        assert json.loads(state.read_text())["hunks"] == {}
+        assert (stats.requests, stats.unanswered) == (1, ["app.py"])
+
+        _, mock_review = _run(V1, state, [])
+        assert mock_review.call_args[0][0] == V1
+
+    def test_non_diff_input(self, tmp_path):
+        state = tmp_path / "state.json"
+        note = ReviewComment(file="unknown", line=None, severity="suggestion", comment="note")
+        _run("+ new line", state, [note])
+
+        comments, mock_review = _run("+ new line", state, [])
+
+        mock_review.assert_not_called()
+        assert comments == [note]
+
+
+class TestHunkState:
+    def test_load_missing_file(self, tmp_path):
+        assert HunkState.load(tmp_path / "missing.json").hunks == {}
+
+    def test_load_corrupt_file(self, tmp_path):
+        path = tmp_path / "state.json"
+        path.write_text("{")
+        assert HunkState.load(path).hunks == {}
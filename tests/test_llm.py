@@ -1,20 +1,56 @@
+import asyncio
 import json
 import os
-from unittest.mock import MagicMock, patch
+import threading
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
 from code_reviewer.llm import (
-    BATCH_POLL_INTERVAL,
+    BATCH_MAX_WAIT,
+    BATCH_POLL_INITIAL,
+    BATCH_POLL_MAX,
+    DEFAULT_CONTEXT_TOKENS,
     DEFAULT_LOCAL_BASE_URL,
     DEFAULT_MODELS,
+    MIN_INPUT_TOKENS,
+    BatchPollError,
+    Completion,
+    Usage,
+    _acomplete,
+    _complete,
+    _acall_anthropic_batch,
+    _acall_anthropic_messages,
     _call_anthropic,
+    _call_anthropic_batch,
+    _call_anthropic_messages,
+    _anthropic_usage,
+    _call_openai,
+    _get_async_client,
+    _get_cache,
+    _get_chain,
+    _get_client,
+    _get_context_tokens,
     _get_model,
+    _get_mode,
     _get_provider,
+    _input_budget,
+    _openai_usage,
     _parse_comments,
+    _poll_delays,
+    _stream_anthropic,
+    _stream_openai,
+    areview,
     review,
+    review_stream,
 )
+from code_reviewer.budget import Budget
+from code_reviewer.diff import estimate_tokens
 from code_reviewer.output import ReviewComment
+from code_reviewer.prompt import CONTINUATION_PROMPT, build_user_prompt
+from code_reviewer.stats import Stats
+from code_reviewer.triage import TRIAGE_SYSTEM_PROMPT
 
 
 class TestGetProvider:
@@ -91,8 +127,18 @@ class TestParseComments:
         result = _parse_comments(raw)
         assert result[0].file == "unknown"
 
+    def test_recovers_complete_objects_from_truncated_array(self):
+        raw = '[{"file": "a.py", "comment": "one"}, {"file": "b.py", "comment": "two"}, {"file": "c.py", "comm'
+        result = _parse_comments(raw)
+        assert [c.comment for c in result] == ["one", "two"]
+
+    def test_recovers_from_invalid_json(self):
+        raw = 'Here you go: [{"comment": "ok"}, {"comment": oops}] and [done]'
+        result = _parse_comments(raw)
+        assert [c.comment for c in result] == ["ok"]
+
 
-class TestCallAnthropic:
+class TestCallAnthropicBatch:
     def _make_mock_client(self, processing_calls_before_done=0, result_type="succeeded", result_text="[]"):
         client = MagicMock()
 
@@ -125,22 +171,23 @@ class TestCallAnthropic:
             result_text='[{"file": "a.py", "line": 1, "severity": "error", "comment": "bug"}]',
         )
 
-        with patch("code_reviewer.llm.Anthropic", return_value=client):
-            result = _call_anthropic("system", "user", "model")
+        with patch("code_reviewer.llm._get_client", return_value=client):
+            result = _call_anthropic_batch("system", "user", "model")
 
-        assert "bug" in result
+        assert "bug" in result.text
+        assert result.generating == 0.0
         client.messages.batches.create.assert_called_once()
         assert client.messages.batches.retrieve.call_count == 2
-        mock_sleep.assert_called_once_with(BATCH_POLL_INTERVAL)
+        mock_sleep.assert_called_once_with(BATCH_POLL_INITIAL)
 
     @patch("code_reviewer.llm.time.sleep")
     def test_batch_immediate_completion(self, mock_sleep):
         client = self._make_mock_client(processing_calls_before_done=0, result_text="[]")
 
-        with patch("code_reviewer.llm.Anthropic", return_value=client):
-            result = _call_anthropic("system", "user", "model")
+        with patch("code_reviewer.llm._get_client", return_value=client):
+            result = _call_anthropic_batch("system", "user", "model")
 
-        assert result == "[]"
+        assert result.text == "[]"
         mock_sleep.assert_not_called()
 
     @patch("code_reviewer.llm.time.sleep")
@@ -152,17 +199,19 @@ class TestCallAnthropic:
         client.messages.batches.create.return_value = batch
         client.messages.batches.retrieve.return_value = batch
 
-        with patch("code_reviewer.llm.Anthropic", return_value=client):
+        with patch("code_reviewer.llm._get_client", return_value=client):
             with pytest.raises(TimeoutError):
-                _call_anthropic("system", "user", "model")
+                _call_anthropic_batch("system", "user", "model")
+
+        assert sum(call.args[0] for call in mock_sleep.call_args_list) == BATCH_MAX_WAIT
 
     @patch("code_reviewer.llm.time.sleep")
     def test_batch_errored_result(self, mock_sleep):
         client = self._make_mock_client(result_type="errored")
 
-        with patch("code_reviewer.llm.Anthropic", return_value=client):
+        with patch("code_reviewer.llm._get_client", return_value=client):
             with pytest.raises(RuntimeError, match="errored"):
-                _call_anthropic("system", "user", "model")
+                _call_anthropic_batch("system", "user", "model")
 
     @patch("code_reviewer.llm.time.sleep")
     def test_batch_no_results(self, mock_sleep):
@@ -174,9 +223,124 @@ class TestCallAnthropic:
         client.messages.batches.retrieve.return_value = batch
         client.messages.batches.results.return_value = []
 
-        with patch("code_reviewer.llm.Anthropic", return_value=client):
+        with patch("code_reviewer.llm._get_client", return_value=client):
             with pytest.raises(RuntimeError, match="no results"):
-                _call_anthropic("system", "user", "model")
+                _call_anthropic_batch("system", "user", "model")
+
+
+class TestCallAnthropicMessages:
+    def test_streams_text_and_reports_timing(self):
+        client = MagicMock()
+        stream = client.messages.stream.return_value.__enter__.return_value
+        stream.text_stream = iter(['[{"file": "a.py", ', '"comment": "bug"}]'])
+        stream.get_final_message.return_value.usage = MagicMock(
+            input_tokens=100, cache_read_input_tokens=900, cache_creation_input_tokens=0, output_tokens=50
+        )
+
+        with patch("code_reviewer.llm._get_client", return_value=client):
+            result = _call_anthropic_messages("system", "user", "model")
+
+        assert result.text == '[{"file": "a.py", "comment": "bug"}]'
+        assert result.queued >= 0
+        assert result.generating >= 0
+        assert result.usage == Usage(input_tokens=1000, cached_tokens=900, output_tokens=50)
+        kwargs = client.messages.stream.call_args.kwargs
+        assert kwargs["system"] == [{"type": "text", "text": "system", "cache_control": {"type": "ephemeral"}}]
+        assert kwargs["messages"] == [{"role": "user", "content": "user"}]
+        assert not result.truncated
+
+    def test_continuation_replays_previous_reply(self):
+        client = MagicMock()
+        stream = client.messages.stream.return_value.__enter__.return_value
+        stream.text_stream = iter(["[]"])
+        stream.get_final_message.return_value.stop_reason = "max_tokens"
+
+        with patch("code_reviewer.llm._get_client", return_value=client):
+            result = _call_anthropic_messages("system", "user", "model", previous="[1]")
+
+        assert result.truncated
+        messages = client.messages.stream.call_args.kwargs["messages"]
+        assert [m["role"] for m in messages] == ["user", "assistant", "user"]
+        assert messages[1]["content"] == "[1]"
+        assert messages[2]["content"] == CONTINUATION_PROMPT
+
+    def test_empty_stream(self):
+        client = MagicMock()
+        client.messages.stream.return_value.__enter__.return_value.text_stream = iter([])
+
+        with patch("code_reviewer.llm._get_client", return_value=client):
+            result = _call_anthropic_messages("system", "user", "model")
+
+        assert result.text == ""
+        assert result.generating == 0
+
+
+class TestUsage:
+    def test_openai_usage_with_cache_details(self):
+        usage = MagicMock(prompt_tokens=1200, completion_tokens=30)
+        usage.prompt_tokens_details.cached_tokens = 1024
+        assert _openai_usage(usage) == Usage(input_tokens=1200, cached_tokens=1024, output_tokens=30)
+
+    def test_openai_usage_without_details(self):
+        usage = MagicMock(prompt_tokens=10, completion_tokens=2, prompt_tokens_details=None)
+        assert _openai_usage(usage) == Usage(input_tokens=10, cached_tokens=0, output_tokens=2)
+
+    def test_openai_usage_missing(self):
+        assert _openai_usage(None) == Usage()
+
+    def test_anthropic_usage_counts_cache_writes_as_input(self):
+        usage = MagicMock(
+            input_tokens=50, cache_read_input_tokens=0, cache_creation_input_tokens=2000, output_tokens=10
+        )
+        assert _anthropic_usage(usage) == Usage(input_tokens=2050, cached_tokens=0, output_tokens=10)
+
+    def test_add(self):
+        assert Usage(1, 2, 3) + Usage(10, 20, 30) == Usage(11, 22, 33)
+
+    def test_review_logs_totals(self, monkeypatch, caplog):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        monkeypatch.setenv("CODE_REVIEWER_SHARD_TOKENS", "50")
+        diff = "\n".join(f"--- a/f{i}\n+++ b/f{i}\n@@ -1 +1 @@\n-{'a' * 80}\n+{'b' * 80}" for i in range(2))
+        completion = Completion("[]", usage=Usage(input_tokens=1000, cached_tokens=800, output_tokens=5))
+
+        with patch("code_reviewer.llm._call_openai", return_value=completion):
+            with caplog.at_level("INFO", logger="code_reviewer.llm"):
+                review(diff)
+
+        assert "2000 input (1600 cached, 400 uncached), 10 output" in caplog.text
+
+
+class TestAnthropicMode:
+    def test_defaults_to_interactive(self, monkeypatch):
+        monkeypatch.delenv("CODE_REVIEWER_MODE", raising=False)
+        assert _get_mode() == "interactive"
+
+    def test_rejects_unknown_mode(self, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_MODE", "fast")
+        with pytest.raises(ValueError, match="CODE_REVIEWER_MODE"):
+            _get_mode()
+
+    def test_interactive_uses_messages_api(self, monkeypatch):
+        monkeypatch.delenv("CODE_REVIEWER_MODE", raising=False)
+        with patch("code_reviewer.llm._call_anthropic_messages", return_value=Completion("[]")) as mock_call:
+            _call_anthropic("system", "user", "model")
+        mock_call.assert_called_once_with("system", "user", "model", None)
+
+    def test_batch_mode_uses_batches_api(self, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_MODE", "batch")
+        with patch("code_reviewer.llm._call_anthropic_batch", return_value=Completion("[]")) as mock_call:
+            _call_anthropic("system", "user", "model")
+        mock_call.assert_called_once_with("system", "user", "model", None)
+
+
+class TestPollDelays:
+    def test_exponential_then_capped(self):
+        delays = list(_poll_delays(200))
+        assert delays[:3] == [BATCH_POLL_INITIAL, BATCH_POLL_INITIAL * 2, BATCH_POLL_INITIAL * 4]
+        assert max(delays) == BATCH_POLL_MAX
+
+    def test_total_bounded_by_max_wait(self):
+        assert sum(_poll_delays(45)) == 45
 
 
 class TestReview:
@@ -189,7 +353,7 @@ class TestReview:
             {"file": "x.py", "line": 5, "severity": "warning", "comment": "issue"},
         ])
 
-        with patch("code_reviewer.llm._call_openai", return_value=response_json) as mock_call:
+        with patch("code_reviewer.llm._call_openai", return_value=Completion(response_json)) as mock_call:
             result = review("diff content", context="test context")
             mock_call.assert_called_once()
             args, kwargs = mock_call.call_args
@@ -206,7 +370,7 @@ class TestReview:
 
         response_json = json.dumps([])
 
-        with patch("code_reviewer.llm._call_openai", return_value=response_json) as mock_call:
+        with patch("code_reviewer.llm._call_openai", return_value=Completion(response_json)) as mock_call:
             result = review("diff")
             mock_call.assert_called_once()
             _, kwargs = mock_call.call_args
@@ -222,7 +386,7 @@ class TestReview:
             {"file": "a.py", "line": 1, "severity": "error", "comment": "bad"},
         ])
 
-        with patch("code_reviewer.llm._call_anthropic", return_value=response_json) as mock_call:
+        with patch("code_reviewer.llm._call_anthropic", return_value=Completion(response_json)) as mock_call:
             result = review("diff", guidelines="be strict")
             mock_call.assert_called_once()
 
@@ -233,8 +397,1294 @@ class TestReview:
 
         response_json = json.dumps([])
 
-        with patch("code_reviewer.llm._call_openai", return_value=response_json) as mock_call:
+        with patch("code_reviewer.llm._call_openai", return_value=Completion(response_json)) as mock_call:
             review("diff", guidelines="check for XSS")
             args = mock_call.call_args[0]
             system_prompt = args[0]
             assert "check for XSS" in system_prompt
+
+    def test_large_diff_is_sharded(self, monkeypatch):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        monkeypatch.setenv("CODE_REVIEWER_SHARD_TOKENS", "50")
+        monkeypatch.setenv("CODE_REVIEWER_WORKERS", "3")
+
+        files = [
+            f"diff --git a/f{i}.py b/f{i}.py\n--- a/f{i}.py\n+++ b/f{i}.py\n@@ -1,0 +1,1 @@\n+{'x' * 100}"
+            for i in range(4)
+        ]
+
+        def fake_call(system, user, model, base_url=None, api_key=None, previous=None):
+            path = next(f"f{i}.py" for i in range(4) if f"a/f{i}.py" in user)
+            return Completion(json.dumps([{"file": path, "line": 1, "comment": "c"}]))
+
+        with patch("code_reviewer.llm._call_openai", side_effect=fake_call) as mock_call:
+            result = review("\n".join(files))
+
+        assert mock_call.call_count == 4
+        assert [c.file for c in result] == ["f0.py", "f1.py", "f2.py", "f3.py"]
+
+    def test_cache_skips_provider_on_repeat(self, monkeypatch, tmp_path):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        monkeypatch.setenv("CODE_REVIEWER_CACHE_DIR", str(tmp_path))
+
+        response_json = json.dumps([{"file": "a.py", "line": 2, "comment": "c"}])
+
+        with patch("code_reviewer.llm._call_openai", return_value=Completion(response_json)) as mock_call:
+            first = review("diff", context="ctx")
+            second = review("diff", context="ctx")
+            review("diff", context="other ctx")
+
+        assert first == second
+        assert mock_call.call_count == 2
+        cache = _get_cache()
+        assert (cache.hits, cache.misses) == (1, 2)
+
+    def test_reply_without_array_is_not_cached(self, monkeypatch, tmp_path):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        monkeypatch.setenv("CODE_REVIEWER_CACHE_DIR", str(tmp_path))
+
+        with patch("code_reviewer.llm._call_openai", return_value=Completion("Sorry, I'm overloaded.")) as mock_call:
+            assert review("diff") == []
+            assert review("diff") == []
+        with patch("code_reviewer.llm._stream_openai", return_value=iter(["Sorry, I'm overloaded."])):
+            assert list(review_stream("diff")) == []
+
+        assert mock_call.call_count == 2
+        assert list(tmp_path.glob("*.json")) == []
+
+    def test_cache_disabled_by_default(self, monkeypatch):
+        monkeypatch.delenv("CODE_REVIEWER_CACHE_DIR", raising=False)
+        assert _get_cache() is None
+
+
+class TestStreams:
+    def test_stream_openai_yields_deltas(self):
+        client = MagicMock()
+        chunks = []
+        for content in ["[", None, "]"]:
+            chunk = MagicMock()
+            chunk.choices = [MagicMock()]
+            chunk.choices[0].delta.content = content
+            chunk.usage = None
+            chunks.append(chunk)
+        last = MagicMock()
+        last.choices = []
+        last.usage.prompt_tokens, last.usage.completion_tokens = 12, 3
+        last.usage.prompt_tokens_details = None
+        client.chat.completions.create.return_value = iter(chunks + [last])
+
+        with patch("code_reviewer.llm._get_client", return_value=client):
+            assert list(_stream_openai("system", "user", "model")) == ["[", "]", Usage(12, 0, 3)]
+        assert client.chat.completions.create.call_args.kwargs["stream"] is True
+        assert client.chat.completions.create.call_args.kwargs["stream_options"] == {"include_usage": True}
+        assert "timeout" not in client.chat.completions.create.call_args.kwargs
+
+    def test_stream_timeout_is_passed_to_the_client(self, monkeypatch):
+        monkeypatch.delenv("CODE_REVIEWER_MODE", raising=False)
+        client = MagicMock()
+        client.chat.completions.create.return_value = iter([])
+        client.messages.stream.return_value.__enter__.return_value.text_stream = iter([])
+
+        with patch("code_reviewer.llm._get_client", return_value=client):
+            list(_stream_openai("system", "user", "model", timeout=2.5))
+            list(_stream_anthropic("system", "user", "model", timeout=2.5))
+        assert client.chat.completions.create.call_args.kwargs["timeout"] == 2.5
+        assert client.messages.stream.call_args.kwargs["timeout"] == 2.5
+
+    def test_stream_anthropic_interactive(self, monkeypatch):
+        monkeypatch.delenv("CODE_REVIEWER_MODE", raising=False)
+        client = MagicMock()
+        stream = client.messages.stream.return_value.__enter__.return_value
+        stream.text_stream = iter(["[", "]"])
+        usage = stream.get_final_message.return_value.usage
+        usage.input_tokens, usage.output_tokens = 20, 4
+        usage.cache_read_input_tokens = usage.cache_creation_input_tokens = 0
+
+        with patch("code_reviewer.llm._get_client", return_value=client):
+            assert list(_stream_anthropic("system", "user", "model")) == ["[", "]", Usage(20, 0, 4)]
+
+    def test_stream_anthropic_batch_yields_whole_text(self, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_MODE", "batch")
+        completion = Completion("[]", usage=Usage(5, 0, 1))
+        with patch("code_reviewer.llm._call_anthropic_batch", return_value=completion):
+            assert list(_stream_anthropic("system", "user", "model")) == ["[]", Usage(5, 0, 1)]
+
+
+class TestReviewStream:
+    def test_yields_comments_incrementally(self, monkeypatch):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        seen = []
+
+        def fake_stream(system, user, model, base_url=None, api_key=None):
+            yield '[{"file": "a.py", "comment": "one"},'
+            seen.append("after first")
+            yield ' {"file": "b.py", "comment": "two"}]'
+
+        with patch("code_reviewer.llm._stream_openai", side_effect=fake_stream):
+            stream = review_stream("diff")
+            first = next(stream)
+            assert first.comment == "one"
+            assert seen == []
+            assert [c.comment for c in stream] == ["two"]
+
+    def test_anthropic_provider(self, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_PROVIDER", "anthropic")
+        with patch("code_reviewer.llm._stream_anthropic", return_value=iter(['[{"comment": "x"}]'])) as mock_stream:
+            assert [c.comment for c in review_stream("diff")] == ["x"]
+        mock_stream.assert_called_once()
+
+    def test_sharded_stream_collects_all(self, monkeypatch):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        monkeypatch.setenv("CODE_REVIEWER_SHARD_TOKENS", "50")
+        files = [
+            f"diff --git a/f{i}.py b/f{i}.py\n--- a/f{i}.py\n+++ b/f{i}.py\n@@ -1,0 +1,1 @@\n+{'x' * 100}"
+            for i in range(3)
+        ]
+
+        def fake_stream(system, user, model, base_url=None, api_key=None):
+            path = next(f"f{i}.py" for i in range(3) if f"a/f{i}.py" in user)
+            yield json.dumps([{"file": path, "comment": "c"}])
+
+        with patch("code_reviewer.llm._stream_openai", side_effect=fake_stream):
+            result = list(review_stream("\n".join(files)))
+
+        assert sorted(c.file for c in result) == ["f0.py", "f1.py", "f2.py"]
+
+    def test_shard_error_propagates(self, monkeypatch):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        monkeypatch.setenv("CODE_REVIEWER_SHARD_TOKENS", "10")
+        diff = "\n".join(f"--- a/f{i}\n+++ b/f{i}\n@@ -1 +1 @@\n-{'a' * 40}\n+{'b' * 40}" for i in range(2))
+
+        with patch("code_reviewer.llm._stream_openai", side_effect=RuntimeError("boom")):
+            with pytest.raises(RuntimeError, match="boom"):
+                list(review_stream(diff))
+
+    def test_uses_cache(self, monkeypatch, tmp_path):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        monkeypatch.setenv("CODE_REVIEWER_CACHE_DIR", str(tmp_path))
+
+        with patch("code_reviewer.llm._stream_openai", return_value=iter(['[{"comment": "x"}]'])) as mock_stream:
+            first = list(review_stream("diff"))
+            second = list(review_stream("diff"))
+
+        assert first == second
+        mock_stream.assert_called_once()
+
+
+class TestClientPool:
+    @pytest.fixture(autouse=True)
+    def _empty_pool(self, monkeypatch):
+        monkeypatch.setattr("code_reviewer.llm._clients", {})
+
+    def test_reuses_client_per_endpoint(self):
+        first = _get_client("openai", "http://a/v1", "k1")
+        assert _get_client("openai", "http://a/v1", "k1") is first
+        assert _get_client("openai", "http://b/v1", "k1") is not first
+        assert _get_client("openai", "http://a/v1", "k2") is not first
+
+    def test_anthropic_keyed_on_env(self, monkeypatch):
+        monkeypatch.setenv("ANTHROPIC_API_KEY", "sk-one")
+        first = _get_client("anthropic")
+        assert _get_client("anthropic") is first
+        monkeypatch.setenv("ANTHROPIC_API_KEY", "sk-two")
+        assert _get_client("anthropic") is not first
+
+    def test_async_clients_per_event_loop(self, monkeypatch):
+        monkeypatch.setenv("ANTHROPIC_API_KEY", "sk-test")
+
+        async def get_twice():
+            return _get_async_client("anthropic"), _get_async_client("anthropic")
+
+        a1, a2 = asyncio.run(get_twice())
+        b1, _ = asyncio.run(get_twice())
+        assert a1 is a2
+        assert a1 is not b1
+        assert a1 is not _get_client("anthropic")
+
+    def test_call_openai_uses_pooled_client(self):
+        client = MagicMock()
+        client.chat.completions.create.return_value.choices = [MagicMock()]
+        client.chat.completions.create.return_value.choices[0].message.content = "[]"
+
+        with patch("code_reviewer.llm._get_client", return_value=client) as mock_get:
+            result = _call_openai("system", "user", "model", base_url="http://x", api_key="k")
+
+        assert result.text == "[]"
+        mock_get.assert_called_once_with("openai", "http://x", "k")
+
+
+def _async_text_stream(chunks):
+    async def gen():
+        for chunk in chunks:
+            yield chunk
+
+    return gen()
+
+
+class TestAsyncReview:
+    def test_local_provider(self, monkeypatch):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        monkeypatch.delenv("CODE_REVIEWER_BASE_URL", raising=False)
+        client = MagicMock()
+        response = MagicMock()
+        response.choices = [MagicMock()]
+        response.choices[0].message.content = '[{"file": "a.py", "line": 1, "comment": "c"}]'
+        client.chat.completions.create = AsyncMock(return_value=response)
+
+        with patch("code_reviewer.llm._get_async_client", return_value=client) as mock_get:
+            result = asyncio.run(areview("diff"))
+
+        assert [c.file for c in result] == ["a.py"]
+        mock_get.assert_called_once_with("openai", DEFAULT_LOCAL_BASE_URL, "not-needed")
+
+    def test_anthropic_interactive(self, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_PROVIDER", "anthropic")
+        monkeypatch.delenv("CODE_REVIEWER_MODE", raising=False)
+        client = MagicMock()
+        stream = client.messages.stream.return_value.__aenter__.return_value
+        stream.text_stream = _async_text_stream(['[{"comment": ', '"x"}]'])
+
+        with patch("code_reviewer.llm._get_async_client", return_value=client):
+            result = asyncio.run(areview("diff"))
+
+        assert [c.comment for c in result] == ["x"]
+
+    def test_anthropic_empty_stream(self):
+        client = MagicMock()
+        client.messages.stream.return_value.__aenter__.return_value.text_stream = _async_text_stream([])
+
+        with patch("code_reviewer.llm._get_async_client", return_value=client):
+            result = asyncio.run(_acall_anthropic_messages("system", "user", "model"))
+
+        assert result.text == ""
+
+    @patch("asyncio.sleep", new_callable=AsyncMock)
+    def test_anthropic_batch(self, mock_sleep, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_PROVIDER", "anthropic")
+        monkeypatch.setenv("CODE_REVIEWER_MODE", "batch")
+        pending = MagicMock(id="b1", processing_status="in_progress")
+        done = MagicMock(id="b1", processing_status="ended")
+        result = MagicMock()
+        result.result.type = "succeeded"
+        result.result.message.content = [MagicMock(text='[{"comment": "y"}]')]
+        client = MagicMock()
+        client.messages.batches.create = AsyncMock(return_value=pending)
+        client.messages.batches.retrieve = AsyncMock(side_effect=[pending, done])
+        client.messages.batches.results = AsyncMock(return_value=_async_text_stream([result]))
+
+        with patch("code_reviewer.llm._get_async_client", return_value=client):
+            comments = asyncio.run(areview("diff"))
+
+        assert [c.comment for c in comments] == ["y"]
+        mock_sleep.assert_awaited_once_with(BATCH_POLL_INITIAL)
+
+    @patch("asyncio.sleep", new_callable=AsyncMock)
+    def test_anthropic_batch_timeout(self, mock_sleep):
+        pending = MagicMock(id="b1", processing_status="in_progress")
+        client = MagicMock()
+        client.messages.batches.create = AsyncMock(return_value=pending)
+        client.messages.batches.retrieve = AsyncMock(return_value=pending)
+
+        with patch("code_reviewer.llm._get_async_client", return_value=client):
+            with pytest.raises(TimeoutError):
+                asyncio.run(_acall_anthropic_batch("system", "user", "model"))
+
+    def test_shards_run_concurrently_in_order(self, monkeypatch):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        monkeypatch.setenv("CODE_REVIEWER_SHARD_TOKENS", "50")
+        monkeypatch.setenv("CODE_REVIEWER_WORKERS", "2")
+        files = [
+            f"diff --git a/f{i}.py b/f{i}.py\n--- a/f{i}.py\n+++ b/f{i}.py\n@@ -1,0 +1,1 @@\n+{'x' * 100}"
+            for i in range(4)
+        ]
+        in_flight = peak = 0
+
+        async def fake_call(system, user, model, base_url=None, api_key=None, previous=None):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            index = next(i for i in range(4) if f"a/f{i}.py" in user)
+            await asyncio.sleep(0.01 * (4 - index))
+            in_flight -= 1
+            return Completion(json.dumps([{"file": f"f{index}.py", "comment": "c"}]))
+
+        with patch("code_reviewer.llm._acall_openai", side_effect=fake_call):
+            result = asyncio.run(areview("\n".join(files)))
+
+        assert [c.file for c in result] == ["f0.py", "f1.py", "f2.py", "f3.py"]
+        assert peak == 2
+
+    def test_uses_cache(self, monkeypatch, tmp_path):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        monkeypatch.setenv("CODE_REVIEWER_CACHE_DIR", str(tmp_path))
+
+        with patch("code_reviewer.llm._acall_openai", AsyncMock(return_value=Completion("[]"))) as mock_call:
+            asyncio.run(areview("diff"))
+            asyncio.run(areview("diff"))
+
+        mock_call.assert_awaited_once()
+
+
+def _openai_response(text: str, finish_reason: str = "stop") -> MagicMock:
+    response = MagicMock()
+    response.choices = [MagicMock(finish_reason=finish_reason)]
+    response.choices[0].message.content = text
+    response.usage = None
+    return response
+
+
+class TestContinuation:
+    FIRST = '[{"file": "a.py", "line": 1, "comment": "one"}, {"file": "a.py", "line": 2, "comm'
+    REST = '[{"file": "a.py", "line": 1, "comment": "one"}, {"file": "a.py", "line": 2, "comment": "two"}]'
+
+    def test_openai_finish_reason_marks_truncation(self):
+        client = MagicMock()
+        client.chat.completions.create.return_value = _openai_response(self.FIRST, "length")
+
+        with patch("code_reviewer.llm._get_client", return_value=client):
+            result = _call_openai("system", "user", "model", previous="[]")
+
+        assert result.truncated
+        messages = client.chat.completions.create.call_args.kwargs["messages"]
+        assert [m["role"] for m in messages] == ["system", "user", "assistant", "user"]
+
+    def test_continues_truncated_reply(self, monkeypatch):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        replies = [Completion(self.FIRST, truncated=True), Completion(self.REST)]
+
+        with patch("code_reviewer.llm._call_openai", side_effect=replies) as mock_call:
+            result = review("diff")
+
+        assert [c.comment for c in result] == ["one", "two"]
+        assert mock_call.call_count == 2
+        previous = json.loads(mock_call.call_args_list[1].kwargs["previous"])
+        assert [item["comment"] for item in previous] == ["one"]
+
+    def test_gives_up_after_max_continuations(self, monkeypatch, caplog):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        monkeypatch.setenv("CODE_REVIEWER_MAX_CONTINUATIONS", "1")
+
+        with patch("code_reviewer.llm._call_openai", return_value=Completion(self.FIRST, truncated=True)) as mock_call:
+            with caplog.at_level("WARNING", logger="code_reviewer.llm"):
+                result = review("diff")
+
+        assert [c.comment for c in result] == ["one"]
+        assert mock_call.call_count == 2
+        assert "still truncated after 1 continuations" in caplog.text
+
+    def test_async_continues_truncated_reply(self, monkeypatch):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        replies = [Completion(self.FIRST, truncated=True), Completion(self.REST)]
+
+        with patch("code_reviewer.llm._acall_openai", AsyncMock(side_effect=replies)) as mock_call:
+            result = asyncio.run(areview("diff"))
+
+        assert [c.comment for c in result] == ["one", "two"]
+        assert mock_call.await_count == 2
+
+    def test_anthropic_batch_stop_reason(self):
+        client = MagicMock()
+        client.messages.batches.retrieve.return_value = MagicMock(id="b1", processing_status="ended")
+        result = MagicMock()
+        result.result.type = "succeeded"
+        result.result.message.content = [MagicMock(text=self.FIRST)]
+        result.result.message.stop_reason = "max_tokens"
+        client.messages.batches.results.return_value = iter([result])
+
+        with patch("code_reviewer.llm._get_client", return_value=client):
+            completion = _call_anthropic_batch("system", "user", "model", previous="[]")
+
+        assert completion.truncated
+        request = client.messages.batches.create.call_args.kwargs["requests"][0]
+        assert request["params"]["messages"][1] == {"role": "assistant", "content": "[]"}
+
+
+def _rate_limited(retry_after="2"):
+    error = RuntimeError("rate limited")
+    error.status_code = 429
+    error.response = MagicMock(headers={"retry-after": retry_after})
+    return error
+
+
+class TestRetries:
+    @pytest.fixture(autouse=True)
+    def _fresh_limiters(self, monkeypatch):
+        monkeypatch.setattr("code_reviewer.llm._limiters", {})
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+
+    @patch("code_reviewer.llm.time.sleep")
+    def test_retries_rate_limit_honouring_retry_after(self, mock_sleep):
+        replies = [_rate_limited(), Completion('[{"comment": "x"}]')]
+
+        with patch("code_reviewer.llm._call_openai", side_effect=replies) as mock_call:
+            result = review("diff")
+
+        assert [c.comment for c in result] == ["x"]
+        assert mock_call.call_count == 2
+        mock_sleep.assert_called_once_with(2)
+
+    @patch("code_reviewer.llm.time.sleep")
+    def test_gives_up_after_max_retries(self, mock_sleep, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_MAX_RETRIES", "2")
+
+        with patch("code_reviewer.llm._call_openai", side_effect=_rate_limited()) as mock_call:
+            with pytest.raises(RuntimeError, match="rate limited"):
+                review("diff")
+
+        assert mock_call.call_count == 3
+        assert mock_sleep.call_count == 2
+
+    @patch("code_reviewer.llm.time.sleep")
+    def test_batch_poll_retried_without_resubmitting(self, mock_sleep, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_MODE", "batch")
+        client = TestCallAnthropicBatch()._make_mock_client()
+        done = next(client.messages.batches.retrieve.side_effect)
+        overloaded = RuntimeError("overloaded")
+        overloaded.status_code = 529
+        client.messages.batches.retrieve.side_effect = [overloaded, done]
+        client.messages.batches.results.side_effect = [_rate_limited("1"), client.messages.batches.results.return_value]
+
+        with patch("code_reviewer.llm._get_client", return_value=client):
+            _complete("anthropic", "model", "system", "user")
+
+        assert client.messages.batches.create.call_count == 1
+        assert client.messages.batches.retrieve.call_count == 2
+        assert client.messages.batches.results.call_count == 2
+
+    @patch("code_reviewer.llm.time.sleep")
+    def test_batch_poll_failure_is_not_resubmitted(self, mock_sleep, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_MODE", "batch")
+        monkeypatch.setenv("CODE_REVIEWER_MAX_RETRIES", "1")
+        client = TestCallAnthropicBatch()._make_mock_client()
+        client.messages.batches.retrieve.side_effect = _rate_limited()
+
+        with patch("code_reviewer.llm._get_client", return_value=client):
+            with pytest.raises(BatchPollError, match="Polling batch batch_123 failed"):
+                _complete("anthropic", "model", "system", "user")
+
+        assert client.messages.batches.create.call_count == 1
+        assert client.messages.batches.retrieve.call_count == 2
+
+    def test_async_batch_poll_retried_without_resubmitting(self, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_MODE", "batch")
+        monkeypatch.setattr("code_reviewer.llm.BATCH_POLL_INITIAL", 0)
+        client = MagicMock()
+        pending = MagicMock(id="b1", processing_status="in_progress")
+        client.messages.batches.create = AsyncMock(return_value=pending)
+        client.messages.batches.retrieve = AsyncMock(
+            side_effect=[_rate_limited("0"), MagicMock(id="b1", processing_status="ended")]
+        )
+        item = MagicMock(custom_id="review")
+        item.result.type = "succeeded"
+        item.result.message.content = [MagicMock(text="[]")]
+
+        async def results():
+            yield item
+
+        client.messages.batches.results = AsyncMock(side_effect=[_rate_limited("0"), results()])
+
+        with patch("code_reviewer.llm._get_async_client", return_value=client):
+            completion = asyncio.run(_acomplete("anthropic", "model", "system", "user"))
+
+        assert completion.text == "[]"
+        assert client.messages.batches.create.await_count == 1
+
+    @patch("code_reviewer.llm.time.sleep")
+    def test_other_errors_are_not_retried(self, mock_sleep):
+        with patch("code_reviewer.llm._call_openai", side_effect=ValueError("bad request")) as mock_call:
+            with pytest.raises(ValueError):
+                review("diff")
+
+        mock_call.assert_called_once()
+        mock_sleep.assert_not_called()
+
+    @patch("code_reviewer.llm.time.sleep")
+    def test_waits_for_rate_limit_budget(self, mock_sleep, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_RPM", "1")
+
+        with patch("code_reviewer.llm._call_openai", return_value=Completion("[]")):
+            review("diff one")
+            review("diff two")
+
+        mock_sleep.assert_called_once()
+        assert mock_sleep.call_args[0][0] == pytest.approx(60, abs=1)
+
+    @patch("code_reviewer.llm.time.sleep")
+    def test_stream_retries_before_first_chunk(self, mock_sleep):
+        calls = []
+
+        def fake_stream(system, user, model, base_url=None, api_key=None):
+            calls.append(user)
+            if len(calls) == 1:
+                raise _rate_limited("1")
+            yield '[{"comment": "x"}]'
+
+        with patch("code_reviewer.llm._stream_openai", side_effect=fake_stream):
+            assert [c.comment for c in review_stream("diff")] == ["x"]
+        assert len(calls) == 2
+
+    @patch("code_reviewer.llm.time.sleep")
+    def test_stream_not_retried_after_output(self, mock_sleep):
+        def fake_stream(system, user, model, base_url=None, api_key=None):
+            yield '[{"comment": "x"},'
+            raise _rate_limited()
+
+        with patch("code_reviewer.llm._stream_openai", side_effect=fake_stream):
+            with pytest.raises(RuntimeError, match="rate limited"):
+                list(review_stream("diff"))
+        mock_sleep.assert_not_called()
+
+    @patch("asyncio.sleep", new_callable=AsyncMock)
+    def test_async_retries(self, mock_sleep, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_RPM", "1")
+        replies = [_rate_limited(), Completion('[{"comment": "x"}]')]
+
+        with patch("code_reviewer.llm._acall_openai", AsyncMock(side_effect=replies)):
+            result = asyncio.run(areview("diff"))
+
+        assert [c.comment for c in result] == ["x"]
+        # First the retry-after delay, then the wait for the next request slot.
+        assert [call.args[0] for call in mock_sleep.await_args_list][0] == 2
+        assert mock_sleep.await_count == 2
+
+    @patch("asyncio.sleep", new_callable=AsyncMock)
+    def test_async_gives_up_on_other_errors(self, mock_sleep):
+        with patch("code_reviewer.llm._acall_openai", AsyncMock(side_effect=ValueError("bad"))):
+            with pytest.raises(ValueError):
+                asyncio.run(areview("diff"))
+        mock_sleep.assert_not_awaited()
+
+
+class TestStats:
+    def test_review_records_stages_and_usage(self, monkeypatch):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        completion = Completion(
+            '[{"comment": "x"}]', queued=0.5, generating=1.5, throttled=0.25,
+            usage=Usage(input_tokens=10, cached_tokens=4, output_tokens=2),
+        )
+        stats = Stats()
+
+        with patch("code_reviewer.llm._call_openai", return_value=completion):
+            review("diff", stats=stats)
+
+        assert stats.seconds["queued"] == 0.5
+        assert stats.seconds["generating"] == 1.5
+        assert stats.seconds["throttle"] == 0  # _complete measures its own waits
+        assert {"prepare", "parse"} <= set(stats.seconds)
+        assert (stats.requests, stats.comments) == (1, 1)
+        assert stats.usage == Usage(input_tokens=10, cached_tokens=4, output_tokens=2)
+
+    def test_review_stream_records_usage(self, monkeypatch):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        stats = Stats()
+        budget = Budget(max_tokens=10_000)
+        reply = iter(['[{"comment": ', '"x"}]', Usage(input_tokens=300, cached_tokens=0, output_tokens=7)])
+
+        with patch("code_reviewer.llm._stream_openai", return_value=reply):
+            assert [c.comment for c in review_stream("diff", stats=stats, budget=budget)] == ["x"]
+
+        assert stats.usage == Usage(input_tokens=300, cached_tokens=0, output_tokens=7)
+        assert budget.tokens == 307
+
+    @patch("code_reviewer.llm.time.sleep")
+    def test_throttle_includes_retry_backoff(self, mock_sleep, monkeypatch):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        monkeypatch.setattr("code_reviewer.llm._limiters", {})
+        error = RuntimeError("rate limited")
+        error.status_code = 429
+        error.response = MagicMock(headers={"retry-after": "3"})
+        stats = Stats()
+
+        with patch("code_reviewer.llm._call_openai", side_effect=[error, Completion("[]")]):
+            review("diff", stats=stats)
+
+        assert stats.seconds["throttle"] == 3
+
+    def test_async_review_records_stats(self, monkeypatch):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        stats = Stats()
+
+        with patch("code_reviewer.llm._acall_openai", AsyncMock(return_value=Completion("[]", generating=2.0))):
+            asyncio.run(areview("diff", stats=stats))
+
+        assert stats.seconds["generating"] == 2.0
+        assert stats.requests == 1
+
+    def test_stream_records_timing(self, monkeypatch):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        stats = Stats()
+
+        with patch("code_reviewer.llm._stream_openai", return_value=iter(['[{"comment": "x"}]'])):
+            list(review_stream("diff", stats=stats))
+
+        assert {"prepare", "queued", "generating"} <= set(stats.seconds)
+        assert (stats.requests, stats.comments) == (1, 1)
+
+
+class TestReviewFiltering:
+    LOCK = "diff --git a/uv.lock b/uv.lock\n--- a/uv.lock\n+++ b/uv.lock\n@@ -1 +1 @@\n-a\n+b"
+    APP = "diff --git a/app.py b/app.py\n--- a/app.py\n+++ b/app.py\n@@ -1 +1 @@\n-a\n+b"
+
+    def test_ignored_files_not_sent(self, monkeypatch, caplog):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+
+        with patch("code_reviewer.llm._call_openai", return_value=Completion("[]")) as mock_call:
+            with caplog.at_level("INFO", logger="code_reviewer.llm"):
+                review(self.APP + "\n" + self.LOCK)
+
+        user = mock_call.call_args[0][1]
+        assert "app.py" in user
+        assert "uv.lock" not in user
+        assert "Skipped 1 ignored or binary files" in caplog.text
+
+    def test_fully_ignored_diff_skips_provider(self, monkeypatch):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+
+        with patch("code_reviewer.llm._call_openai") as mock_call:
+            assert review(self.LOCK) == []
+            assert list(review_stream(self.LOCK)) == []
+            assert asyncio.run(areview(self.LOCK)) == []
+
+        mock_call.assert_not_called()
+
+
+class TestBudget:
+    def test_context_defaults(self, monkeypatch):
+        monkeypatch.delenv("CODE_REVIEWER_CONTEXT_TOKENS", raising=False)
+        for provider, expected in DEFAULT_CONTEXT_TOKENS.items():
+            assert _get_context_tokens(provider) == expected
+
+    def test_budget_reserves_output_and_prompt(self, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_CONTEXT_TOKENS", "10000")
+        monkeypatch.setenv("CODE_REVIEWER_MAX_OUTPUT_TOKENS", "2000")
+        overhead = 100 + estimate_tokens(build_user_prompt("", "ctx"))
+        assert _input_budget("local", "x" * 400, "ctx") == 10000 - 2000 - overhead
+
+    def test_budget_has_floor(self, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_CONTEXT_TOKENS", "100")
+        assert _input_budget("local", "system", None) == MIN_INPUT_TOKENS
+
+    def test_shards_capped_to_model_budget(self, monkeypatch):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        monkeypatch.setenv("CODE_REVIEWER_SHARD_TOKENS", "100000")
+        monkeypatch.setenv("CODE_REVIEWER_CONTEXT_TOKENS", "4000")
+        monkeypatch.setenv("CODE_REVIEWER_MAX_OUTPUT_TOKENS", "1000")
+        files = [
+            f"diff --git a/f{i}.py b/f{i}.py\n--- a/f{i}.py\n+++ b/f{i}.py\n@@ -1,0 +1,1 @@\n+{'x' * 8000}"
+            for i in range(4)
+        ]
+
+        with patch("code_reviewer.llm._call_openai", return_value=Completion("[]")) as mock_call:
+            review("\n".join(files))
+
+        assert mock_call.call_count == 4
+
+    def test_oversized_hunk_compacted(self, monkeypatch, caplog):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        monkeypatch.setenv("CODE_REVIEWER_CONTEXT_TOKENS", "1")
+        context = "\n".join(f" {'c' * 400} {i}" for i in range(20))
+        diff = f"--- a/f.py\n+++ b/f.py\n@@ -1,41 +1,41 @@\n{context}\n-a\n+b\n{context}"
+
+        with patch("code_reviewer.llm._call_openai", return_value=Completion("[]")) as mock_call:
+            with caplog.at_level("INFO", logger="code_reviewer.llm"):
+                review(diff)
+
+        user = mock_call.call_args[0][1]
+        assert "@@ -20,3 +20,3 @@" in user
+        assert "dropped 0 whitespace-only and 0 deletion-only hunks and 38 context lines" in caplog.text
+        assert "still" not in caplog.text
+
+    def test_shard_emptied_by_compaction_is_not_sent(self, monkeypatch):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        monkeypatch.setenv("CODE_REVIEWER_CONTEXT_TOKENS", "1")
+        removed = "\n".join(f"-{'d' * 400} {i}" for i in range(20))
+        diff = f"--- a/f.py\n+++ b/f.py\n@@ -1,20 +0,0 @@\n{removed}"
+
+        with patch("code_reviewer.llm._call_openai", return_value=Completion("[]")) as mock_call:
+            assert review(diff) == []
+
+        mock_call.assert_not_called()
+
+    def test_warns_when_compaction_is_not_enough(self, monkeypatch, caplog):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        monkeypatch.setenv("CODE_REVIEWER_CONTEXT_TOKENS", "1")
+        diff = f"--- a/f.py\n+++ b/f.py\n@@ -1,1 +1,1 @@\n-a\n+{'b' * 10000}"
+
+        with patch("code_reviewer.llm._call_openai", return_value=Completion("[]")):
+            with caplog.at_level("WARNING", logger="code_reviewer.llm"):
+                review(diff)
+
+        assert "still ~" in caplog.text
+
+    def test_max_output_tokens_sent_to_anthropic(self, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_MAX_OUTPUT_TOKENS", "1234")
+        client = MagicMock()
+        client.messages.stream.return_value.__enter__.return_value.text_stream = iter([])
+
+        with patch("code_reviewer.llm._get_client", return_value=client):
+            _call_anthropic_messages("system", "user", "model")
+
+        assert client.messages.stream.call_args.kwargs["max_tokens"] == 1234
+
+
+class TestTriage:
+    DIFF = (
+        "diff --git a/app.py b/app.py\n--- a/app.py\n+++ b/app.py\n@@ -1 +1 @@\n-check(user)\n+pass\n"
+        "diff --git a/setup.cfg b/setup.cfg\n--- a/setup.cfg\n+++ b/setup.cfg\n@@ -1 +1 @@\n-version = 1.0\n+version = 1.1"
+    )
+
+    @pytest.fixture(autouse=True)
+    def _env(self, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_PROVIDER", "openai")
+        monkeypatch.setenv("CODE_REVIEWER_MODEL", "big-model")
+        monkeypatch.setenv("CODE_REVIEWER_TRIAGE_PROVIDER", "local")
+        monkeypatch.setenv("CODE_REVIEWER_TRIAGE_BASE_URL", "http://triage:11434/v1")
+        monkeypatch.delenv("CODE_REVIEWER_TRIAGE_MODEL", raising=False)
+        monkeypatch.delenv("CODE_REVIEWER_BASE_URL", raising=False)
+
+    @staticmethod
+    def _fake(triage_reply):
+        calls = []
+
+        def fake(system, user, model, base_url=None, api_key=None, previous=None):
+            calls.append((model, base_url, user))
+            if model == DEFAULT_MODELS["local"]:
+                if isinstance(triage_reply, Exception):
+                    raise triage_reply
+                return Completion(triage_reply, usage=Usage(input_tokens=5))
+            return Completion('[{"file": "app.py", "line": 1, "comment": "check removed"}]')
+
+        return fake, calls
+
+    def test_only_flagged_hunks_escalated(self, caplog):
+        fake, calls = self._fake("[1]")
+        stats = Stats()
+
+        with patch("code_reviewer.llm._call_openai", side_effect=fake):
+            with caplog.at_level("INFO", logger="code_reviewer.llm"):
+                comments = review(self.DIFF, stats=stats)
+
+        (triage_model, triage_url, triage_user), (review_model, review_url, review_user) = calls
+        assert (triage_model, triage_url) == ("llama3", "http://triage:11434/v1")
+        assert "Hunk 1 in app.py" in triage_user and "Hunk 2 in setup.cfg" in triage_user
+        assert (review_model, review_url) == ("big-model", None)
+        assert "check(user)" in review_user
+        assert "setup.cfg" not in review_user
+        assert [c.comment for c in comments] == ["check removed"]
+        assert "escalated 1 of 2 hunks" in caplog.text
+        assert "nothing to review in 1 files: setup.cfg" in caplog.text
+        assert stats.requests == 2
+        assert "triage" in stats.seconds
+
+    def test_nothing_flagged_skips_review(self):
+        fake, calls = self._fake("[]")
+
+        with patch("code_reviewer.llm._call_openai", side_effect=fake):
+            assert review(self.DIFF) == []
+            assert asyncio.run(areview(self.DIFF)) == []
+
+        assert len(calls) == 2
+
+    def test_triage_model_override(self, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_TRIAGE_MODEL", "tiny")
+        calls = []
+
+        def fake(system, user, model, base_url=None, api_key=None, previous=None):
+            calls.append(model)
+            return Completion("[]")
+
+        with patch("code_reviewer.llm._call_openai", side_effect=fake):
+            review(self.DIFF)
+
+        assert calls == ["tiny"]
+
+    def test_triage_ignores_the_primary_base_url(self, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_PROVIDER", "local")
+        monkeypatch.setenv("CODE_REVIEWER_BASE_URL", "http://vllm:8000/v1")
+        monkeypatch.setenv("CODE_REVIEWER_TRIAGE_PROVIDER", "openai")
+        monkeypatch.delenv("CODE_REVIEWER_TRIAGE_BASE_URL")
+        fake, calls = self._fake("[1]")
+
+        with patch("code_reviewer.llm._call_openai", side_effect=fake):
+            review(self.DIFF)
+
+        assert [(model, url) for model, url, _ in calls] == [
+            (DEFAULT_MODELS["openai"], "https://api.openai.com/v1"),
+            ("big-model", "http://vllm:8000/v1"),
+        ]
+
+    @pytest.mark.parametrize("reply", ["I can't tell", ValueError("boom")])
+    def test_fails_open(self, reply, caplog):
+        fake, calls = self._fake(reply)
+
+        with patch("code_reviewer.llm._call_openai", side_effect=fake):
+            with caplog.at_level("WARNING", logger="code_reviewer.llm"):
+                review(self.DIFF)
+
+        review_user = calls[-1][2]
+        assert "app.py" in review_user and "setup.cfg" in review_user
+        assert "escalating its 2 hunks" in caplog.text
+
+    def test_disabled_by_default(self, monkeypatch):
+        monkeypatch.delenv("CODE_REVIEWER_TRIAGE_PROVIDER")
+        fake, calls = self._fake("[]")
+
+        with patch("code_reviewer.llm._call_openai", side_effect=fake):
+            review(self.DIFF)
+
+        assert [model for model, _, _ in calls] == ["big-model"]
+
+
+class TestStreamedDiff:
+    @staticmethod
+    def _lines(files: int, read: list[int]):
+        for i in range(files):
+            read.append(i)
+            yield f"diff --git a/f{i}.py b/f{i}.py\n"
+            yield f"--- a/f{i}.py\n"
+            yield f"+++ b/f{i}.py\n"
+            yield "@@ -0,0 +1,1 @@\n"
+            yield f"+{'x' * 200}\n"
+
+    @pytest.fixture(autouse=True)
+    def _env(self, monkeypatch):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        monkeypatch.delenv("CODE_REVIEWER_TRIAGE_PROVIDER", raising=False)
+        monkeypatch.setenv("CODE_REVIEWER_SHARD_TOKENS", "80")
+        monkeypatch.setenv("CODE_REVIEWER_WORKERS", "1")
+
+    def test_lines_are_read_as_shards_are_reviewed(self):
+        read: list[int] = []
+        seen_when_called = []
+
+        def fake(system, user, model, base_url=None, api_key=None, previous=None):
+            seen_when_called.append(len(read))
+            return Completion(json.dumps([{"file": user.split("a/")[1].split(" ")[0], "comment": "c"}]))
+
+        with patch("code_reviewer.llm._call_openai", side_effect=fake):
+            comments = review(self._lines(5, read))
+
+        assert [c.file for c in comments] == [f"f{i}.py" for i in range(5)]
+        # Never more than a couple of files ahead of the request being sent.
+        assert seen_when_called[0] <= 3
+        assert seen_when_called == sorted(seen_when_called)
+
+    def test_stream_reads_lazily(self):
+        read: list[int] = []
+        with patch("code_reviewer.llm._stream_openai", side_effect=lambda *a, **k: iter(['[{"comment": "c"}]'])):
+            stream = review_stream(self._lines(6, read))
+            next(stream)
+            assert len(read) < 6
+            assert len(list(stream)) == 5
+
+    def test_ignored_files_reported_at_end(self, caplog):
+        lines = [
+            "diff --git a/uv.lock b/uv.lock\n", "--- a/uv.lock\n", "+++ b/uv.lock\n", "@@ -1 +1 @@\n", "-a\n", "+b\n",
+            "diff --git a/app.py b/app.py\n", "--- a/app.py\n", "+++ b/app.py\n", "@@ -1 +1 @@\n", "-a\n", "+b\n",
+        ]
+        with patch("code_reviewer.llm._call_openai", return_value=Completion("[]")) as mock_call:
+            with caplog.at_level("INFO", logger="code_reviewer.llm"):
+                review(iter(lines))
+
+        user = mock_call.call_args[0][1]
+        assert "app.py" in user and "uv.lock" not in user
+        assert "Skipped 1 ignored or binary files" in caplog.text
+
+    def test_blank_input_sends_nothing(self):
+        with patch("code_reviewer.llm._call_openai") as mock_call:
+            assert review(iter(["\n", "\n"])) == []
+        mock_call.assert_not_called()
+
+    def test_triage_reads_whole_diff(self, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_TRIAGE_PROVIDER", "local")
+        users = []
+
+        def fake(system, user, model, base_url=None, api_key=None, previous=None):
+            users.append(user)
+            return Completion("[2]" if "Hunk 1" in user else "[]")
+
+        with patch("code_reviewer.llm._call_openai", side_effect=fake):
+            review(self._lines(2, []))
+
+        assert "Hunk 1 in f0.py" in users[0] and "Hunk 2 in f1.py" in users[0]
+        assert "f1.py" in users[1] and "f0.py" not in users[1]
+
+
+class TestFailover:
+    @pytest.fixture(autouse=True)
+    def _env(self, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_PROVIDER", "local")
+        monkeypatch.setenv("CODE_REVIEWER_BASE_URL", "http://vllm:8000/v1")
+        monkeypatch.setenv("CODE_REVIEWER_FALLBACK", "openai:gpt-4o-mini")
+        monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+        for name in ("CODE_REVIEWER_MODEL", "CODE_REVIEWER_ATTEMPT_TIMEOUT", "CODE_REVIEWER_HEDGE_AFTER"):
+            monkeypatch.delenv(name, raising=False)
+        release = threading.Event()
+        yield release
+        release.set()  # let abandoned primary requests finish
+
+    @staticmethod
+    def _fake(primary, release=None):
+        """Primary (the vLLM URL) behaves as ``primary``; the OpenAI fallback answers at once."""
+        def fake(system, user, model, base_url=None, api_key=None, previous=None):
+            if base_url == "http://vllm:8000/v1":
+                if primary == "stall":
+                    release.wait(5)
+                    return Completion('[{"comment": "slow"}]')
+                if isinstance(primary, Exception):
+                    raise primary
+                return Completion(primary)
+            assert (base_url, model) == ("https://api.openai.com/v1", "gpt-4o-mini")
+            return Completion('[{"comment": "fallback"}]')
+        return fake
+
+    def test_chain(self, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_FALLBACK", " anthropic, local:llama3:8b ,")
+        chain = _get_chain()
+        assert [(t.provider, t.model, t.base_url) for t in chain] == [
+            ("local", "llama3", None),
+            ("anthropic", DEFAULT_MODELS["anthropic"], None),
+            ("local", "llama3:8b", DEFAULT_LOCAL_BASE_URL),
+        ]
+
+    def test_unknown_fallback_is_rejected(self, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_FALLBACK", "anthropc")
+        with pytest.raises(ValueError, match="Unknown provider 'anthropc' in CODE_REVIEWER_FALLBACK"):
+            _get_chain()
+
+    def test_hedge_wins_when_primary_stalls(self, monkeypatch, _env, caplog):
+        monkeypatch.setenv("CODE_REVIEWER_HEDGE_AFTER", "0.05")
+        stats = Stats()
+
+        with patch("code_reviewer.llm._call_openai", side_effect=self._fake("stall", _env)):
+            with caplog.at_level("INFO"):
+                comments = review("diff", stats=stats)
+
+        assert [c.comment for c in comments] == ["fallback"]
+        assert stats.served == {"openai": 1}
+        assert "Hedging with openai (gpt-4o-mini)" in caplog.text
+        assert "Served by: openai 1" in caplog.text
+
+    def test_fallback_replies_are_not_cached(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("CODE_REVIEWER_CACHE_DIR", str(tmp_path))
+
+        with patch("code_reviewer.llm._call_openai", side_effect=self._fake(ValueError("down"))):
+            assert [c.comment for c in review("diff")] == ["fallback"]
+        with patch("code_reviewer.llm._call_openai", side_effect=self._fake('[{"comment": "primary"}]')):
+            assert [c.comment for c in review("diff")] == ["primary"]
+            # The primary's own reply is cached as usual.
+            assert [c.comment for c in review("diff")] == ["primary"]
+        assert (_get_cache().hits, _get_cache().misses) == (1, 2)
+
+    def test_fast_primary_is_not_hedged(self, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_HEDGE_AFTER", "5")
+        stats = Stats()
+
+        with patch("code_reviewer.llm._call_openai", side_effect=self._fake('[{"comment": "primary"}]')) as mock:
+            assert [c.comment for c in review("diff", stats=stats)] == ["primary"]
+
+        assert mock.call_count == 1
+        assert stats.served == {"local": 1}
+
+    def test_attempt_timeout_fails_over(self, monkeypatch, _env, caplog):
+        monkeypatch.setenv("CODE_REVIEWER_ATTEMPT_TIMEOUT", "0.05")
+
+        with patch("code_reviewer.llm._call_openai", side_effect=self._fake("stall", _env)):
+            with caplog.at_level("WARNING", logger="code_reviewer.failover"):
+                assert [c.comment for c in review("diff")] == ["fallback"]
+
+        assert "local (llama3) gave no reply within 0.05s" in caplog.text
+
+    def test_timeout_with_nothing_left_raises(self, monkeypatch, _env):
+        monkeypatch.setenv("CODE_REVIEWER_ATTEMPT_TIMEOUT", "0.05")
+        monkeypatch.delenv("CODE_REVIEWER_FALLBACK")
+
+        with patch("code_reviewer.llm._call_openai", side_effect=self._fake("stall", _env)):
+            with pytest.raises(TimeoutError):
+                review("diff")
+
+    @pytest.mark.parametrize("primary", [ValueError("bad request"), "Sorry, I can't review this."])
+    def test_failed_or_invalid_primary_falls_over(self, primary):
+        with patch("code_reviewer.llm._call_openai", side_effect=self._fake(primary)):
+            assert [c.comment for c in review("diff")] == ["fallback"]
+
+    def test_every_tier_failing(self, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_FALLBACK", "local")
+
+        with patch("code_reviewer.llm._call_openai", return_value=Completion("no idea")):
+            assert review("diff") == []  # an unreadable reply still beats none
+        with patch("code_reviewer.llm._call_openai", side_effect=ValueError("down")):
+            with pytest.raises(ValueError, match="down"):
+                review("diff")
+
+    def test_async_hedge_cancels_loser(self, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_HEDGE_AFTER", "0.05")
+        cancelled = []
+
+        async def fake(system, user, model, base_url=None, api_key=None, previous=None):
+            if base_url == "http://vllm:8000/v1":
+                try:
+                    await asyncio.sleep(5)
+                except asyncio.CancelledError:
+                    cancelled.append(model)
+                    raise
+            return Completion('[{"comment": "fallback"}]')
+
+        stats = Stats()
+        with patch("code_reviewer.llm._acall_openai", side_effect=fake):
+            comments = asyncio.run(areview("diff", stats=stats))
+
+        assert [c.comment for c in comments] == ["fallback"]
+        assert cancelled == ["llama3"]
+        assert stats.served == {"openai": 1}
+
+    def test_async_timeout_and_failure(self, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_ATTEMPT_TIMEOUT", "0.05")
+        monkeypatch.setenv("CODE_REVIEWER_FALLBACK", "openai,anthropic")
+
+        async def fake(system, user, model, base_url=None, api_key=None, previous=None):
+            if base_url == "http://vllm:8000/v1":
+                await asyncio.sleep(5)
+            raise ValueError("openai down")
+
+        with (
+            patch("code_reviewer.llm._acall_openai", side_effect=fake),
+            patch("code_reviewer.llm._acall_anthropic_messages", AsyncMock(return_value=Completion("[]"))),
+        ):
+            assert asyncio.run(areview("diff")) == []
+
+    def test_async_single_provider(self, monkeypatch):
+        monkeypatch.delenv("CODE_REVIEWER_FALLBACK")
+        with patch("code_reviewer.llm._acall_openai", AsyncMock(return_value=Completion("[]"))):
+            stats = Stats()
+            asyncio.run(areview("diff", stats=stats))
+        assert stats.served == {"local": 1}
+
+    def test_stream_falls_over_before_first_chunk(self, caplog):
+        def fake(system, user, model, base_url=None, api_key=None):
+            if base_url == "http://vllm:8000/v1":
+                raise ValueError("connection refused")
+            yield '[{"comment": "fallback"}]'
+
+        stats = Stats()
+        with patch("code_reviewer.llm._stream_openai", side_effect=fake):
+            with caplog.at_level("WARNING", logger="code_reviewer.failover"):
+                assert [c.comment for c in review_stream("diff", stats=stats)] == ["fallback"]
+
+        assert "local (llama3) failed: connection refused" in caplog.text
+        assert stats.served == {"openai": 1}
+
+    def test_stream_last_tier_error_propagates(self):
+        with patch("code_reviewer.llm._stream_openai", side_effect=ValueError("down")):
+            with pytest.raises(ValueError):
+                list(review_stream("diff"))
+
+
+class TestGuidelineSections:
+    GUIDELINES = "Be concise.\n\n## Python\nUse type hints.\n\n## Go\nWrap errors."
+
+    @pytest.fixture(autouse=True)
+    def _env(self, monkeypatch):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        monkeypatch.delenv("CODE_REVIEWER_TRIAGE_PROVIDER", raising=False)
+        monkeypatch.delenv("CODE_REVIEWER_CACHE_DIR", raising=False)
+        monkeypatch.setenv("CODE_REVIEWER_SHARD_TOKENS", "40")
+        monkeypatch.setenv("CODE_REVIEWER_WORKERS", "1")
+
+    @staticmethod
+    def _file(path: str) -> str:
+        return f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n@@ -0,0 +1,1 @@\n+{'x' * 80}"
+
+    def test_each_shard_gets_its_sections(self):
+        systems = {}
+
+        def fake(system, user, model, base_url=None, api_key=None, previous=None):
+            systems["py" if "a/app.py" in user else "go"] = system
+            return Completion("[]")
+
+        diff = self._file("app.py") + "\n" + self._file("main.go")
+        with patch("code_reviewer.llm._call_openai", side_effect=fake):
+            review(diff, guidelines=self.GUIDELINES)
+
+        assert "Use type hints." in systems["py"] and "Wrap errors." not in systems["py"]
+        assert "Wrap errors." in systems["go"] and "Use type hints." not in systems["go"]
+        assert "Be concise." in systems["py"] and "Be concise." in systems["go"]
+
+    def test_stream_gets_sections(self):
+        with patch("code_reviewer.llm._stream_openai", return_value=iter(["[]"])) as mock_stream:
+            list(review_stream(self._file("app.py"), guidelines=self.GUIDELINES))
+
+        system = mock_stream.call_args[0][0]
+        assert "Use type hints." in system and "Wrap errors." not in system
+
+
+class TestBudgetControl:
+    @pytest.fixture(autouse=True)
+    def _env(self, monkeypatch):
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER", raising=False)
+        monkeypatch.delenv("CODE_REVIEWER_TRIAGE_PROVIDER", raising=False)
+        monkeypatch.delenv("CODE_REVIEWER_FALLBACK", raising=False)
+        monkeypatch.delenv("CODE_REVIEWER_CACHE_DIR", raising=False)
+        monkeypatch.setenv("CODE_REVIEWER_SHARD_TOKENS", "40")
+        monkeypatch.setenv("CODE_REVIEWER_WORKERS", "1")
+
+    @staticmethod
+    def _diff(*paths: str) -> str:
+        return "\n".join(
+            f"diff --git a/{p} b/{p}\n--- a/{p}\n+++ b/{p}\n@@ -0,0 +1,1 @@\n+{'x' * 80}" for p in paths
+        )
+
+    @staticmethod
+    def _path(user: str) -> str:
+        return user.split("diff --git a/")[1].split(" ")[0]
+
+    def test_riskiest_files_first_until_tokens_run_out(self):
+        order = []
+
+        def fake(system, user, model, base_url=None, api_key=None, previous=None):
+            order.append(self._path(user))
+            return Completion(json.dumps([{"file": order[-1], "comment": "c"}]), usage=Usage(450, 0, 50))
+
+        # Each request is estimated at ~430 tokens before it's sent and uses 500.
+        budget = Budget(max_tokens=1100)
+        with patch("code_reviewer.llm._call_openai", side_effect=fake):
+            comments = review(self._diff("README.md", "util.py", "auth/login.py"), budget=budget)
+
+        assert order == ["auth/login.py", "util.py"]
+        assert [c.file for c in comments] == order
+        assert budget.skipped == ["README.md"]
+        assert budget.reason == "token budget of 1100"
+
+    def test_without_budget_keeps_diff_order(self):
+        order = []
+
+        def fake(system, user, model, base_url=None, api_key=None, previous=None):
+            order.append(self._path(user))
+            return Completion("[]")
+
+        with patch("code_reviewer.llm._call_openai", side_effect=fake):
+            review(self._diff("README.md", "auth.py"))
+
+        assert order == ["README.md", "auth.py"]
+
+    def test_time_runs_out_mid_request(self):
+        def fake(system, user, model, base_url=None, api_key=None, previous=None):
+            if "slow.py" in user:
+                time.sleep(1)
+            return Completion(json.dumps([{"file": self._path(user), "comment": "c"}]))
+
+        budget = Budget(max_seconds=0.2)
+        start = time.monotonic()
+        with patch("code_reviewer.llm._call_openai", side_effect=fake):
+            comments = review(self._diff("auth.py", "slow.py", "z.md"), budget=budget)
+
+        assert time.monotonic() - start < 0.8
+        assert [c.file for c in comments] == ["auth.py"]
+        assert budget.skipped == ["slow.py", "z.md"]
+        assert budget.reason == "time budget of 0.2s"
+
+    def test_skipped_shards_are_not_cached(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("CODE_REVIEWER_CACHE_DIR", str(tmp_path))
+        with patch("code_reviewer.llm._call_openai", return_value=Completion("[]", usage=Usage(500, 0, 0))):
+            review(self._diff("a.py", "b.py"), budget=Budget(max_tokens=700))
+        with patch("code_reviewer.llm._call_openai", return_value=Completion("[]")) as mock_call:
+            review(self._diff("a.py", "b.py"))
+        assert mock_call.call_count == 1
+
+    def test_async(self):
+        async def fake(system, user, model, base_url=None, api_key=None, previous=None):
+            return Completion(json.dumps([{"file": self._path(user), "comment": "c"}]), usage=Usage(500, 0, 0))
+
+        budget = Budget(max_tokens=700)
+        with patch("code_reviewer.llm._acall_openai", side_effect=fake):
+            comments = asyncio.run(areview(self._diff("docs.md", "db.py"), budget=budget))
+
+        assert [c.file for c in comments] == ["db.py"]
+        assert budget.skipped == ["docs.md"]
+
+    def test_async_time_runs_out(self):
+        async def fake(system, user, model, base_url=None, api_key=None, previous=None):
+            await asyncio.sleep(1 if "slow.py" in user else 0)
+            return Completion("[]")
+
+        budget = Budget(max_seconds=0.1)
+        start = time.monotonic()
+        with patch("code_reviewer.llm._acall_openai", side_effect=fake):
+            asyncio.run(areview(self._diff("auth.py", "slow.py"), budget=budget))
+
+        assert time.monotonic() - start < 0.8
+        assert budget.skipped == ["slow.py"]
+
+    def test_triage_tokens_are_charged(self, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_TRIAGE_PROVIDER", "local")
+
+        def fake(system, user, model, base_url=None, api_key=None, previous=None):
+            if system == TRIAGE_SYSTEM_PROMPT:
+                return Completion("[1, 2]", usage=Usage(900, 0, 100))
+            return Completion("[]", usage=Usage(450, 0, 50))
+
+        budget = Budget(max_tokens=1600)
+        with patch("code_reviewer.llm._call_openai", side_effect=fake) as mock_call:
+            review(self._diff("a.py", "b.py"), budget=budget)
+
+        # Triage's 1000 tokens leave room for only one of the two reviews.
+        assert mock_call.call_count == 2
+        assert budget.tokens == 1500
+        assert len(budget.skipped) == 1
+
+    def test_stalled_triage_is_bounded_by_time(self, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_TRIAGE_PROVIDER", "local")
+
+        def fake(system, user, model, base_url=None, api_key=None, previous=None):
+            if system == TRIAGE_SYSTEM_PROMPT:
+                time.sleep(1)
+            return Completion("[]")
+
+        start = time.monotonic()
+        with patch("code_reviewer.llm._call_openai", side_effect=fake):
+            review(self._diff("a.py"), budget=Budget(max_seconds=0.1))
+
+        assert time.monotonic() - start < 0.8
+
+    def test_stream_estimates_tokens(self):
+        def fake(system, user, model, base_url=None, api_key=None):
+            return iter([json.dumps([{"file": self._path(user), "comment": "c" * 400}])])
+
+        budget = Budget(max_tokens=900)
+        with patch("code_reviewer.llm._stream_openai", side_effect=fake):
+            comments = list(review_stream(self._diff("a.py", "b.py"), budget=budget))
+
+        # The first reply's ~100 output tokens leave no room for the second request.
+        assert [c.file for c in comments] == ["a.py"]
+        assert budget.skipped == ["b.py"]
+
+    def test_stream_stops_at_deadline(self):
+        def fake(system, user, model, base_url=None, api_key=None, timeout=None):
+            yield '[{"file": "a.py", "comment": "one"},'
+            time.sleep(0.15)
+            yield ' {"file": "a.py", "comment": "two"}]'
+
+        budget = Budget(max_seconds=0.1)
+        with patch("code_reviewer.llm._stream_openai", side_effect=fake):
+            comments = list(review_stream(self._diff("a.py", "b.py"), budget=budget))
+
+        assert [c.comment for c in comments] == ["one", "two"]
+        assert budget.skipped == ["a.py", "b.py"]
+
+    def test_stream_without_a_first_chunk_times_out(self):
+        timeouts = []
+
+        def fake(system, user, model, base_url=None, api_key=None, timeout=None):
+            timeouts.append(timeout)
+            time.sleep(timeout)
+            raise TimeoutError("read timed out")
+            yield
+
+        budget = Budget(max_seconds=0.1)
+        start = time.monotonic()
+        with patch("code_reviewer.llm._stream_openai", side_effect=fake):
+            assert list(review_stream(self._diff("a.py", "b.py"), budget=budget)) == []
+
+        assert time.monotonic() - start < 0.5
+        assert len(timeouts) == 1 and 0 < timeouts[0] <= 0.1
+        assert budget.skipped == ["a.py", "b.py"]
@@ -1,6 +1,15 @@
+import io
 import json
 
-from code_reviewer.output import ReviewComment, format_json, format_plain
+from code_reviewer.diff import EXACT, FILE, INVALID, OLD, SNAPPED, Anchor
+from code_reviewer.output import (
+    NdjsonWriter,
+    ReviewComment,
+    SarifWriter,
+    format_json,
+    format_ndjson,
+    format_plain,
+)
 
 
 def _make_comment(**overrides):
@@ -59,3 +68,113 @@ class TestFormatJson:
     def test_preserves_null_line(self):
         result = json.loads(format_json([_make_comment(line=None)]))
         assert result[0]["line"] is None
+
+
+class TestFormatNdjson:
+    def test_single_line(self):
+        result = format_ndjson(_make_comment())
+        assert "\n" not in result
+        assert json.loads(result)["file"] == "src/main.py"
+
+
+class TestAnchors:
+    def test_json_carries_position_and_original_line(self):
+        comments = [_make_comment(line=40), _make_comment(line=12)]
+        anchors = [Anchor(SNAPPED, 14, "RIGHT", 7), Anchor(EXACT, 12, "RIGHT", 5)]
+        records = json.loads(format_json(comments, anchors))
+        assert records[0] == {
+            "file": "src/main.py", "line": 14, "severity": "warning", "comment": "Unused variable.",
+            "side": "RIGHT", "position": 7, "status": "snapped", "original_line": 40,
+        }
+        assert "original_line" not in records[1]
+
+    def test_ndjson_with_anchor(self):
+        record = json.loads(format_ndjson(_make_comment(line=None), Anchor(FILE)))
+        assert (record["status"], record["position"]) == ("file", None)
+
+    def test_plain_notes_moved_and_invalid_lines(self):
+        comments = [_make_comment(line=40), _make_comment(line=3), _make_comment(file="x.py"), _make_comment()]
+        anchors = [Anchor(SNAPPED, 14, "RIGHT", 7), Anchor(OLD, 3, "LEFT", 2), Anchor(INVALID), Anchor(EXACT, 10, "RIGHT", 1)]
+        result = format_plain(comments, anchors)
+        assert "src/main.py:14 (moved from line 40)" in result
+        assert "src/main.py:3 (old file)" in result
+        assert "x.py:10 (not in diff)" in result
+        assert "src/main.py:10\n" in result
+
+
+class _Stream(io.StringIO):
+    """Counts flushes, to check that writers hand each comment on straight away."""
+
+    flushes = 0
+
+    def flush(self):
+        self.flushes += 1
+
+
+class TestNdjsonWriter:
+    def test_writes_and_flushes_each_comment(self):
+        stream = _Stream()
+        writer = NdjsonWriter(stream)
+        writer.write(_make_comment(comment="one"))
+        assert stream.flushes == 1
+        writer.write(_make_comment(line=None), Anchor(FILE))
+        writer.close()
+
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        assert records[0]["comment"] == "one"
+        assert records[1]["status"] == "file"
+
+
+class TestSarifWriter:
+    def _log(self, comments, anchors=None) -> dict:
+        stream = io.StringIO()
+        writer = SarifWriter(stream)
+        for i, comment in enumerate(comments):
+            writer.write(comment, anchors[i] if anchors else None)
+        writer.close()
+        return json.loads(stream.getvalue())
+
+    def test_empty_log_is_valid(self):
+        log = self._log([])
+        assert log["version"] == "2.1.0"
+        run = log["runs"][0]
+        assert run["results"] == []
+        assert [(r["id"], r["defaultConfiguration"]["level"]) for r in run["tool"]["driver"]["rules"]] == [
+            ("error", "error"), ("warning", "warning"), ("suggestion", "note"),
+        ]
+
+    def test_results_map_file_line_and_severity(self):
+        comments = [_make_comment(severity="error"), _make_comment(severity="suggestion", line=None, file="b.py")]
+        results = self._log(comments)["runs"][0]["results"]
+        assert results[0] == {
+            "ruleId": "error",
+            "level": "error",
+            "message": {"text": "Unused variable."},
+            "locations": [{"physicalLocation": {"artifactLocation": {"uri": "src/main.py"}, "region": {"startLine": 10}}}],
+        }
+        assert (results[1]["ruleId"], results[1]["level"]) == ("suggestion", "note")
+        assert "region" not in results[1]["locations"][0]["physicalLocation"]
+
+    def test_region_only_for_positive_int_lines(self):
+        comments = [_make_comment(line=line) for line in ("3", 2.0, 0, -1, True)]
+        for result in self._log(comments)["runs"][0]["results"]:
+            assert "region" not in result["locations"][0]["physicalLocation"]
+
+    def test_unknown_severity_is_a_note_without_rule(self):
+        [result] = self._log([_make_comment(severity="nit")])["runs"][0]["results"]
+        assert result["level"] == "note" and "ruleId" not in result
+
+    def test_anchors(self):
+        comments = [_make_comment(line=40), _make_comment(line=3)]
+        anchors = [Anchor(SNAPPED, 14, "RIGHT", 7), Anchor(OLD, 3, "LEFT", 2)]
+        snapped, old = self._log(comments, anchors)["runs"][0]["results"]
+        assert snapped["locations"][0]["physicalLocation"]["region"] == {"startLine": 14}
+        assert snapped["properties"] == {"originalLine": 40}
+        assert "region" not in old["locations"][0]["physicalLocation"]
+
+    def test_results_are_written_as_they_arrive(self):
+        stream = _Stream()
+        writer = SarifWriter(stream)
+        writer.write(_make_comment(comment="first"))
+        # The comment is out before the log is closed.
+        assert '"first"' in stream.getvalue() and stream.flushes == 2
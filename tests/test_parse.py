@@ -0,0 +1,84 @@
+import json
+
+from code_reviewer.output import ReviewComment
+from code_reviewer.parse import CommentStreamParser, comment_from_item
+
+ITEMS = [
+    {"file": "a.py", "line": 1, "severity": "error", "comment": "uses {braces} and [brackets]"},
+    {"file": "b.py", "line": None, "comment": 'quote \\" and "nested": {"x": [1, 2]}'},
+    {"file": "c.py", "line": 3, "comment": "meta", "tags": [{"k": "v"}]},
+]
+
+
+def _feed_all(parser, text, size):
+    items = []
+    for i in range(0, len(text), size):
+        items.extend(parser.feed(text[i:i + size]))
+    return items
+
+
+class TestCommentFromItem:
+    def test_defaults(self):
+        assert comment_from_item({"comment": "x"}) == ReviewComment(
+            file="unknown", line=None, severity="suggestion", comment="x"
+        )
+
+    def test_fallback_keys(self):
+        assert comment_from_item({"text": "t"}).comment == "t"
+
+    def test_lines_are_normalized(self):
+        lines = ["42", 42.0, " 7 ", 3, "4.5", 4.5, "near the top", True, [1], None]
+        assert [comment_from_item({"comment": "x", "line": line}).line for line in lines] == [
+            42, 42, 7, 3, None, None, None, None, None, None
+        ]
+
+    def test_rejects_non_dict_and_empty(self):
+        assert comment_from_item("text") is None
+        assert comment_from_item({"file": "a.py"}) is None
+
+
+class TestCommentStreamParser:
+    def test_whole_text(self):
+        text = json.dumps(ITEMS)
+        assert CommentStreamParser().feed(text) == ITEMS
+
+    def test_char_by_char(self):
+        text = "Findings:\n```json\n" + json.dumps(ITEMS, indent=2) + "\n```"
+        assert _feed_all(CommentStreamParser(), text, 1) == ITEMS
+
+    def test_emits_each_object_when_it_closes(self):
+        parser = CommentStreamParser()
+        first = json.dumps(ITEMS[0])
+        assert parser.feed("[" + first[:-1]) == []
+        assert parser.feed("}, {") == [ITEMS[0]]
+        assert parser.feed('"comment": "late"}') == [{"comment": "late"}]
+
+    def test_closed_after_array_ends(self):
+        parser = CommentStreamParser()
+        parser.feed('[{"comment": "a"}]')
+        assert parser.closed
+        assert parser.feed('[{"comment": "ignored"}]') == []
+
+    def test_empty_array(self):
+        parser = CommentStreamParser()
+        assert parser.feed("[]") == []
+        assert parser.closed
+
+    def test_no_array(self):
+        parser = CommentStreamParser()
+        assert parser.feed("no json here") == []
+        assert not parser.closed
+
+    def test_skips_invalid_and_non_object_items(self):
+        parser = CommentStreamParser()
+        assert parser.feed('[{"comment": bad}, "str", 3, {"comment": "ok"}]') == [{"comment": "ok"}]
+
+    def test_truncated_object_is_not_emitted(self):
+        parser = CommentStreamParser()
+        assert parser.feed('[{"comment": "done"}, {"comment": "cut o') == [{"comment": "done"}]
+        assert not parser.closed
+
+    def test_buffer_is_trimmed(self):
+        parser = CommentStreamParser()
+        parser.feed("x" * 1000 + "[" + json.dumps(ITEMS[0]) + ",")
+        assert len(parser._buffer) == 0
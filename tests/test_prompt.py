@@ -27,3 +27,11 @@ class TestBuildUserPrompt:
     def test_without_context(self):
         result = build_user_prompt("+ added line")
         assert "Context:" not in result
+
+    def test_shared_prefix_across_shards(self):
+        # Context comes before the diff so shards of one review share a cacheable prefix.
+        first = build_user_prompt("+ shard one", context="refactoring auth")
+        second = build_user_prompt("+ shard two", context="refactoring auth")
+        prefix = "Context: refactoring auth\n\n```diff\n"
+        assert first.startswith(prefix)
+        assert second.startswith(prefix)
@@ -0,0 +1,127 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+
+from code_reviewer.ratelimit import RETRY_MAX_DELAY, RateLimiter, TokenBucket, backoff, is_retryable, retry_after
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class APIConnectionError(Exception):
+    pass
+
+
+class APITimeoutError(APIConnectionError):
+    pass
+
+
+def _status_error(status, headers=None):
+    error = Exception("boom")
+    error.status_code = status
+    error.response = MagicMock(headers=headers or {})
+    return error
+
+
+class TestTokenBucket:
+    def test_starts_full_then_paces(self):
+        clock = FakeClock()
+        bucket = TokenBucket(60, clock=clock)  # one per second
+        assert bucket.reserve(60) == 0
+        assert bucket.reserve(1) == pytest.approx(1)
+        assert bucket.reserve(1) == pytest.approx(2)
+
+    def test_refills_over_time(self):
+        clock = FakeClock()
+        bucket = TokenBucket(60, clock=clock)
+        bucket.reserve(60)
+        clock.now = 30
+        assert bucket.reserve(30) == 0
+        assert bucket.reserve(1) == pytest.approx(1)
+
+    def test_never_holds_more_than_capacity(self):
+        clock = FakeClock()
+        bucket = TokenBucket(60, clock=clock)
+        clock.now = 600
+        assert bucket.reserve(60) == 0
+        assert bucket.reserve(1) > 0
+
+    def test_oversized_request_is_clamped(self):
+        bucket = TokenBucket(60, clock=FakeClock())
+        assert bucket.reserve(1000) == 0
+        assert bucket.reserve(1) == pytest.approx(1)
+
+
+class TestRateLimiter:
+    def test_unlimited_by_default(self):
+        limiter = RateLimiter()
+        assert [limiter.reserve(10_000) for _ in range(100)] == [0] * 100
+
+    def test_waits_for_slowest_budget(self):
+        limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=60)
+        assert limiter.reserve(60) == 0
+        assert limiter.reserve(30) == pytest.approx(30, abs=0.1)
+
+    def test_slot_caps_threads(self):
+        limiter = RateLimiter(max_in_flight=1)
+        with limiter.slot():
+            assert not limiter._slots.acquire(blocking=False)
+        assert limiter._slots.acquire(blocking=False)
+
+    def test_async_slot_caps_tasks(self):
+        limiter = RateLimiter(max_in_flight=2)
+        in_flight = peak = 0
+
+        async def task():
+            nonlocal in_flight, peak
+            async with limiter.aslot():
+                in_flight += 1
+                peak = max(peak, in_flight)
+                await asyncio.sleep(0.01)
+                in_flight -= 1
+
+        async def main():
+            await asyncio.gather(*(task() for _ in range(5)))
+
+        asyncio.run(main())
+        asyncio.run(main())  # a fresh loop gets its own semaphore
+        assert peak == 2
+
+
+class TestRetryPolicy:
+    @pytest.mark.parametrize("status", [429, 500, 503, 529])
+    def test_retryable_statuses(self, status):
+        assert is_retryable(_status_error(status))
+
+    def test_client_errors_are_not_retried(self):
+        assert not is_retryable(_status_error(400))
+        assert not is_retryable(ValueError("bad"))
+
+    def test_connection_errors_by_name(self):
+        assert is_retryable(APIConnectionError())
+        assert is_retryable(APITimeoutError())
+
+    def test_retry_after_seconds(self):
+        assert retry_after(_status_error(429, {"retry-after": "3"})) == 3
+
+    def test_retry_after_ms_preferred(self):
+        assert retry_after(_status_error(429, {"retry-after-ms": "250", "retry-after": "3"})) == 0.25
+
+    def test_retry_after_missing_or_date(self):
+        assert retry_after(ValueError()) is None
+        assert retry_after(_status_error(429, {"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"})) is None
+
+    def test_backoff_honours_server_delay(self):
+        assert backoff(0, 5) == 5
+        assert backoff(0, 10_000) == RETRY_MAX_DELAY
+
+    def test_backoff_jitter_grows(self):
+        delays = [backoff(attempt) for attempt in range(3) for _ in range(50)]
+        assert all(0 <= d <= 4 for d in delays)
+        assert max(backoff(10) for _ in range(50)) <= RETRY_MAX_DELAY
@@ -0,0 +1,39 @@
+from code_reviewer.diff import parse_diff
+from code_reviewer.risk import churn, order_by_risk, risk_score
+
+
+def _file(path: str, added: int = 1, removed: int = 0):
+    body = ["-old"] * removed + ["+new"] * added
+    text = f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n@@ -1,{removed} +1,{added} @@\n" + "\n".join(body)
+    [file] = parse_diff(text.splitlines())
+    return file
+
+
+class TestRiskScore:
+    def test_churn_counts_changed_lines(self):
+        assert churn(_file("a.py", added=3, removed=2)) == 5
+
+    def test_sensitive_paths_outrank_plain_code(self):
+        plain = risk_score(_file("src/widgets.py"))
+        assert risk_score(_file("src/auth/session.py")) > risk_score(_file("src/db/models.py")) > plain
+        assert risk_score(_file("billing/invoice.go")) > plain
+
+    def test_docs_config_and_tests_count_less(self):
+        code = risk_score(_file("src/widgets.py"))
+        assert risk_score(_file("docs/widgets.md")) < risk_score(_file("config/widgets.yaml")) < code
+        assert risk_score(_file("tests/test_widgets.py")) < code
+        assert risk_score(_file("web/widgets.test.ts")) < risk_score(_file("web/widgets.ts"))
+
+    def test_bigger_changes_score_higher(self):
+        assert risk_score(_file("a.py", added=50)) > risk_score(_file("a.py", added=2))
+
+    def test_word_boundaries(self):
+        # "db" only counts as its own word, not inside "feedback".
+        assert risk_score(_file("app/feedback.py")) == risk_score(_file("app/widgets.py"))
+        assert risk_score(_file("app/user_db.py")) > risk_score(_file("app/widgets.py"))
+
+
+class TestOrderByRisk:
+    def test_riskiest_first_and_stable(self):
+        files = [_file("README.md"), _file("a.py"), _file("auth.py"), _file("b.py")]
+        assert [f.path for f in order_by_risk(files)] == ["auth.py", "a.py", "b.py", "README.md"]
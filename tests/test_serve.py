@@ -0,0 +1,173 @@
+import http.client
+import json
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from code_reviewer.client import ServerError, request_review
+from code_reviewer.output import ReviewComment
+from code_reviewer.serve import QueueFull, ReviewQueue, make_server, parse_address, serve, warm_up
+
+COMMENTS = [ReviewComment(file="a.py", line=3, severity="warning", comment="leak")]
+
+
+@pytest.fixture
+def running():
+    """Start a server in a background thread; yields a factory taking make_server arguments."""
+    servers = []
+
+    def start(address="127.0.0.1:0", **kwargs):
+        server = make_server(address, **kwargs)
+        threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True).start()
+        servers.append(server)
+        if isinstance(server.server_address, tuple):
+            host, port = server.server_address[:2]
+            return server, f"{host}:{port}"
+        return server, address
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+class TestReviewQueue:
+    def test_rejects_beyond_queue_size(self):
+        queue = ReviewQueue(concurrency=1, queue_size=0)
+        with queue.slot():
+            assert queue.running == 1
+            with pytest.raises(QueueFull):
+                with queue.slot():
+                    pass
+        with queue.slot():
+            pass
+        assert (queue.running, queue.queued) == (0, 0)
+
+    def test_waiting_requests_are_queued(self):
+        queue = ReviewQueue(concurrency=1, queue_size=1)
+        release = threading.Event()
+
+        def hold():
+            with queue.slot():
+                release.wait()
+
+        threads = [threading.Thread(target=hold) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        while (queue.running, queue.queued) != (1, 1):
+            time.sleep(0.001)
+        with pytest.raises(QueueFull):
+            with queue.slot():
+                pass
+        release.set()
+        for thread in threads:
+            thread.join()
+        assert (queue.running, queue.queued) == (0, 0)
+
+
+class TestParseAddress:
+    def test_host_port(self):
+        assert parse_address("127.0.0.1:8750") == ("127.0.0.1", 8750)
+        assert parse_address("http://localhost:80/") == ("localhost", 80)
+
+    def test_unix(self):
+        assert parse_address("unix:/tmp/cr.sock") == "/tmp/cr.sock"
+
+    def test_invalid(self):
+        with pytest.raises(ValueError, match="HOST:PORT"):
+            parse_address("localhost")
+
+
+class TestServer:
+    def test_review_over_tcp(self, running):
+        _, address = running(guidelines="house rules")
+
+        with patch("code_reviewer.serve.review", return_value=COMMENTS) as mock_review:
+            result = request_review(address, "+ code\n", context="ctx")
+
+        assert result == COMMENTS
+        mock_review.assert_called_once_with("+ code", context="ctx", guidelines="house rules")
+
+    def test_request_guidelines_override_server(self, running):
+        _, address = running(guidelines="house rules")
+
+        with patch("code_reviewer.serve.review", return_value=[]) as mock_review:
+            request_review(address, "+ code", guidelines="mine")
+
+        assert mock_review.call_args.kwargs["guidelines"] == "mine"
+
+    def test_review_over_unix_socket(self, running, tmp_path):
+        path = tmp_path / "cr.sock"
+        path.write_text("stale")
+        server, address = running(f"unix:{path}")
+
+        with patch("code_reviewer.serve.review", return_value=COMMENTS):
+            assert request_review(address, "+ code") == COMMENTS
+
+        server.shutdown()
+        server.server_close()
+        assert not path.exists()
+
+    def test_health(self, running):
+        _, address = running()
+        connection = http.client.HTTPConnection(address)
+        connection.request("GET", "/health")
+        response = connection.getresponse()
+        assert response.status == 200
+        assert json.loads(response.read()) == {"status": "ok", "running": 0, "queued": 0}
+
+    def test_unknown_path(self, running):
+        _, address = running()
+        connection = http.client.HTTPConnection(address)
+        connection.request("POST", "/nope", body="{}")
+        assert connection.getresponse().status == 404
+        connection.close()
+        connection = http.client.HTTPConnection(address)
+        connection.request("GET", "/nope")
+        assert connection.getresponse().status == 404
+
+    def test_bad_requests(self, running):
+        _, address = running()
+        for body in ["not json", json.dumps({"diff": "  "}), json.dumps(["x"])]:
+            connection = http.client.HTTPConnection(address)
+            connection.request("POST", "/review", body=body)
+            response = connection.getresponse()
+            assert response.status == 400
+            assert "error" in json.loads(response.read())
+            connection.close()
+
+    def test_full_queue_returns_503(self, running):
+        server, address = running(concurrency=1, queue_size=0)
+
+        with server.review_queue.slot():
+            with pytest.raises(ServerError, match="503: Review queue is full"):
+                request_review(address, "+ code")
+
+    def test_review_failure_returns_502(self, running):
+        _, address = running()
+
+        with patch("code_reviewer.serve.review", side_effect=RuntimeError("provider down")):
+            with pytest.raises(ServerError, match="502: Review failed: provider down"):
+                request_review(address, "+ code")
+
+
+class TestServe:
+    def test_warm_up_opens_provider_client(self, monkeypatch):
+        monkeypatch.setenv("CODE_REVIEWER_PROVIDER", "anthropic")
+        with patch("code_reviewer.serve._get_client") as mock_get:
+            warm_up()
+        mock_get.assert_called_once_with("anthropic")
+
+        monkeypatch.delenv("CODE_REVIEWER_PROVIDER")
+        monkeypatch.delenv("CODE_REVIEWER_BASE_URL", raising=False)
+        with patch("code_reviewer.serve._get_client") as mock_get:
+            warm_up()
+        mock_get.assert_called_once_with("openai", "http://localhost:11434/v1", "not-needed")
+
+    def test_serve_stops_on_interrupt(self):
+        with patch("code_reviewer.serve.warm_up") as mock_warm:
+            with patch("code_reviewer.serve.TCPReviewServer.serve_forever", side_effect=KeyboardInterrupt):
+                serve("127.0.0.1:0")
+        mock_warm.assert_called_once()
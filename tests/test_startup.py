@@ -0,0 +1,37 @@
+import subprocess
+import sys
+
+# Importing the CLI used to pull in the Anthropic SDK (~1.5s). It now takes well
+# under 100ms; the budget leaves headroom for slow CI machines.
+IMPORT_BUDGET_MS = 300
+RUNS = 3
+
+HEAVY_MODULES = ("anthropic", "openai", "asyncio", "pydantic", "httpx")
+
+
+def _import_times(module: str) -> dict[str, int]:
+    """Cumulative import time in microseconds per module, from ``python -X importtime``."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times: dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestStartup:
+    def test_cli_does_not_import_provider_sdks(self):
+        loaded = _import_times("code_reviewer.cli")
+        assert "code_reviewer.cli" in loaded
+        assert [m for m in HEAVY_MODULES if m in loaded] == []
+
+    def test_cli_import_time_within_budget(self):
+        best = min(_import_times("code_reviewer.cli")["code_reviewer.cli"] for _ in range(RUNS))
+        assert best / 1000 < IMPORT_BUDGET_MS
@@ -0,0 +1,121 @@
+import json
+import threading
+
+from code_reviewer.stats import STAGES, Stats, Usage, export_metrics, write_stats
+
+
+def _stats():
+    stats = Stats(total=2.5, comments=3)
+    stats.add("read", 0.25)
+    stats.add("generating", 1.0)
+    stats.add("generating", 0.5)
+    stats.add_request(Usage(input_tokens=100, cached_tokens=60, output_tokens=20))
+    return stats
+
+
+class TestStats:
+    def test_accumulates_stages_and_usage(self):
+        stats = _stats()
+        assert stats.seconds == {"read": 0.25, "generating": 1.5}
+        assert stats.requests == 1
+        assert stats.usage == Usage(input_tokens=100, cached_tokens=60, output_tokens=20)
+
+    def test_timer(self):
+        stats = Stats()
+        with stats.timer("parse"):
+            pass
+        assert stats.seconds["parse"] >= 0
+
+    def test_merge(self):
+        total = _stats()
+        total += _stats()
+        assert total.seconds["generating"] == 3.0
+        assert (total.requests, total.comments) == (2, 6)
+        assert total.usage.output_tokens == 40
+        assert total.total == 2.5  # wall time isn't additive
+
+    def test_thread_safe(self):
+        stats = Stats()
+
+        def work():
+            for _ in range(1000):
+                stats.add("parse", 1)
+                stats.add_request(Usage(output_tokens=1))
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert stats.seconds["parse"] == 4000
+        assert (stats.requests, stats.usage.output_tokens) == (4000, 4000)
+
+    def test_to_dict_lists_every_stage_in_order(self):
+        stats = _stats()
+        stats.add("custom", 1)
+        data = stats.to_dict()
+        assert list(data["seconds"]) == [*STAGES, "custom"]
+        assert data["seconds"]["read"] == 0.25
+        assert data["tokens"] == {"input": 100, "cached": 60, "output": 20}
+        assert (data["requests"], data["comments"], data["total_seconds"]) == (1, 3, 2.5)
+
+    def test_format(self):
+        text = _stats().format()
+        assert "read 0.25s" in text
+        assert "generating 1.50s" in text
+        assert "total 2.50s" in text
+        assert "100 input (60 cached), 20 output in 1 requests; 3 comments" in text
+
+    def test_prometheus(self):
+        text = _stats().prometheus()
+        assert '# TYPE code_reviewer_stage_seconds gauge' in text
+        assert 'code_reviewer_stage_seconds{stage="generating"} 1.500000' in text
+        assert 'code_reviewer_tokens{kind="cached"} 60' in text
+        assert "code_reviewer_duration_seconds 2.500000" in text
+        assert "code_reviewer_comments 3" in text
+        assert text.endswith("\n")
+
+    def test_served_by_provider(self):
+        stats = _stats()
+        stats.add_request(Usage(), "local")
+        stats.add_request(Usage(), "anthropic")
+        total = Stats()
+        total += stats
+        total += stats
+
+        assert total.served == {"local": 2, "anthropic": 2}
+        assert total.to_dict()["served_by"] == {"anthropic": 2, "local": 2}
+        assert total.format().endswith("\nServed by: anthropic 2, local 2")
+        assert 'code_reviewer_served_requests{provider="local"} 2' in total.prometheus()
+        assert "served_requests" not in _stats().prometheus()
+
+    def test_unanswered_files_are_merged_once(self):
+        stats = Stats()
+        stats.add_unanswered(["a.py", "b.py"])
+        total = Stats(unanswered=["b.py"])
+        total += stats
+        assert total.unanswered == ["b.py", "a.py"]
+
+
+class TestSinks:
+    def test_write_stats_json(self, tmp_path):
+        path = tmp_path / "stats.json"
+        write_stats(_stats(), path)
+        assert json.loads(path.read_text())["tokens"]["output"] == 20
+
+    def test_prometheus_textfile_is_replaced(self, tmp_path):
+        path = tmp_path / "metrics" / "review.prom"
+        export_metrics(_stats(), path)
+        export_metrics(Stats(), path)
+        text = path.read_text()
+        assert "code_reviewer_requests 0" in text
+        assert list(path.parent.iterdir()) == [path]
+
+    def test_jsonl_sink_appends(self, tmp_path):
+        path = tmp_path / "metrics.jsonl"
+        export_metrics(_stats(), path)
+        export_metrics(_stats(), path)
+        records = [json.loads(line) for line in path.read_text().splitlines()]
+        assert len(records) == 2
+        assert records[0]["requests"] == 1
+        assert "timestamp" in records[0]
@@ -0,0 +1,80 @@
+from code_reviewer.diff import parse_diff
+from code_reviewer.triage import build_triage_batches, number_hunks, parse_triage_reply, select_hunks
+
+DIFF = """\
+diff --git a/app.py b/app.py
+--- a/app.py
++++ b/app.py
+@@ -1,2 +1,2 @@
+-x = 1
++x = 2
+ y = 3
+@@ -10,1 +10,1 @@
+-# old
++# new
+diff --git a/setup.cfg b/setup.cfg
+--- a/setup.cfg
++++ b/setup.cfg
+@@ -1 +1 @@
+-version = 1.0
++version = 1.1
+diff --git a/old.py b/new.py
+similarity index 100%
+rename from old.py
+rename to new.py"""
+
+
+def _files():
+    return list(parse_diff(DIFF.splitlines()))
+
+
+class TestNumberHunks:
+    def test_numbers_across_files(self):
+        assert [(n, f.path) for n, f, _ in number_hunks(_files())] == [(1, "app.py"), (2, "app.py"), (3, "setup.cfg")]
+
+
+class TestBuildTriageBatches:
+    def test_single_batch_with_context(self):
+        batches, oversized = build_triage_batches(_files(), "bump version", 10_000)
+        assert oversized == set()
+        assert len(batches) == 1
+        assert batches[0].numbers == [1, 2, 3]
+        assert batches[0].prompt.startswith("Context: bump version\n\n")
+        assert "Hunk 3 in setup.cfg:\n```diff\n@@ -1 +1 @@" in batches[0].prompt
+
+    def test_splits_on_budget_and_skips_oversized(self):
+        files = _files()
+        files[0].hunks[0].lines += ["+" + "z" * 400]
+        batches, oversized = build_triage_batches(files, None, 25)
+        assert oversized == {1}
+        assert [b.numbers for b in batches] == [[2], [3]]
+
+
+class TestParseTriageReply:
+    def test_numbers(self):
+        assert parse_triage_reply("Needs review: [1, 3]") == {1, 3}
+        assert parse_triage_reply('["2"]') == {2}
+        assert parse_triage_reply("[]") == set()
+
+    def test_unreadable(self):
+        assert parse_triage_reply("all of them") is None
+        assert parse_triage_reply("[1, 2") is None
+        assert parse_triage_reply("[1, two]") is None
+        assert parse_triage_reply('["app.py"]') is None
+
+
+class TestSelectHunks:
+    def test_keeps_escalated_hunks_and_hunkless_files(self):
+        diff, report = select_hunks(_files(), {1})
+        assert "+x = 2" in diff
+        assert "# new" not in diff
+        assert "setup.cfg" not in diff
+        assert "rename to new.py" in diff
+        assert (report.hunks, report.escalated) == (3, 1)
+        assert 0 < report.escalated_tokens < report.tokens
+        assert report.skipped_files == ["setup.cfg"]
+
+    def test_nothing_escalated(self):
+        diff, report = select_hunks(_files(), set())
+        assert diff == "diff --git a/old.py b/new.py\nsimilarity index 100%\nrename from old.py\nrename to new.py"
+        assert report.skipped_files == ["app.py", "setup.cfg"]